@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class CabinetConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cabinet'
+
+    def ready(self):
+        # конверты SOAP-операций собираем при старте, а не на первом запросе
+        from . import logs, soap_ops
+        soap_ops.registry()
+        # обработчики cabinet.auth из LOGGING — в фоновый поток (LOG_PIPELINE)
+        logs.install()
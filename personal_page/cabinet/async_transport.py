@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import time
+import weakref
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import breaker, metrics, transport
+
+try:
+    import httpx
+except ImportError:  # async-клиент опционален: без httpx ходим через sync-пул в потоке
+    httpx = None
+
+logger = logging.getLogger('cabinet.auth')
+
+
+# Async-вариант transport.py для ASGI. Пул httpx живёт столько же, сколько event loop,
+# поэтому включается только из ASGI-точки входа (personal_cabinet/asgi.py вызывает enable()).
+# Под WSGI async-вьюхи Django крутит в одноразовых loop'ах — там post() отдаёт вызов
+# в общий requests-пул через поток, и keep-alive соединения не теряются.
+_enabled = False
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def enable() -> None:
+    global _enabled
+    if httpx is None:
+        logger.warning("httpx is not installed; async services fall back to the sync pool")
+        return
+    _enabled = True
+
+
+def _build_client() -> "httpx.AsyncClient":
+    cfg = settings.EXTERNAL_AUTH
+    connect, read = transport.timeouts()
+    limits = httpx.Limits(
+        max_connections=int(cfg.get('ASYNC_MAX_CONNECTIONS', 100)),
+        max_keepalive_connections=int(cfg.get('POOL_SIZE', 10)),
+    )
+    verify = cfg.get('VERIFY_SSL', True)
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(read, connect=connect),
+        # retries у транспорта httpx — только ошибки соединения, как и в sync-пуле
+        transport=httpx.AsyncHTTPTransport(retries=int(cfg.get('RETRIES', 2)), limits=limits, verify=verify),
+    )
+
+
+def _client() -> "httpx.AsyncClient":
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = _build_client()
+    return client
+
+
+async def post(url: str, payload: str | bytes, headers: dict, operation: str = '-'):
+    if not _enabled:
+        return await sync_to_async(transport.post, thread_sensitive=False)(url, payload, headers, operation=operation)
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    b = breaker.acquire(operation, url)
+    started = time.monotonic()
+    ok = False
+    status = 'error'
+    try:
+        r = await _client().post(url, content=payload, headers=headers)
+        ok = not breaker.is_failure_status(r.status_code)
+        status = r.status_code
+        metrics.BACKEND_BYTES.observe(len(r.content), operation)
+        return r
+    except httpx.HTTPError as e:
+        # те же исключения, что и у sync-пути: сервисы ловят requests.RequestException
+        raise requests.RequestException(f"{type(e).__name__}: {e}") from e
+    finally:
+        seconds = time.monotonic() - started
+        breaker.record(b, ok, seconds)
+        metrics.BACKEND_SECONDS.observe(seconds, operation, status)
+
+
+async def soap11_call(action: str, payload: str | bytes, parse, headers: dict | None = None) -> dict:
+    """Async-двойник transport.soap11_call."""
+    try:
+        r = await post(settings.EXTERNAL_AUTH['URL'], payload, headers or transport.soap11_headers(action),
+                       operation=action)
+    except breaker.BackendUnavailable:
+        logger.warning("%s skipped: backend_unavailable", action)
+        result = {"ok": False, "error": "backend_unavailable"}
+    except requests.RequestException as e:
+        logger.exception("HTTP error during %s", action)
+        result = {"ok": False, "error": f"http_error: {e}"}
+    else:
+        if len(r.content) > int(settings.EXTERNAL_AUTH.get('ASYNC_INLINE_PARSE_BYTES', 64 * 1024)):
+            # разбор большого ответа (список врачей — мегабайты, 100+ мс expat) не держит event loop
+            result = await sync_to_async(transport.timed_parse, thread_sensitive=False)(action, parse, r)
+        else:
+            result = transport.timed_parse(action, parse, r)
+    metrics.count_result(action, result)
+    return result
+
+
+def pool_stats() -> dict:
+    out = {"enabled": _enabled, "clients": len(_clients), "connections": 0, "idle": 0}
+    for client in list(_clients.values()):
+        pool = getattr(getattr(client, '_transport', None), '_pool', None)
+        for conn in list(getattr(pool, 'connections', ())):
+            out["connections"] += 1
+            out["idle"] += conn.is_idle()
+    return out
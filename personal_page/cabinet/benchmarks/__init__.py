@@ -0,0 +1,42 @@
+import gc
+import statistics
+import time
+import tracemalloc
+
+
+# Микробенчмарки горячих мест кабинета. Запуск: python manage.py benchmark [имя ...]
+# Каждый модуль регистрирует run(repeat) -> list[dict] со строками для таблицы.
+
+def measure(fn, repeat: int = 5) -> dict:
+    """Медиана времени (мс) по repeat прогонам и пик памяти (КиБ) отдельного прогона под tracemalloc."""
+    fn()  # прогрев
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"ms": round(statistics.median(times), 2), "peak_kib": round(peak / 1024)}
+
+
+def registry() -> dict:
+    from . import api_json, captchas, envelopes, footprint, log_pipeline, parser, responses, sessions, suite
+    return {
+        "parser": parser.run,
+        "envelopes": envelopes.run,
+        "responses": responses.run,
+        "footprint": footprint.run,
+        "api_json": api_json.run,
+        "captcha": captchas.run,
+        "sessions": sessions.run,
+        "logging": log_pipeline.run,
+        "suite": suite.run,
+    }
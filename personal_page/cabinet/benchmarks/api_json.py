@@ -0,0 +1,55 @@
+import gzip
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from cabinet import json_response, middleware, records, soap_parser
+from cabinet.doctor_photos import public_doctors
+
+from . import measure, samples
+
+
+# Тело ответов api_*: время сериализации (JsonResponse со stdlib-энкодером, как было,
+# против json_response.dumps на stdlib и на orjson) и размер на проводе без сжатия / gzip / br.
+
+def _rows(body, op: str, row_tag: str) -> list:
+    return soap_parser.parse_rows(body, f"{op}Result", row_tag, records.factory(row_tag))
+
+
+def _payloads() -> list:
+    return [
+        ("api_doctors_by_speciality x200",
+         {"ok": True, "doctors": public_doctors(_rows(samples.doctors(200), "GetDoctorsBySpecialtiy", "DOCTORS"), "1")}),
+        ("api_policies x2000",
+         {"ok": True, "policies": _rows(samples.policies(2000), "GetCustomerPolicies", "POLICIES")}),
+        ("api_non_medical_complaints x2000",
+         {"ok": True, "complaints": _rows(samples.non_medical(2000), "GetNonMedicalClaimInformations", "CLM_NOTICES")}),
+    ]
+
+
+def _legacy(data) -> bytes:
+    # JsonResponse: json.dumps(cls=DjangoJSONEncoder) по обычным dict
+    return json.dumps(data, cls=DjangoJSONEncoder).encode('utf-8')
+
+
+def _as_dicts(data: dict) -> dict:
+    return {k: [dict(r) for r in v] if isinstance(v, list) else v for k, v in data.items()}
+
+
+def run(repeat: int = 5) -> list:
+    variants = [("JsonResponse", _legacy, True), ("stdlib", json_response._stdlib_dumps, False)]
+    if json_response.orjson is not None:
+        variants.append(("orjson", json_response._orjson_dumps, False))
+
+    out = []
+    for name, data in _payloads():
+        legacy_data = _as_dicts(data)
+        for impl, dumps, plain in variants:
+            payload = legacy_data if plain else data
+            body = dumps(payload)
+            assert json.loads(body) == json.loads(_legacy(legacy_data)), impl
+            row = {"endpoint": name, "impl": impl, "serialize_ms": measure(lambda: dumps(payload), repeat)["ms"],
+                   "bytes": len(body), "gzip": len(gzip.compress(body, mtime=0))}
+            row["br"] = len(middleware.compress(body, 'br')) if middleware.brotli is not None else "-"
+            out.append(row)
+    return out
@@ -0,0 +1,30 @@
+from cabinet import captcha
+
+from . import measure
+
+
+# Картинок капчи в секунду на одно ядро: исходный PIL-рендер (точка за точкой)
+# против numpy-рендера, в том числе на вдвое большем и искажённом изображении.
+
+BATCH = 50
+
+
+def run(repeat: int = 5) -> list:
+    variants = [("pil", f"{captcha.W}x{captcha.H}", captcha.render)]
+    if captcha.np is not None:
+        variants += [
+            ("numpy", f"{captcha.W}x{captcha.H}", captcha.render_numpy),
+            ("numpy", f"{captcha.W * 2}x{captcha.H * 2} warp=4",
+             lambda code: captcha.render_numpy(code, captcha.W * 2, captcha.H * 2, warp=4)),
+        ]
+    out = []
+    for impl, size, render in variants:
+        codes = [captcha.new_code() for _ in range(BATCH)]
+        m = measure(lambda: [render(code) for code in codes], repeat)
+        out.append({
+            "renderer": impl,
+            "size": size,
+            "ms_per_image": round(m["ms"] / BATCH, 3),
+            "images_per_s": round(BATCH * 1000 / m["ms"]),
+        })
+    return out
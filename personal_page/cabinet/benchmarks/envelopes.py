@@ -0,0 +1,64 @@
+import re
+import timeit
+from html import unescape as html_unescape
+from xml.sax.saxutils import escape as xml_escape
+
+from django.conf import settings
+
+from cabinet import soap_ops
+
+from . import samples
+
+
+# Накладные расходы на вызов без сети: сборка тела запроса и поиск <OpResult> в ответе.
+# legacy — как было до реестра: settings + xml_escape логина/пароля + format шаблона
+# + f-string regex на каждый вызов.
+
+_LEGACY_TEMPLATE = '''<?xml version="1.0" encoding="utf-8"?>
+<soap:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+               xmlns:xsd="http://www.w3.org/2001/XMLSchema"
+               xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
+  <soap:Body>
+    <GetCustomerPolicies xmlns="http://tempuri.org/">
+      <userName>{user}</userName>
+      <password>{password}</password>
+      <pinCode>{pin}</pinCode>
+    </GetCustomerPolicies>
+  </soap:Body>
+</soap:Envelope>
+'''
+
+
+def _legacy_payload(pin: str) -> bytes:
+    cfg = settings.EXTERNAL_AUTH
+    return _LEGACY_TEMPLATE.format(
+        user=xml_escape(cfg['USERNAME']),
+        password=xml_escape(cfg['PASSWORD']),
+        pin=xml_escape(pin.strip()),
+    ).encode('utf-8')
+
+
+def _legacy_inner(text: str, tag: str = "GetPolicyInformationsResult") -> str | None:
+    m = re.search(fr'<{tag}[^>]*>(.*?)</{tag}>', text, flags=re.S | re.I)
+    return html_unescape(m.group(1).strip()) if m else None
+
+
+def _per_call_us(fn, number: int) -> float:
+    return round(min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6, 2)
+
+
+def run(repeat: int = 5) -> list:
+    op = soap_ops.get("GetCustomerPolicies")
+    info = soap_ops.get("GetPolicyInformations")
+    response = samples.envelope(
+        "GetPolicyInformations",
+        '<DocumentElement><POLICY_INFORMATION><POLICY_NUMBER>P-1</POLICY_NUMBER></POLICY_INFORMATION></DocumentElement>',
+    )
+    text = response.decode('utf-8')   # прежний путь работал с r.text, реестр — с r.content
+    number = 2000 * repeat
+    return [
+        {"step": "payload", "impl": "legacy", "us_per_call": _per_call_us(lambda: _legacy_payload("ABC1234"), number)},
+        {"step": "payload", "impl": "registry", "us_per_call": _per_call_us(lambda: op.payload("ABC1234"), number)},
+        {"step": "result tag", "impl": "legacy", "us_per_call": _per_call_us(lambda: _legacy_inner(text), number)},
+        {"step": "result tag", "impl": "registry", "us_per_call": _per_call_us(lambda: info.inner(response), number)},
+    ]
@@ -0,0 +1,65 @@
+import json
+import timeit
+import tracemalloc
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from cabinet import records, soap_parser
+
+from . import samples
+
+
+# Сколько памяти держит разобранный список (то, что лежит в reference_cache / user_cache)
+# и сколько стоит его JSON во вьюхе: dict на строку + JsonResponse против records.* + records.dumps.
+
+CASES = (
+    ("policies x2000", lambda: samples.policies(2000), "GetCustomerPoliciesResult", "POLICIES"),
+    ("non-medical x2000", lambda: samples.non_medical(2000), "GetNonMedicalClaimInformationsResult", "CLM_NOTICES"),
+    ("doctors x200 (photo)", lambda: samples.doctors(200), "GetDoctorsBySpecialtiyResult", "DOCTORS"),
+)
+
+
+def _retained_kib(build) -> int:
+    tracemalloc.start()
+    try:
+        kept = build()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del kept
+    return round(current / 1024)
+
+
+def _dumps_ms(rows: list, dumps, number: int) -> float:
+    payload = {"ok": True, "items": rows}
+    return round(min(timeit.repeat(lambda: dumps(payload), number=number, repeat=3)) / number * 1000, 2)
+
+
+def _json_dumps(payload) -> str:
+    # так сериализует JsonResponse
+    return json.dumps(payload, cls=DjangoJSONEncoder)
+
+
+def run(repeat: int = 5) -> list:
+    out = []
+    for name, make, result_tag, row_tag in CASES:
+        body = make()
+        factory = records.factory(row_tag)
+        variants = (
+            ("dict", None, _json_dumps),
+            ("record", factory, records.dumps),
+        )
+        for impl, fac, dumps in variants:
+            rows = soap_parser.parse_rows(body, result_tag, row_tag, fac)
+            if row_tag == "DOCTORS":
+                # во вьюху фото не уходит ни в одном варианте
+                json_rows = [{k: v for k, v in d.items() if k != "FILE_CONTENT"} for d in rows] if fac is None else rows
+            else:
+                json_rows = rows
+            out.append({
+                "case": name,
+                "impl": impl,
+                "retained_kib": _retained_kib(lambda: soap_parser.parse_rows(body, result_tag, row_tag, fac)),
+                "dumps_ms": _dumps_ms(json_rows, dumps, repeat),
+            })
+    return out
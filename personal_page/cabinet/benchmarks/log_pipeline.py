@@ -0,0 +1,150 @@
+import logging
+import logging.handlers
+import os
+import queue
+import statistics
+import tempfile
+import threading
+import time
+
+from cabinet import logs
+
+
+# Сколько логирование добавляет к запросу логина в потоке запроса: те же вызовы, что
+# в services/otp_service на один вход, REQUESTS «запросов» в одном потоке и в THREADS
+# одновременных (там p99 — в основном ожидание GIL между потоками, а не само логирование).
+#   before — FileHandler + консоль в потоке запроса, f-строки, тело ответа в каждой ошибке;
+#   lazy   — те же обработчики, %-форматирование и logs.body (BODIES_PER_MINUTE);
+#   queue  — как сейчас: QueueHandler, запись на диск пачками в фоновом потоке.
+# «storm» — каждый вход сначала получает не-200 с телом (сбой бэкенда).
+
+THREADS = 8
+REQUESTS = 2000
+FORMAT = '[{asctime}] {levelname} {name}: {message}'
+
+
+class _Response:
+    status_code = 415
+    content = (b'<?xml version="1.0" encoding="utf-8"?><soap:Envelope><soap:Body><soap:Fault>'
+               + b'<faultstring>Server did not recognize the value of HTTP Header SOAPAction.' * 12
+               + b'</faultstring></soap:Fault></soap:Body></soap:Envelope>')
+
+
+def _body_head(r, limit: int) -> str:
+    # как логировали тело раньше: декодирование в потоке запроса на каждую ошибку
+    return r.content[:limit].decode('utf-8', errors='replace')
+
+
+def _eager(logger, storm: bool, r) -> None:
+    pin, policy, phone = "1AB2C3D", "P-000123", "994501234567"
+    logger.info(f"Login request: pin={pin}, policy={policy}, phone={phone}")
+    if storm:
+        logger.error("%s Non-200: %s; body: %s", "SOAP12", r.status_code, _body_head(r, 800))
+    logger.info("Login dialect: %s (%s)", "SOAP11", "cached")
+    parsed = {"ok": True, "name": "Ad", "surname": "Soyad", "error": None}
+    logger.info(f"SOAP11 parsed: {parsed}")
+    logger.info(f"OTP request to {phone}")
+    if storm:
+        logger.error("OTP %s Non-200: %s; head: %s", "SOAP12", r.status_code, _body_head(r, 600))
+    otp = {"ok": True, "code": "12345", "error": None}
+    logger.info(f"OTP SOAP11 parsed: {otp}")
+    logger.info("OTP attempts: %s", [{"dialect": "SOAP11", "status": 200, "ms": 41.0}])
+
+
+def _lazy(logger, storm: bool, r) -> None:
+    pin, policy, phone = "1AB2C3D", "P-000123", "994501234567"
+    logger.info("Login request: pin=%s, policy=%s, phone=%s", pin, policy, phone)
+    if storm:
+        logger.error("%s Non-200: %s; body: %s", "SOAP12", r.status_code, logs.body(r, 800, 'Login'))
+    logger.info("Login dialect: %s (%s)", "SOAP11", "cached")
+    parsed = {"ok": True, "name": "Ad", "surname": "Soyad", "error": None}
+    logger.info("%s parsed: %s", "SOAP11", parsed)
+    logger.info("OTP request to %s", phone)
+    if storm:
+        logger.error("OTP %s Non-200: %s; head: %s", "SOAP12", r.status_code,
+                     logs.body(r, 600, 'CreateOTPAndSendSMS'))
+    otp = {"ok": True, "code": "12345", "error": None}
+    logger.info("OTP %s parsed: %s", "SOAP11", otp)
+    logger.info("OTP attempts: %s", [{"dialect": "SOAP11", "status": 200, "ms": 41.0}])
+
+
+def _handlers(tmp: str, devnull) -> list:
+    formatter = logging.Formatter(FORMAT, style='{')
+    file_handler = logging.FileHandler(os.path.join(tmp, 'login.log'))
+    console = logging.StreamHandler(devnull)
+    for h in (file_handler, console):
+        h.setFormatter(formatter)
+    return [file_handler, console]
+
+
+def _run(mode: str, storm: bool, threads: int, tmp: str, devnull) -> dict:
+    logger = logging.getLogger(f'cabinet.benchmark.{mode}.{storm}')
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    targets = _handlers(tmp, devnull)
+    listener = None
+    if mode == 'queue':
+        q = queue.Queue(100000)
+        logger.addHandler(logs.QueueHandler(q))
+        listener = logs.QueueListener(q, *targets)
+        listener.start()
+    else:
+        for h in targets:
+            logger.addHandler(h)
+    emit = _eager if mode == 'before' else _lazy
+    logs._body_windows.clear()
+
+    latencies = []
+    lock = threading.Lock()
+
+    def worker():
+        mine = []
+        r = _Response()
+        for _ in range(REQUESTS // threads):
+            t0 = time.perf_counter()
+            emit(logger, storm, r)
+            mine.append((time.perf_counter() - t0) * 1000)
+        with lock:
+            latencies.extend(mine)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    requests_done = time.perf_counter() - started
+    if listener is not None:
+        listener.stop()   # дождаться, пока фон допишет всё
+    written = time.perf_counter() - started
+
+    for h in list(logger.handlers) + targets:
+        logger.removeHandler(h)
+        h.close()
+    latencies.sort()
+    return {
+        "mode": mode,
+        "scenario": "storm" if storm else "normal",
+        "threads": threads,
+        "mean_us": round(statistics.fmean(latencies) * 1000),
+        "p99_us": round(latencies[int(len(latencies) * 0.99)] * 1000),
+        "requests_ms": round(requests_done * 1000),
+        "flushed_ms": round(written * 1000),
+        "log_kib": round(os.path.getsize(os.path.join(tmp, 'login.log')) / 1024),
+    }
+
+
+def run(repeat: int = 5) -> list:
+    out = []
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, 'w') as devnull:
+        _run('before', False, THREADS, tmp, devnull)  # прогрев
+        os.remove(os.path.join(tmp, 'login.log'))
+        for threads in (1, THREADS):
+            for storm in (False, True):
+                for mode in ('before', 'lazy', 'queue'):
+                    rows = []
+                    for _ in range(max(1, repeat // 2)):
+                        rows.append(_run(mode, storm, threads, tmp, devnull))
+                        os.remove(os.path.join(tmp, 'login.log'))
+                    out.append(min(rows, key=lambda row: row["requests_ms"]))
+    return out
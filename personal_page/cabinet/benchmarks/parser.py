@@ -0,0 +1,39 @@
+import re
+import xml.etree.ElementTree as ET
+from html import unescape as html_unescape
+
+from cabinet import soap_parser
+
+from . import measure, samples
+
+
+# Прежний путь разбора списков: regex по r.text → html_unescape → ET.fromstring → findall.
+# Оставлен здесь только как эталон для сравнения.
+
+def legacy_rows(body: bytes | str, result_tag: str, row_tag: str) -> list:
+    text = body.decode('utf-8') if isinstance(body, bytes) else body
+    m = re.search(fr'<{result_tag}[^>]*>(.*?)</{result_tag}>', text, flags=re.S | re.I)
+    inner = html_unescape((m.group(1) or '').strip())
+    x = ET.fromstring(inner)
+    return [{child.tag: (child.text or '').strip() for child in list(n)} for n in x.findall(f'.//{row_tag}')]
+
+
+CASES = (
+    ("doctors x200 (photo)", lambda: samples.doctors(200), "GetDoctorsBySpecialtiyResult", "DOCTORS"),
+    ("non-medical x500", lambda: samples.non_medical(500), "GetNonMedicalClaimInformationsResult", "CLM_NOTICES"),
+    ("policies x40", lambda: samples.policies(40), "GetCustomerPoliciesResult", "POLICIES"),
+)
+
+
+def run(repeat: int = 5) -> list:
+    out = []
+    for name, make, result_tag, row_tag in CASES:
+        body = make()
+        legacy = legacy_rows(body, result_tag, row_tag)
+        streaming = soap_parser.parse_rows(body, result_tag, row_tag)
+        assert legacy == streaming, name
+        for impl, fn in (("legacy", legacy_rows), ("streaming", soap_parser.parse_rows)):
+            row = {"case": name, "impl": impl, "size_kib": len(body) // 1024}
+            row.update(measure(lambda: fn(body, result_tag, row_tag), repeat))
+            out.append(row)
+    return out
@@ -0,0 +1,95 @@
+import multiprocessing
+import resource
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from . import samples
+
+
+# Задержка и пик RSS на чтении списка врачей (200 шт. с фото) по HTTP, как от .asmx без charset
+# в Content-Type (application/soap+xml — requests тогда угадывает кодировку по всему телу).
+# Каждый вариант — в отдельном процессе, чтобы ru_maxrss не смешивались.
+
+RESULT_TAG, ROW_TAG = "GetDoctorsBySpecialtiyResult", "DOCTORS"
+
+VARIANTS = ("r.text", "r.content", "stream")
+
+
+def _serve(body: bytes) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/soap+xml')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _rss_mib(field: str) -> float:
+    """VmRSS/VmHWM из /proc (ru_maxrss у spawn-процесса наследует пик родителя до exec)."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _child(url: str, variant: str, repeat: int, out) -> None:
+    import requests
+
+    from cabinet import soap_parser
+    from .parser import legacy_rows
+
+    session = requests.Session()
+
+    def once() -> int:
+        if variant == "r.text":
+            r = session.post(url, data=b'')
+            return len(legacy_rows(r.text, RESULT_TAG, ROW_TAG))
+        if variant == "r.content":
+            r = session.post(url, data=b'')
+            return len(soap_parser.parse_rows(r.content, RESULT_TAG, ROW_TAG))
+        with session.post(url, data=b'', stream=True) as r:
+            return len(soap_parser.parse_rows(r.iter_content(soap_parser.CHUNK_SIZE), RESULT_TAG, ROW_TAG))
+
+    base = _rss_mib('VmRSS')
+    times = []
+    rows = 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        rows = once()
+        times.append((time.perf_counter() - t0) * 1000)
+    out.send({"rows": rows, "ms": round(statistics.median(times), 1),
+              "base_rss_mib": base, "peak_rss_mib": _rss_mib('VmHWM')})
+
+
+def run(repeat: int = 5) -> list:
+    body = samples.doctors(200)
+    server = _serve(body)
+    url = f"http://127.0.0.1:{server.server_address[1]}/svc.asmx"
+    ctx = multiprocessing.get_context('spawn')
+    out = []
+    try:
+        for variant in VARIANTS:
+            parent, child = ctx.Pipe(duplex=False)
+            proc = ctx.Process(target=_child, args=(url, variant, repeat, child))
+            proc.start()
+            result = parent.recv()
+            proc.join()
+            out.append({"variant": variant, "size_kib": len(body) // 1024, **result})
+    finally:
+        server.shutdown()
+    return out
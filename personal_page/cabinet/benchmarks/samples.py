@@ -0,0 +1,116 @@
+import base64
+import random
+from xml.sax.saxutils import escape as xml_escape
+
+
+# Синтетические ответы .asmx той же формы, что отдаёт бэкенд: внутренний XML
+# экранирован в тексте <OpResult> SOAP 1.1-конверта. Генерация детерминирована (seed).
+
+def envelope(operation: str, inner_xml: str) -> bytes:
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<soap:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+        'xmlns:xsd="http://www.w3.org/2001/XMLSchema" '
+        'xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">'
+        f'<soap:Body><{operation}Response xmlns="http://tempuri.org/">'
+        f'<{operation}Result>{xml_escape(inner_xml)}</{operation}Result>'
+        f'</{operation}Response></soap:Body></soap:Envelope>'
+    ).encode('utf-8')
+
+
+def _rows(tag: str, rows: list) -> str:
+    body = ''.join(
+        f'<{tag}>' + ''.join(f'<{k}>{xml_escape(str(v))}</{k}>' for k, v in row.items()) + f'</{tag}>'
+        for row in rows
+    )
+    return f'<DocumentElement>{body}</DocumentElement>'
+
+
+def doctors(count: int = 200, photo_bytes: int = 30_000, seed: int = 1) -> bytes:
+    """GetDoctorsBySpecialtiy: count врачей с base64-фото ~photo_bytes байт каждое."""
+    rnd = random.Random(seed)
+    rows = [{
+        'CUSTOMER_ID': 10_000 + i,
+        'NAME': f'Həkim {i}',
+        'SURNAME': 'Məmmədov',
+        'SPECIALITY_ID': '7',
+        'WORKPLACE_NAME': 'Klinika "Şəfa" & Co',
+        'FILE_CONTENT': base64.b64encode(rnd.randbytes(photo_bytes)).decode('ascii'),
+    } for i in range(count)]
+    return envelope('GetDoctorsBySpecialtiy', _rows('DOCTORS', rows))
+
+
+def policies(count: int = 40) -> bytes:
+    rows = [{
+        'POLICY_NUMBER': f'P-{i:06d}',
+        'INSURANCE_CODE': ('LI', 'AATPL', 'MED')[i % 3],
+        'STATUS': 'D',
+        'PROGRAM_NAME': 'Proqram',
+        'CARD': f'123456/{i % 100:02d}',
+        'INSURANCE_START_DATE': '2024-01-01T00:00:00',
+        'INSURANCE_END_DATE': '2025-01-01T00:00:00',
+    } for i in range(count)]
+    return envelope('GetCustomerPolicies', _rows('POLICIES', rows))
+
+
+def non_medical(count: int = 500) -> bytes:
+    rows = [{
+        'PIN_CODE': 'ABC1234',
+        'POLICY_NUMBER': f'P-{i:06d}',
+        'INSURANCE_CODE': 'AATPL',
+        'EVENT_OCCURRENCE_DATE': '2024-05-01T00:00:00',
+        'STATUS_NAME': ('Açıq', 'Bağlı')[i % 2],
+    } for i in range(count)]
+    return envelope('GetNonMedicalClaimInformations', _rows('CLM_NOTICES', rows))
+
+
+def login(ok: bool = True) -> bytes:
+    if ok:
+        inner = ('<DocumentElement><LOGIN><IS_LOGGED>1</IS_LOGGED>'
+                 '<NAME>Əli</NAME><SURNAME>Məmmədov</SURNAME></LOGIN></DocumentElement>')
+    else:
+        inner = '<DocumentElement><ERROR><MESSAGE>user_not_found</MESSAGE></ERROR></DocumentElement>'
+    return envelope('Login', inner)
+
+
+def policy_information(collaterals: int = 5) -> bytes:
+    """GetPolicyInformations: плоские поля, вложенный узел и список COLLATERAL_NAMES."""
+    fields = {
+        'POLICY_NUMBER': 'P-000001', 'INSURANCE_CODE': 'AS', 'STATUS': 'D',
+        'INSURER_CUSTOMER_NAME': 'Əli Məmmədov', 'INSURED_CUSTOMER_NAME': 'Əli Məmmədov',
+        'PROGRAM_NAME': 'Kasko Standart', 'BRAND_NAME': 'Toyota', 'MODEL_NAME': 'Prius',
+        'PLATE_NUMBER_FULL': '10-AA-123', 'INSURANCE_START_DATE': '2024-01-01T00:00:00',
+        'INSURANCE_END_DATE': '2025-01-01T00:00:00', 'PREMIUM': '450.00', 'CURRENCY': 'AZN',
+    }
+    info = ''.join(f'<{k}>{xml_escape(v)}</{k}>' for k, v in fields.items())
+    amounts = '<AMOUNTS><INSURED_SUM>25000</INSURED_SUM><FRANCHISE>200</FRANCHISE></AMOUNTS>'
+    names = ''.join(
+        f'<COLLATERAL_NAME><NAME>Təminat {i}</NAME><LIMIT>{1000 * (i + 1)}</LIMIT></COLLATERAL_NAME>'
+        for i in range(collaterals)
+    )
+    inner = (f'<DocumentElement><POLICY_INFORMATION>{info}</POLICY_INFORMATION>{amounts}'
+             f'<AGENT_NAME>Agent</AGENT_NAME><COLLATERAL_NAMES>{names}</COLLATERAL_NAMES></DocumentElement>')
+    return envelope('GetPolicyInformations', inner)
+
+
+def specialities(count: int = 30) -> bytes:
+    rows = [{'ID': i, 'NAME': f'İxtisas {i}'} for i in range(count)]
+    return envelope('GetSpecialities', _rows('SPECIALITIES', rows))
+
+
+def career(count: int = 8) -> bytes:
+    rows = [{
+        'WORKPLACE_NAME': f'Klinika {i}', 'POSITION': 'Həkim',
+        'START_DATE': f'{2010 + i}-01-01T00:00:00', 'END_DATE': f'{2011 + i}-01-01T00:00:00',
+    } for i in range(count)]
+    return envelope('GetDoctorCareer', _rows('DOCTOR_CAREER', rows))
+
+
+def medical(count: int = 100) -> bytes:
+    rows = [{
+        'PIN_CODE': 'ABC1234',
+        'CLINIC_NAME': f'Klinika {i % 7}',
+        'EVENT_OCCURRENCE_DATE': '2024-05-01T00:00:00',
+        'DIAGNOSIS': 'Diaqnoz',
+    } for i in range(count)]
+    return envelope('GetMedicalClaimInformations', _rows('CLM_NOTICE_DISPETCHER', rows))
@@ -0,0 +1,123 @@
+import os
+import random
+import statistics
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+
+# Сессии под нагрузкой нескольких воркеров (отдельные процессы, как у gunicorn):
+# SQLite-сессии Django против cabinet.session_backend на файловом кэше и на LocMem.
+# Цикл запроса как у SessionMiddleware: загрузить сессию, присвоить поля (чаще — те же
+# значения, иногда новая капча), сохранить, если modified. Рабочая БД не трогается:
+# SQLite-вариант идёт во временный файл.
+
+WORKERS = 4
+SESSIONS_PER_WORKER = 20
+CHANGE_EVERY = 5     # каждый 5-й запрос меняет данные (новая капча)
+
+ENGINES = (
+    ("sqlite (db)", "django.contrib.sessions.backends.db", "locmem"),
+    ("cabinet, file cache", "cabinet.session_backend", "file"),
+    ("cabinet, locmem", "cabinet.session_backend", "locmem"),
+)
+
+
+def _setup(engine: str, cache_kind: str, tmp: str) -> None:
+    # в spawn-процессе: до django.setup() подменяем БД и кэш сессий
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'personal_cabinet.settings')
+    from personal_cabinet import settings as conf
+    conf.DATABASES = {'default': {'ENGINE': 'django.db.backends.sqlite3',
+                                  'NAME': os.path.join(tmp, 'sessions.sqlite3'),
+                                  'OPTIONS': {'timeout': 30}}}
+    if cache_kind == 'file':
+        sessions = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                    'LOCATION': os.path.join(tmp, 'cache'), 'TIMEOUT': None}
+    else:
+        sessions = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+    conf.CACHES = dict(conf.CACHES, sessions=sessions)
+    conf.SESSION_ENGINE = engine
+    conf.LOGGING = {'version': 1, 'disable_existing_loggers': False}
+
+    import django
+    django.setup()
+
+
+def _migrate(tmp: str) -> None:
+    _setup("django.contrib.sessions.backends.db", "locmem", tmp)
+    from django.core.management import call_command
+    call_command('migrate', 'sessions', verbosity=0)
+
+
+def _worker(engine: str, cache_kind: str, tmp: str, requests_: int, seed: int) -> dict:
+    _setup(engine, cache_kind, tmp)
+    from importlib import import_module
+
+    from django.conf import settings
+
+    from cabinet import session_backend
+
+    store_cls = import_module(settings.SESSION_ENGINE).SessionStore
+    rnd = random.Random(seed)
+
+    keys = []
+    for _ in range(SESSIONS_PER_WORKER):
+        s = store_cls()
+        s.update({"login_attempts": 0, "captcha_code": "ABC12", "captcha_ok": False})
+        s.create()
+        keys.append(s.session_key)
+
+    latencies, writes = [], 0
+    stored_before = session_backend.stats()["writes"]
+    started = time.perf_counter()
+    for i in range(requests_):
+        t0 = time.perf_counter()
+        s = store_cls(rnd.choice(keys))
+        s.get("pinCode")
+        s["login_attempts"] = 0
+        s["captcha_ok"] = False
+        if i % CHANGE_EVERY == 0:
+            s["captcha_code"] = f"{rnd.randrange(10 ** 5):05d}"
+        if s.modified:  # как SessionMiddleware.process_response
+            s.save()
+            writes += 1
+        latencies.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - started
+
+    if store_cls is session_backend.SessionStore:
+        writes = session_backend.stats()["writes"] - stored_before  # реально записанные
+    return {"latencies": latencies, "writes": writes, "elapsed": elapsed}
+
+
+def _p95(values: list) -> float:
+    return statistics.quantiles(values, n=20)[-1]
+
+
+def run(repeat: int = 5) -> list:
+    requests_ = 100 * repeat
+    ctx = get_context('spawn')
+    out = []
+    with tempfile.TemporaryDirectory() as tmp:
+        with ProcessPoolExecutor(1, mp_context=ctx) as ex:
+            ex.submit(_migrate, tmp).result()
+
+        for name, engine, cache_kind in ENGINES:
+            with ProcessPoolExecutor(WORKERS, mp_context=ctx) as ex:
+                # прогрев: поднять процессы и Django до замера
+                list(ex.map(_setup, *zip(*[(engine, cache_kind, tmp)] * WORKERS)))
+                futures = [ex.submit(_worker, engine, cache_kind, tmp, requests_, seed)
+                           for seed in range(WORKERS)]
+                results = [f.result() for f in futures]
+            elapsed = max(r["elapsed"] for r in results)
+            latencies = [ms for r in results for ms in r["latencies"]]
+            out.append({
+                "engine": name,
+                "workers": WORKERS,
+                "requests": len(latencies),
+                "req_per_s": round(len(latencies) / elapsed),
+                "p50_ms": round(statistics.median(latencies), 3),
+                "p95_ms": round(_p95(latencies), 3),
+                "writes": sum(r["writes"] for r in results),
+            })
+    return out
@@ -0,0 +1,261 @@
+import asyncio
+import json
+import os
+import time
+import xml.etree.ElementTree as ET
+from contextlib import ExitStack
+from pathlib import Path
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.sessions.backends.signed_cookies import SessionStore
+from django.test import RequestFactory, override_settings
+
+from cabinet import soap_ops, views
+from cabinet.complaint_service import _parse_medical_claims
+from cabinet.policy_service import _parse_policy_informations
+from cabinet.services import _parse_login_result_xml
+
+from . import samples
+
+
+# Набор замеров с порогом регрессии: записанные ответы каждой операции реальных размеров
+# (1 полис, 200 врачей с фото, ошибка логина), разбор SOAP и вьюхи api_* целиком (сервисы
+# подменены готовыми результатами — меряем вьюху и сериализацию JSON, а не сеть).
+#
+# Эталон — baseline.json рядом: время случаев в долях калибровочной нагрузки того же прогона,
+# поэтому сравнение не зависит от скорости машины. Случай медленнее эталона больше чем
+# в THRESHOLD раз — ошибка `manage.py benchmark suite` и (с CABINET_RUN_BENCHMARKS=1)
+# теста cabinet.tests; в обычном `manage.py test` замер времени не идёт.
+# Обновить эталон после намеренного изменения:
+#   python manage.py benchmark --save-baseline
+
+BASELINE = Path(__file__).with_name('baseline.json')
+THRESHOLD = float(os.environ.get('CABINET_BENCHMARK_THRESHOLD', 1.5))
+MIN_SAMPLE_SECONDS = 0.02
+
+
+class Recorded:
+    """Ответ бэкенда из записанного тела: то, что parse_* читает у requests.Response."""
+
+    def __init__(self, content: bytes, status_code: int = 200):
+        self.content = content
+        self.status_code = status_code
+        self.headers = {"Content-Type": "text/xml; charset=utf-8"}
+
+
+def _rows(body: bytes, op: str) -> list:
+    return soap_ops.get(op).rows(Recorded(body))
+
+
+# --- разбор ответов ---
+
+def _inner(op: str, body: bytes, expect: str):
+    operation = soap_ops.get(op)
+    assert expect in (operation.inner(body) or ''), op
+    return lambda: operation.inner(body)
+
+
+def _login_result(body: bytes, ok: bool):
+    inner = soap_ops.get('Login').inner(body)
+    assert _parse_login_result_xml(inner)["ok"] is ok
+    return lambda: _parse_login_result_xml(inner)
+
+
+def _policy_informations():
+    r = Recorded(samples.policy_information())
+    data = _parse_policy_informations(r)["data"]
+    assert data["BRAND_NAME"] == "Toyota" and len(data["COLLATERAL_NAMES"]) == 5, data
+    return lambda: _parse_policy_informations(r)
+
+
+def _parse_list(op: str, body: bytes, count: int):
+    operation = soap_ops.get(op)
+    r = Recorded(body)
+    result = operation.parse_list(r)
+    assert result["ok"] and len(result[operation.list_key]) == count, op
+    return lambda: operation.parse_list(r)
+
+
+# --- вьюхи ---
+
+_factory = RequestFactory()
+
+
+def _request(method: str, path: str, data=None):
+    request = getattr(_factory, method)(path, data or {})
+    # сессия без хранилища: user_cache без ключа сессии не кэширует — каждый раз «сервис»
+    request.session = SessionStore()
+    request.session.update({"loggedin": True, "pinCode": "ABC1234"})
+    return request
+
+
+def _async_result(result: dict):
+    async def fake(*args, **kwargs):
+        return result
+    return fake
+
+
+def _fixtures() -> dict:
+    doctors = _rows(samples.doctors(200), 'GetDoctorsBySpecialtiy')
+    policies = _rows(samples.policies(40), 'GetCustomerPolicies')
+    return {
+        'aget_customer_policies': {"ok": True, "policies": policies},
+        'aget_policy_informations': _parse_policy_informations(Recorded(samples.policy_information())),
+        'aget_specialities': {"ok": True, "specialities": _rows(samples.specialities(), 'GetSpecialities')},
+        'aget_doctors_by_speciality': {"ok": True, "doctors": doctors},
+        'aget_doctor': {"ok": True, "speciality_id": "7", "doctor": doctors[0]},
+        'aget_doctor_career': {"ok": True, "career": _rows(samples.career(), 'GetDoctorCareer')},
+        'aget_medical_claim_informations': _parse_medical_claims(Recorded(samples.medical(100))),
+        'aget_non_medical_complaints': {
+            "ok": True, "complaints": _rows(samples.non_medical(100), 'GetNonMedicalClaimInformations'),
+        },
+        'aregistration_for_doctor': {"ok": True},
+    }
+
+
+VIEWS = (
+    # name, view, method, path, data, kwargs
+    ("api_policies x40", views.api_policies, 'get', '/api/policies', None, {}),
+    ("api_policy_info", views.api_policy_info, 'post', '/api/policy-info', {"policyNumber": "P-000001"}, {}),
+    ("api_policy_info_batch x10", views.api_policy_info_batch, 'post', '/api/policy-info/batch',
+     {"policyNumbers": [f"P-{i:06d}" for i in range(10)]}, {}),
+    ("api_specialities", views.api_specialities, 'get', '/api/specialities', None, {}),
+    ("api_doctors_by_speciality x200", views.api_doctors_by_speciality, 'get', '/api/doctors/7', None,
+     {"speciality_id": "7"}),
+    ("api_doctor +career", views.api_doctor, 'get', '/api/doctor/10000', {"career": "1"}, {"doctor_id": "10000"}),
+    ("api_doctor_career", views.api_doctor_career, 'get', '/api/doctor-career/10000', None, {"doctor_id": "10000"}),
+    ("api_medical_complaints x100", views.api_medical_complaints, 'get', '/api/medical-complaints', None, {}),
+    ("api_non_medical_complaints x100", views.api_non_medical_complaints, 'get', '/api/non-medical-complaints',
+     None, {}),
+    ("api_dashboard", views.api_dashboard, 'get', '/api/dashboard', None, {}),
+    ("api_active_med_policies", views.api_active_med_policies, 'get', '/api/active-med-policies', None, {}),
+    ("api_register_doctor", views.api_register_doctor, 'post', '/api/register-doctor',
+     {"cardNumber": "123456/01", "doctorId": "10000"}, {}),
+)
+
+
+def _view(view, method: str, path: str, data, kwargs: dict):
+    request = _request(method, path, data)
+
+    async def call(n: int):
+        for _ in range(n):
+            response = await view(request, **kwargs)
+        return response
+
+    response = asyncio.run(call(1))
+    assert response.status_code == 200 and json.loads(response.content).get("ok"), (path, response.content[:200])
+    return lambda n: asyncio.run(call(n))
+
+
+def _captcha_image():
+    # POOL_SIZE=0 (см. cases): полная отрисовка на запрос, пул лишь переносит её в фон
+    request = _request('get', '/captcha.png')
+    response = views.captcha_image(request)
+    assert response.status_code == 200 and response.content.startswith(b'\x89PNG')
+    return lambda: views.captcha_image(request)
+
+
+def cases(patches: ExitStack) -> dict:
+    """{имя: fn(n) — n вызовов}; при сборке каждый случай проверяет свой результат."""
+    login_ok, login_error = samples.login(True), samples.login(False)
+    patches.enter_context(override_settings(CAPTCHA={**settings.CAPTCHA, 'POOL_SIZE': 0}))
+    single = {
+        "inner Login": _inner('Login', login_ok, '<IS_LOGGED>1'),
+        "inner Login error": _inner('Login', login_error, '<ERROR>'),
+        "inner GetPolicyInformations": _inner('GetPolicyInformations', samples.policy_information(),
+                                              '<POLICY_INFORMATION>'),
+        "_parse_login_result_xml ok": _login_result(login_ok, True),
+        "_parse_login_result_xml error": _login_result(login_error, False),
+        "_parse_policy_informations": _policy_informations(),
+        "parse_list policies x1": _parse_list('GetCustomerPolicies', samples.policies(1), 1),
+        "parse_list doctors x200 (photo)": _parse_list('GetDoctorsBySpecialtiy', samples.doctors(200), 200),
+        "captcha_image": _captcha_image(),
+    }
+    out = {name: (lambda fn: lambda n: [fn() for _ in range(n)])(fn) for name, fn in single.items()}
+
+    fakes = {name: _async_result(result) for name, result in _fixtures().items()}
+    for name, fake in fakes.items():
+        patches.enter_context(mock.patch.object(views, name, fake))
+    # api_dashboard берёт сервисы из своего словаря, собранного при импорте
+    patches.enter_context(mock.patch.dict(views.DASHBOARD_SECTIONS, {
+        section: fakes[fn.__name__] for section, fn in views.DASHBOARD_SECTIONS.items()
+    }))
+    for name, view, method, path, data, kwargs in VIEWS:
+        out[name] = _view(view, method, path, data, kwargs)
+    return out
+
+
+def _time(fn) -> float:
+    """мс на вызов: n подбирается так, чтобы замер шёл не меньше MIN_SAMPLE_SECONDS."""
+    n = 1
+    while True:
+        t0 = time.perf_counter()
+        fn(n)
+        elapsed = time.perf_counter() - t0
+        if elapsed >= MIN_SAMPLE_SECONDS:
+            return elapsed / n * 1000
+        n *= 2 if elapsed * 2 >= MIN_SAMPLE_SECONDS else 10
+
+
+def _best(fn, repeat: int) -> float:
+    # минимум по повторам: меньше всего зависит от соседей по машине
+    return min(_time(fn) for _ in range(repeat))
+
+
+_CALIBRATION_XML = ('<r>' + '<i a="1">x</i>' * 2000 + '</r>').encode('ascii')
+
+
+def _calibration(n: int) -> None:
+    # смесь того, из чего состоят случаи: разбор XML, обход в Python, json
+    for _ in range(n):
+        root = ET.fromstring(_CALIBRATION_XML)
+        json.dumps([{e.tag: e.text, **e.attrib} for e in root])
+
+
+def measure(repeat: int = 5) -> dict:
+    """{"calibration_ms": ..., "cases": {имя: мс}}."""
+    with ExitStack() as patches:
+        fns = cases(patches)
+        calibration = _best(_calibration, repeat)
+        timings = {name: round(_best(fn, repeat), 4) for name, fn in fns.items()}
+    return {"calibration_ms": round(calibration, 4), "cases": timings}
+
+
+def load_baseline() -> dict | None:
+    if not BASELINE.exists():
+        return None
+    return json.loads(BASELINE.read_text(encoding='utf-8'))
+
+
+def save_baseline(result: dict) -> None:
+    BASELINE.write_text(json.dumps(result, indent=2, ensure_ascii=False) + '\n', encoding='utf-8')
+
+
+def compare(result: dict, baseline: dict | None) -> list:
+    """Строки: случай, мс, эталон в мс этой машины, отношение; ratio > THRESHOLD — регрессия."""
+    scale = result["calibration_ms"] / baseline["calibration_ms"] if baseline else None
+    rows = []
+    for name, ms in result["cases"].items():
+        base = baseline["cases"].get(name) if baseline else None
+        expected = base * scale if base is not None else None
+        ratio = round(ms / expected, 2) if expected else None
+        rows.append({
+            "case": name,
+            "ms": ms,
+            "baseline_ms": round(expected, 4) if expected is not None else "-",
+            "ratio": ratio if ratio is not None else "-",
+            "status": "-" if ratio is None else ("REGRESSION" if ratio > THRESHOLD else "ok"),
+        })
+    return rows
+
+
+def regressions(result: dict, baseline: dict | None) -> list:
+    return [row for row in compare(result, baseline) if row["status"] == "REGRESSION"]
+
+
+def run(repeat: int = 5) -> list:
+    result = measure(repeat)
+    rows = compare(result, load_baseline())
+    rows.append({"case": "(calibration)", "ms": result["calibration_ms"]})
+    return rows
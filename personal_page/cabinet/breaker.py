@@ -0,0 +1,185 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import requests
+from django.conf import settings
+
+logger = logging.getLogger('cabinet.auth')
+
+
+# Circuit breaker на каждую пару (операция, URL бэкенда). Все походы в .asmx идут через
+# transport.post / async_transport.post, там и проверяется разрешение, и пишется исход.
+#   closed    — вызовы идут; за последние WINDOW секунд считаем ошибки (сеть, таймаут, 5xx)
+#               и медленные ответы (дольше SLOW_CALL_SECONDS);
+#   open      — при MIN_CALLS+ вызовах и доле ошибок >= ERROR_RATE или медленных >= SLOW_RATE:
+#               OPEN_SECONDS секунд вызовы сразу получают backend_unavailable, не занимая воркер;
+#   half_open — потом пропускаем до HALF_OPEN_CALLS пробных вызовов: все успешны — closed,
+#               любая ошибка — снова open.
+# Перебор SOAP-диалектов (Login, OTP): неподошедший вариант этот бэкенд отвечает 500,
+# поэтому отказ на пробе непоследнего диалекта не исход вызова — release(), а не record().
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class BackendUnavailable(requests.RequestException):
+    """Breaker открыт — запрос не отправлялся."""
+
+
+def _cfg() -> dict:
+    return getattr(settings, 'CIRCUIT_BREAKER', {})
+
+
+class CircuitBreaker:
+    def __init__(self, operation: str, endpoint: str):
+        self.operation = operation
+        self.endpoint = endpoint
+        self.state = CLOSED
+        self._lock = threading.Lock()
+        self._window: deque = deque()   # (monotonic, failed, slow)
+        self._opened_at = 0.0
+        self._trials = 0                # пробных вызовов в полёте (half_open)
+        self._trial_successes = 0
+        self._counters = {"calls": 0, "failures": 0, "slow": 0, "rejected": 0, "opened": 0}
+
+    def acquire(self) -> None:
+        """Разрешение на вызов; BackendUnavailable — если breaker открыт."""
+        cfg = _cfg()
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < float(cfg.get('OPEN_SECONDS', 20)):
+                    self._counters["rejected"] += 1
+                    raise BackendUnavailable(f"circuit open for {self.operation}")
+                self._set_state(HALF_OPEN)
+                self._trials = 0
+                self._trial_successes = 0
+            if self.state == HALF_OPEN:
+                if self._trials >= int(cfg.get('HALF_OPEN_CALLS', 1)):
+                    self._counters["rejected"] += 1
+                    raise BackendUnavailable(f"circuit half-open for {self.operation}")
+                self._trials += 1
+
+    def release(self) -> None:
+        """Разрешение вернули без исхода (отказ на пробе диалекта): освобождаем пробный слот."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._trials = max(self._trials - 1, 0)
+
+    def record(self, ok: bool, seconds: float) -> None:
+        cfg = _cfg()
+        slow = seconds >= float(cfg.get('SLOW_CALL_SECONDS', 5))
+        failed = not ok
+        now = time.monotonic()
+        with self._lock:
+            self._counters["calls"] += 1
+            self._counters["failures"] += failed
+            self._counters["slow"] += slow
+
+            if self.state == HALF_OPEN:
+                self._trials = max(self._trials - 1, 0)
+                if failed or slow:
+                    self._open(now)
+                else:
+                    self._trial_successes += 1
+                    if self._trial_successes >= int(cfg.get('HALF_OPEN_CALLS', 1)):
+                        self._window.clear()
+                        self._set_state(CLOSED)
+                return
+            if self.state == OPEN:
+                return  # ответ на запрос, отправленный до открытия
+
+            window = self._window
+            window.append((now, failed, slow))
+            horizon = now - float(cfg.get('WINDOW', 30))
+            while window and window[0][0] < horizon:
+                window.popleft()
+            calls = len(window)
+            if calls < int(cfg.get('MIN_CALLS', 10)):
+                return
+            failures = sum(1 for _, f, _ in window if f)
+            slow_calls = sum(1 for _, _, s in window if s)
+            if failures / calls >= float(cfg.get('ERROR_RATE', 0.5)) or \
+                    slow_calls / calls >= float(cfg.get('SLOW_RATE', 0.8)):
+                self._open(now)
+
+    def _open(self, now: float) -> None:
+        self._opened_at = now
+        self._window.clear()
+        self._counters["opened"] += 1
+        self._set_state(OPEN)
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            logger.warning("circuit %s %s: %s -> %s", self.operation, self.endpoint, self.state, state)
+            self.state = state
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._counters)
+            out["state"] = self.state
+            out["window_calls"] = len(self._window)
+            out["window_failures"] = sum(1 for _, f, _ in self._window if f)
+            if self.state == OPEN:
+                left = float(_cfg().get('OPEN_SECONDS', 20)) - (time.monotonic() - self._opened_at)
+                out["retry_in"] = round(max(left, 0.0), 1)
+        return out
+
+
+_breakers: dict = {}
+_lock = threading.Lock()
+
+
+def get(operation: str, endpoint: str) -> CircuitBreaker:
+    key = (operation, endpoint)
+    b = _breakers.get(key)
+    if b is None:
+        with _lock:
+            b = _breakers.setdefault(key, CircuitBreaker(operation, endpoint))
+    return b
+
+
+def acquire(operation: str, endpoint: str) -> CircuitBreaker:
+    """breaker для (operation, endpoint) с уже выданным разрешением; иначе BackendUnavailable."""
+    b = get(operation, endpoint)
+    if _cfg().get('ENABLED', True):
+        b.acquire()
+    return b
+
+
+def record(b: CircuitBreaker, ok: bool, seconds: float) -> None:
+    if _cfg().get('ENABLED', True):
+        b.record(ok, seconds)
+
+
+def release(b: CircuitBreaker) -> None:
+    if _cfg().get('ENABLED', True):
+        b.release()
+
+
+def is_failure_status(status: int) -> bool:
+    # 5xx — бэкенд болен (кроме проб диалекта, см. transport.post(probe=True)); 4xx — нет
+    return status >= 500
+
+
+def stats() -> dict:
+    with _lock:
+        items = list(_breakers.values())
+    return {f"{b.operation} {b.endpoint}": b.stats() for b in items}
+
+
+def reset() -> None:
+    with _lock:
+        _breakers.clear()
+
+
+def _after_fork_in_child() -> None:
+    # состояние и блокировки родителя дочернему воркеру не нужны
+    global _breakers, _lock
+    _breakers = {}
+    _lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
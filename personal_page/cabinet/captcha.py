@@ -0,0 +1,276 @@
+import io
+import logging
+import os
+import random
+import secrets
+import string
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+
+from django.conf import settings
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+try:
+    import numpy as np
+except ImportError:  # numpy опционален: без него — только PIL-рендер
+    np = None
+
+logger = logging.getLogger('cabinet.auth')
+
+
+# Капча для логина после 3 неудачных попыток. Картинки рисуются заранее фоновым потоком
+# в пул (CAPTCHA['POOL_SIZE'], не быстрее REFILL_PER_SECOND в секунду, чтобы не отнимать
+# CPU у запросов), а вьюха только забирает готовую пару (код, PNG) и пишет код в сессию.
+# Каждая картинка выдаётся один раз. Пул пуст — рисуем синхронно, как раньше.
+# Рендер: 'pil' (исходный, точка за точкой) или 'numpy' (CAPTCHA['RENDERER']): шум, линии
+# и цифры собираются операциями над массивом, в PIL уходит один буфер на PNG.
+
+W, H = 130, 46
+
+
+def _cfg() -> dict:
+    return getattr(settings, 'CAPTCHA', {})
+
+
+@lru_cache(maxsize=None)
+def _font(name: str, size: int):
+    # один раз на процесс: truetype ищет файл по диску и обычно не находит
+    try:
+        return ImageFont.truetype(name, size)
+    except OSError:
+        logger.info("captcha font %s not found, using PIL default", name)
+        try:
+            return ImageFont.load_default(size)  # Pillow >= 10.1
+        except TypeError:
+            return ImageFont.load_default()
+
+
+def font(size: int | None = None):
+    cfg = _cfg()
+    return _font(cfg.get('FONT', 'arial.ttf'), size or int(cfg.get('FONT_SIZE', 28)))
+
+
+def new_code() -> str:
+    return ''.join(secrets.choice(string.digits) for _ in range(5))
+
+
+def render(code: str) -> bytes:
+    """PNG с кодом: шум из точек и линий, цифры со случайным сдвигом, лёгкое размытие."""
+    img = Image.new('RGB', (W, H), (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+
+    # --- шум: точки + линии ---
+    for _ in range(180):
+        x = random.randint(0, W)
+        y = random.randint(0, H)
+        draw.point((x, y), fill=(random.randint(100, 200), random.randint(100, 200), random.randint(100, 200)))
+
+    # тонкие линии фона
+    for _ in range(5):
+        x1, y1 = random.randint(0, W), random.randint(0, H)
+        x2, y2 = random.randint(0, W), random.randint(0, H)
+        color = (random.randint(100, 180), random.randint(100, 180), random.randint(100, 180))
+        draw.line(((x1, y1), (x2, y2)), fill=color, width=random.randint(1, 2))
+
+    # --- текст (слегка случайное положение каждой цифры) ---
+    f = font()
+    start_x = 15
+    for ch in code:
+        offset_y = random.randint(-4, 4)
+        draw.text((start_x, 10 + offset_y), ch, font=f, fill=(random.randint(0, 60),)*3)
+        start_x += 22
+
+    # лёгкое размытие и искажения
+    img = img.filter(ImageFilter.SMOOTH_MORE)
+    img = img.filter(ImageFilter.GaussianBlur(radius=0.4))
+    return _png(img)
+
+
+def _png(img) -> bytes:
+    # шум почти не сжимается: compress_level=1 даёт тот же размер заметно быстрее, чем 6 по умолчанию
+    buf = io.BytesIO()
+    img.save(buf, format='PNG', compress_level=1)
+    return buf.getvalue()
+
+
+@lru_cache(maxsize=256)
+def _glyph(ch: str, size: int):
+    """Маска цифры (0..1, float32) — рисуется один раз на символ и размер."""
+    f = font(size)
+    left, top, right, bottom = f.getbbox(ch)
+    img = Image.new('L', (right - left, bottom - top), 0)
+    ImageDraw.Draw(img).text((-left, -top), ch, font=f, fill=255)
+    return np.asarray(img, dtype=np.float32) / 255.0
+
+
+_rngs = threading.local()
+
+
+def _rng():
+    # Generator не потокобезопасен, а создавать его на каждую картинку дорого
+    rng = getattr(_rngs, 'rng', None)
+    if rng is None:
+        rng = _rngs.rng = np.random.default_rng()
+    return rng
+
+
+def render_numpy(code: str, width: int = W, height: int = H, warp: float = 0.0) -> bytes:
+    """
+    То же, что render, но массивами: при width x height больше исходных шум, линии
+    и шрифт масштабируются; warp — амплитуда (px) синусоидального искажения по строкам.
+    """
+    rng = _rng()
+    scale = height / H
+    out = np.full((height, width, 3), 255.0, dtype=np.float32)
+
+    # --- шум: точки (плотность как у 180 точек на 130x46) ---
+    dots = int(180 * width * height / (W * H))
+    out[rng.integers(0, height, dots), rng.integers(0, width, dots)] = rng.integers(100, 201, (dots, 3))
+
+    # тонкие линии фона: все точки всех отрезков одним присваиванием
+    lines = 5
+    p0 = rng.integers(0, (width, height), (lines, 2))
+    p1 = rng.integers(0, (width, height), (lines, 2))
+    d = np.abs(p1 - p0)
+    steps = int(d.max()) + 1
+    t = np.linspace(0.0, 1.0, steps)[None, :, None]
+    pts = np.rint(p0[:, None, :] + (p1 - p0)[:, None, :] * t).astype(np.intp)
+    colors = np.repeat(rng.integers(100, 181, (lines, 1, 3)), steps, axis=1)
+    out[pts[..., 1], pts[..., 0]] = colors
+    # width=2: второй пиксель поперёк линии
+    thick = rng.integers(1, 3, lines) == 2
+    steep = (d[thick, 1] > d[thick, 0])[:, None]
+    tx = np.minimum(pts[thick][..., 0] + steep, width - 1)
+    ty = np.minimum(pts[thick][..., 1] + ~steep, height - 1)
+    out[ty, tx] = colors[thick]
+
+    # --- текст: маски цифр с тем же случайным сдвигом по вертикали; смешиваем только полосу с текстом ---
+    size = max(int(int(_cfg().get('FONT_SIZE', 28)) * scale), 8)
+    masks = [_glyph(ch, size) for ch in code]
+    ys = [max(int((10 + dy) * scale), 0) for dy in rng.integers(-4, 5, len(code))]
+    top = min(ys)
+    bottom = min(max(y + m.shape[0] for y, m in zip(ys, masks)), height)
+    ink = np.zeros((bottom - top, width), dtype=np.float32)
+    shade = np.zeros_like(ink)
+    x = int(15 * scale)
+    for mask, y, tone in zip(masks, ys, rng.integers(0, 61, len(code))):
+        h = min(mask.shape[0], bottom - y)
+        w = min(mask.shape[1], width - x)
+        if h > 0 and w > 0:
+            m = mask[:h, :w]
+            np.maximum(ink[y - top:y - top + h, x:x + w], m, out=ink[y - top:y - top + h, x:x + w])
+            shade[y - top:y - top + h, x:x + w][m > 0] = tone
+        x += int(22 * scale)
+
+    if warp:
+        # сдвиг каждой строки по синусоиде
+        rows = np.arange(top, bottom)
+        shift = np.rint(warp * np.sin(rows * (2 * np.pi / height) * rng.uniform(0.7, 1.3) + rng.uniform(0, 2 * np.pi)))
+        cols = (np.arange(width)[None, :] - shift[:, None].astype(np.intp)) % width
+        ink = np.take_along_axis(ink, cols, axis=1)
+        shade = np.take_along_axis(shade, cols, axis=1)
+
+    a = ink[..., None]
+    band = out[top:bottom]
+    band *= 1.0 - a
+    band += shade[..., None] * a
+
+    # лёгкое размытие: [1 2 1] / 4 по обеим осям (вместо SMOOTH_MORE + GaussianBlur)
+    out[1:-1] = (out[:-2] + 2 * out[1:-1] + out[2:]) * 0.25
+    out[:, 1:-1] = (out[:, :-2] + 2 * out[:, 1:-1] + out[:, 2:]) * 0.25
+
+    return _png(Image.fromarray(out.astype(np.uint8), 'RGB'))
+
+
+def renderer() -> str:
+    name = _cfg().get('RENDERER', 'pil')
+    return 'numpy' if name == 'numpy' and np is not None else 'pil'
+
+
+def generate() -> tuple[str, bytes]:
+    code = new_code()
+    if renderer() == 'numpy':
+        cfg = _cfg()
+        return code, render_numpy(code, int(cfg.get('WIDTH', W)), int(cfg.get('HEIGHT', H)), float(cfg.get('WARP', 0)))
+    return code, render(code)
+
+
+class CaptchaPool:
+    def __init__(self):
+        self._items: deque = deque()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._counters = {"served_from_pool": 0, "rendered_inline": 0, "rendered_background": 0}
+
+    def take(self) -> tuple[str, bytes]:
+        self._ensure_started()
+        try:
+            item = self._items.popleft()
+        except IndexError:
+            item = None
+        self._wake.set()
+        if item is not None:
+            self._count("served_from_pool")
+            return item
+        self._count("rendered_inline")
+        return generate()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None or int(_cfg().get('POOL_SIZE', 64)) <= 0:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._refill, name='cabinet-captcha', daemon=True)
+                self._thread.start()
+
+    def _refill(self) -> None:
+        while True:
+            cfg = _cfg()
+            size = int(cfg.get('POOL_SIZE', 64))
+            interval = 1.0 / max(float(cfg.get('REFILL_PER_SECOND', 20)), 0.01)
+            if len(self._items) >= size:
+                self._wake.clear()
+                # проверка ещё раз после clear: take() мог забрать элемент между ними
+                if len(self._items) >= size:
+                    self._wake.wait()
+                continue
+            started = time.monotonic()
+            try:
+                self._items.append(generate())
+            except Exception:
+                logger.exception("captcha render failed")
+            else:
+                self._count("rendered_background")
+            time.sleep(max(interval - (time.monotonic() - started), 0.0))
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._counters)
+        out["size"] = len(self._items)
+        out["running"] = self._thread is not None
+        return out
+
+
+pool = CaptchaPool()
+
+
+def _after_fork_in_child() -> None:
+    # поток-наполнитель в дочерний процесс не переезжает; готовые картинки тоже не делим
+    global pool
+    pool = CaptchaPool()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def take() -> tuple[str, bytes]:
+    """(код, PNG) из пула."""
+    return pool.take()
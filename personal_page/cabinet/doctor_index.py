@@ -0,0 +1,45 @@
+import threading
+
+
+# Индекс CUSTOMER_ID → (специальность, запись врача). Обновляется при каждой загрузке
+# списка GetDoctorsBySpecialtiy (в т.ч. фоновом обновлении reference_cache), поэтому
+# свежесть та же, что у кэша списков. Записи — те же объекты, что лежат в кэше, без копий;
+# когда reference_cache вытесняет список специальности, drop() убирает и её врачей —
+# иначе записи (с фото) жили бы в индексе сверх REFERENCE_CACHE['MAX_ENTRIES'].
+
+class DoctorIndex:
+    def __init__(self):
+        self._by_id: dict = {}
+        self._ids_by_spec: dict = {}
+        self._lock = threading.Lock()
+
+    def update(self, speciality_id: str, doctors: list) -> None:
+        fresh = {}
+        for d in doctors:
+            doctor_id = str(d.get('CUSTOMER_ID') or '').strip()
+            if doctor_id:
+                fresh[doctor_id] = (speciality_id, d)
+        with self._lock:
+            # врачи, пропавшие из специальности, уходят из индекса
+            for doctor_id in self._ids_by_spec.get(speciality_id, ()):
+                entry = self._by_id.get(doctor_id)
+                if entry is not None and entry[0] == speciality_id and doctor_id not in fresh:
+                    del self._by_id[doctor_id]
+            self._by_id.update(fresh)
+            self._ids_by_spec[speciality_id] = frozenset(fresh)
+
+    def drop(self, speciality_id: str) -> None:
+        with self._lock:
+            for doctor_id in self._ids_by_spec.pop(speciality_id, ()):
+                entry = self._by_id.get(doctor_id)
+                if entry is not None and entry[0] == speciality_id:
+                    del self._by_id[doctor_id]
+
+    def get(self, doctor_id: str) -> tuple | None:
+        return self._by_id.get(str(doctor_id).strip())
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+
+doctor_index = DoctorIndex()
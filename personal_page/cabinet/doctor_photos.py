@@ -0,0 +1,35 @@
+import hashlib
+
+from django.urls import reverse
+
+
+# Фото врачей приходят base64-строкой FILE_CONTENT внутри списка GetDoctorsBySpecialtiy.
+# records.Doctor хранит их уже раскодированными (слот photo) с хэшем base64-строки
+# (слот photo_hash). В JSON списка отдаём только PHOTO_URL с этим хэшем, а сами байты —
+# отдельным эндпоинтом (api_doctor_photo) с ETag и Cache-Control: immutable.
+
+
+def photo_hash(file_content: str) -> str:
+    return hashlib.sha1(file_content.encode('ascii', 'ignore')).hexdigest()[:16]
+
+
+def public_doctor(d, speciality_id: str) -> dict:
+    out = dict(d)
+    h = d.photo_hash
+    out['PHOTO_URL'] = reverse('api_doctor_photo', kwargs={
+        'speciality_id': speciality_id,
+        'doctor_id': d.get('CUSTOMER_ID') or '',
+        'photo_hash': h,
+    }) if h and d.get('CUSTOMER_ID') else ''
+    return out
+
+
+def public_doctors(doctors: list, speciality_id: str) -> list:
+    return [public_doctor(d, speciality_id) for d in doctors]
+
+
+def find_photo(doctors: list, doctor_id: str, h: str) -> bytes | None:
+    for d in doctors:
+        if str(d.get('CUSTOMER_ID')) == doctor_id and d.photo_hash == h:
+            return d.photo
+    return None
@@ -1,250 +1,140 @@
 import re
 import xml.etree.ElementTree as ET
-from xml.sax.saxutils import escape as xml_escape
-import requests
-from django.conf import settings
 import logging
-from html import unescape as html_unescape
-
-
-logger = logging.getLogger('cabinet.auth')
-
-# --- SOAP payloads ---
-
-SOAP11_GET_SPECIALITIES = '''<?xml version="1.0" encoding="utf-8"?>
-<soap:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
-               xmlns:xsd="http://www.w3.org/2001/XMLSchema"
-               xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
-  <soap:Body>
-    <GetSpecialities xmlns="http://tempuri.org/">
-      <userName>{user}</userName>
-      <password>{password}</password>
-    </GetSpecialities>
-  </soap:Body>
-</soap:Envelope>
-'''
-
-SOAP11_GET_DOCTORS_BY_SPECIALITY = '''<?xml version="1.0" encoding="utf-8"?>
-<soap:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
-               xmlns:xsd="http://www.w3.org/2001/XMLSchema"
-               xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
-  <soap:Body>
-    <GetDoctorsBySpecialtiy xmlns="http://tempuri.org/">
-      <userName>{user}</userName>
-      <password>{password}</password>
-      <specialityId>{spec}</specialityId>
-    </GetDoctorsBySpecialtiy>
-  </soap:Body>
-</soap:Envelope>
-'''
-
-SOAP11_GET_DOCTOR_CAREER = '''<?xml version="1.0" encoding="utf-8"?>
-<soap:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
-               xmlns:xsd="http://www.w3.org/2001/XMLSchema"
-               xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
-  <soap:Body>
-    <GetDoctorCareer xmlns="http://tempuri.org/">
-      <userName>{user}</userName>
-      <password>{password}</password>
-      <doctorId>{doctor}</doctorId>
-    </GetDoctorCareer>
-  </soap:Body>
-</soap:Envelope>
-'''
-
-SOAP11_REG_FOR_DOCTOR = '''<?xml version="1.0" encoding="utf-8"?>
-<soap:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
-               xmlns:xsd="http://www.w3.org/2001/XMLSchema"
-               xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
-  <soap:Body>
-    <RegistrationForDoctor xmlns="http://tempuri.org/">
-      <userName>{user}</userName>
-      <password>{password}</password>
-      <pinCode>{pin}</pinCode>
-      <cardNumber>{card}</cardNumber>
-      <customerId>{doctor}</customerId>
-    </RegistrationForDoctor>
-  </soap:Body>
-</soap:Envelope>
-'''
-
-# --- helpers (единственные, без дубликатов) ---
-
-def _post_soap(url: str, payload: str, action: str, timeout: int, verify_ssl: bool) -> requests.Response:
-    headers = {
-        "Content-Type": "text/xml; charset=utf-8",
-        "SOAPAction": f"\"http://tempuri.org/{action}\"",
-    }
-    return requests.post(url, data=payload.encode('utf-8'), headers=headers, timeout=timeout, verify=verify_ssl)
-
-
-
-
-def _extract_inner_string(tag: str, body: str) -> str | None:
-
-    m = re.search(fr'<{tag}[^>]*>(.*?)</{tag}>', body, flags=re.S | re.I)
-    if m:
-        inner = (m.group(1) or '').strip()
-        return html_unescape(inner) or None
-
-    m2 = re.search(r'<string\b[^>]*>(.*?)</string>', body, flags=re.S | re.I)
-    if m2:
-        inner = (m2.group(1) or '').strip()
-        return html_unescape(inner) or None
-
-    try:
-        root = ET.fromstring(body)
-        t = (root.text or '').strip()
-        return html_unescape(t) or None
-    except ET.ParseError:
-        return None
 
+from . import logs, soap_ops
+from .doctor_index import doctor_index
+from .ref_cache import reference_cache
 
 
-
-def _dict_from_children(node: ET.Element) -> dict:
-    return {child.tag: (child.text or '').strip() for child in list(node)}
+logger = logging.getLogger('cabinet.auth')
 
 # --- API wrappers ---
+# Справочники одинаковы для всех пользователей, поэтому идут через reference_cache
+# (TTL по операции, stale-while-revalidate, stale-if-error). _fetch_* — прямой поход в SOAP.
 
 def get_specialities() -> dict:
-    cfg = settings.EXTERNAL_AUTH
-    payload = SOAP11_GET_SPECIALITIES.format(
-        user=xml_escape(cfg['USERNAME']),
-        password=xml_escape(cfg['PASSWORD']),
-    )
-    try:
-        r = _post_soap(cfg['URL'], payload, "GetSpecialities", cfg.get('TIMEOUT', 15), cfg.get('VERIFY_SSL', True))
-    except requests.RequestException as e:
-        logger.exception("HTTP error during GetSpecialities")
-        return {"ok": False, "error": f"http_error: {e}"}
-
-    if r.status_code != 200:
-        logger.error("GetSpecialities non-200: %s", r.status_code)
-        return {"ok": False, "error": f"http_status_{r.status_code}"}
-
-    inner = _extract_inner_string("GetSpecialitiesResult", r.text)
-    if not inner:
-        return {"ok": False, "error": "empty_or_invalid_inner"}
+    return reference_cache.get_or_load(("GetSpecialities",), _fetch_specialities)
 
-    try:
-        x = ET.fromstring(inner)
-    except ET.ParseError:
-        return {"ok": False, "error": "invalid_inner_xml"}
-
-    items = [_dict_from_children(n) for n in x.findall('.//SPECIALITIES')]
-    if not items:
-        n = x.find('.//SPECIALITIES')
-        if n is not None:
-            items = [_dict_from_children(n)]
-
-    return {"ok": True, "specialities": items}
+async def aget_specialities() -> dict:
+    return await reference_cache.aget_or_load(("GetSpecialities",), _afetch_specialities, _fetch_specialities)
 
 def get_doctors_by_speciality(speciality_id: str) -> dict:
-    cfg = settings.EXTERNAL_AUTH
-    payload = SOAP11_GET_DOCTORS_BY_SPECIALITY.format(
-        user=xml_escape(cfg['USERNAME']),
-        password=xml_escape(cfg['PASSWORD']),
-        spec=xml_escape((speciality_id or '').strip())
-    )
-    try:
-        r = _post_soap(cfg['URL'], payload, "GetDoctorsBySpecialtiy", cfg.get('TIMEOUT', 15), cfg.get('VERIFY_SSL', True))
-    except requests.RequestException as e:
-        logger.exception("HTTP error during GetDoctorsBySpecialtiy")
-        return {"ok": False, "error": f"http_error: {e}"}
+    spec = (speciality_id or '').strip()
+    return reference_cache.get_or_load(("GetDoctorsBySpecialtiy", spec), _fetch_doctors_by_speciality, spec)
 
-    if r.status_code != 200:
-        logger.error("GetDoctorsBySpecialtiy non-200: %s", r.status_code)
-        return {"ok": False, "error": f"http_status_{r.status_code}"}
-
-    inner = _extract_inner_string("GetDoctorsBySpecialtiyResult", r.text)
-    if not inner:
-        return {"ok": False, "error": "empty_or_invalid_inner"}
+async def aget_doctors_by_speciality(speciality_id: str) -> dict:
+    spec = (speciality_id or '').strip()
+    return await reference_cache.aget_or_load(
+        ("GetDoctorsBySpecialtiy", spec), _afetch_doctors_by_speciality, _fetch_doctors_by_speciality, spec
+    )
 
-    try:
-        x = ET.fromstring(inner)
-    except ET.ParseError:
-        return {"ok": False, "error": "invalid_inner_xml"}
+def get_doctor_career(doctor_id: str) -> dict:
+    doctor = (doctor_id or '').strip()
+    return reference_cache.get_or_load(("GetDoctorCareer", doctor), _fetch_doctor_career, doctor)
 
-    items = [_dict_from_children(n) for n in x.findall('.//DOCTORS')]
-    if not items:
-        n = x.find('.//DOCTORS')
-        if n is not None:
-            items = [_dict_from_children(n)]
+async def aget_doctor_career(doctor_id: str) -> dict:
+    doctor = (doctor_id or '').strip()
+    return await reference_cache.aget_or_load(
+        ("GetDoctorCareer", doctor), _afetch_doctor_career, _fetch_doctor_career, doctor
+    )
 
-    return {"ok": True, "doctors": items}
+def _on_reference_evict(key: tuple) -> None:
+    # список специальности ушёл из кэша — его врачи уходят из индекса
+    if key[0] == "GetDoctorsBySpecialtiy":
+        doctor_index.drop(key[1])
 
-def get_doctor_career(doctor_id: str) -> dict:
-    cfg = settings.EXTERNAL_AUTH
-    payload = SOAP11_GET_DOCTOR_CAREER.format(
-        user=xml_escape(cfg['USERNAME']),
-        password=xml_escape(cfg['PASSWORD']),
-        doctor=xml_escape((doctor_id or '').strip())
-    )
-    try:
-        r = _post_soap(cfg['URL'], payload, "GetDoctorCareer", cfg.get('TIMEOUT', 15), cfg.get('VERIFY_SSL', True))
-    except requests.RequestException as e:
-        logger.exception("HTTP error during GetDoctorCareer")
-        return {"ok": False, "error": f"http_error: {e}"}
+reference_cache.on_evict(_on_reference_evict)
 
+async def aget_doctor(doctor_id: str, speciality_hint: str = '') -> dict:
+    """
+    Один врач по CUSTOMER_ID из индекса. Список его специальности читаем через кэш:
+    это держит индекс свежим (SWR-обновление переиндексирует) и заполняет его при промахе.
+    speciality_hint нужен только для холодного индекса.
+    {"ok": True, "speciality_id": ..., "doctor": {...}} либо {"ok": False, "error": ...}
+    """
+    doctor_id = (doctor_id or '').strip()
+    entry = doctor_index.get(doctor_id)
+    spec = entry[0] if entry else (speciality_hint or '').strip()
+    if not spec:
+        return {"ok": False, "error": "doctor_not_found"}
+    result = await aget_doctors_by_speciality(spec)
+    if not result.get("ok"):
+        return result
+    entry = doctor_index.get(doctor_id)
+    if entry is None and any(str(d.get('CUSTOMER_ID') or '').strip() == doctor_id for d in result["doctors"]):
+        # список из кэша, а индекс его врача потерял (drop другой его специальности, перезапуск) —
+        # переиндексируем список
+        doctor_index.update(spec, result["doctors"])
+        entry = doctor_index.get(doctor_id)
+    if entry is None:
+        return {"ok": False, "error": "doctor_not_found"}
+    return {"ok": True, "speciality_id": entry[0], "doctor": entry[1]}
+
+# --- SOAP ---
+
+def _fetch_specialities() -> dict:
+    return soap_ops.call("GetSpecialities")
+
+async def _afetch_specialities() -> dict:
+    return await soap_ops.acall("GetSpecialities")
+
+def _fetch_doctors_by_speciality(speciality_id: str) -> dict:
+    # фото и их хэши разбирает records.Doctor
+    result = soap_ops.call("GetDoctorsBySpecialtiy", speciality_id)
+    if result.get("ok"):
+        doctor_index.update(speciality_id, result["doctors"])
+    return result
+
+async def _afetch_doctors_by_speciality(speciality_id: str) -> dict:
+    result = await soap_ops.acall("GetDoctorsBySpecialtiy", speciality_id)
+    if result.get("ok"):
+        doctor_index.update(speciality_id, result["doctors"])
+    return result
+
+def _fetch_doctor_career(doctor_id: str) -> dict:
+    return soap_ops.call("GetDoctorCareer", doctor_id, parse=_parse_doctor_career)
+
+async def _afetch_doctor_career(doctor_id: str) -> dict:
+    return await soap_ops.acall("GetDoctorCareer", doctor_id, parse=_parse_doctor_career)
+
+def _parse_doctor_career(r) -> dict:
     if r.status_code != 200:
-        logger.error("GetDoctorCareer non-200: %s; body head: %r", r.status_code, r.text[:300])
+        logger.error("GetDoctorCareer non-200: %s; body head: %r", r.status_code, logs.body(r, 300, 'GetDoctorCareer'))
         return {"ok": False, "error": f"http_status_{r.status_code}"}
+    return soap_ops.get("GetDoctorCareer").parse_list(r)
 
-    inner = _extract_inner_string("GetDoctorCareerResult", r.text)
-    if not inner:
-        return {"ok": False, "error": "empty_or_invalid_inner"}
-
-    try:
-        x = ET.fromstring(inner)
-    except ET.ParseError:
-        return {"ok": False, "error": "invalid_inner_xml"}
-
-    items = [_dict_from_children(n) for n in x.findall('.//DOCTOR_CAREER')]
-    if not items:
-        n = x.find('.//DOCTOR_CAREER')
-        if n is not None:
-            items = [_dict_from_children(n)]
-
-    return {"ok": True, "career": items}
-
-
+_CARD_RE = re.compile(r'(\d{6}\/\d{2})')
 
 def registration_for_doctor(pin_code: str, card_number: str, doctor_id: str) -> dict:
     """
     Возвращает {"ok": True} при успехе, иначе {"ok": False, "error": "..."}.
     Требует card_number в формате NNNNNN/NN (6 цифр, слэш, 2 цифры).
     """
-    cfg = settings.EXTERNAL_AUTH
-    url = cfg['URL']
-    timeout = cfg.get('TIMEOUT', 15)
-    verify_ssl = cfg.get('VERIFY_SSL', True)
-
-    # нормализуем номер карты (вытягиваем вид 123456/78 откуда бы он ни пришёл)
-    m = re.search(r'(\d{6}\/\d{2})', card_number or '')
-    if not m:
+    args = _registration_args(pin_code, card_number, doctor_id)
+    if args is None:
         return {"ok": False, "error": "invalid_card_number_format"}
-    card_fmt = m.group(1)
+    return soap_ops.call("RegistrationForDoctor", *args, parse=_parse_registration)
 
-    payload = SOAP11_REG_FOR_DOCTOR.format(
-        user=xml_escape(cfg['USERNAME']),
-        password=xml_escape(cfg['PASSWORD']),
-        pin=xml_escape((pin_code or '').strip()),
-        card=xml_escape(card_fmt),
-        doctor=xml_escape((doctor_id or '').strip()),
-    )
+async def aregistration_for_doctor(pin_code: str, card_number: str, doctor_id: str) -> dict:
+    args = _registration_args(pin_code, card_number, doctor_id)
+    if args is None:
+        return {"ok": False, "error": "invalid_card_number_format"}
+    return await soap_ops.acall("RegistrationForDoctor", *args, parse=_parse_registration)
 
-    try:
-        r = _post_soap(url, payload, "RegistrationForDoctor", timeout, verify_ssl)
-    except requests.RequestException as e:
-        logger.exception("HTTP error during RegistrationForDoctor")
-        return {"ok": False, "error": f"http_error: {e}"}
+def _registration_args(pin_code: str, card_number: str, doctor_id: str) -> tuple | None:
+    # нормализуем номер карты (вытягиваем вид 123456/78 откуда бы он ни пришёл)
+    m = _CARD_RE.search(card_number or '')
+    if not m:
+        return None
+    return (pin_code or '').strip(), m.group(1), (doctor_id or '').strip()
 
+def _parse_registration(r) -> dict:
     if r.status_code != 200:
         logger.error("RegistrationForDoctor non-200: %s", r.status_code)
         return {"ok": False, "error": f"http_status_{r.status_code}"}
 
-    inner = _extract_inner_string("RegistrationForDoctorResult", r.text)
+    inner = soap_ops.get("RegistrationForDoctor").inner(r.content)
     if not inner:
         return {"ok": False, "error": "empty_or_invalid_inner"}
 
@@ -258,7 +148,3 @@ def registration_for_doctor(pin_code: str, card_number: str, doctor_id: str) ->
     if succ == 'true':
         return {"ok": True}
     return {"ok": False, "error": "registration_failed"}
-
-
-
-
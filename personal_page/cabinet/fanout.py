@@ -0,0 +1,59 @@
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+logger = logging.getLogger('cabinet.auth')
+
+
+# Общий пул потоков для фоновых походов в SOAP (user_cache.prefetch). Пул один на процесс:
+# FANOUT['MAX_WORKERS'] ограничивает суммарную нагрузку на бэкенд. Параллельные вызовы
+# внутри одного async-запроса (batch, dashboard) — afan_out, limit — сколько одновременно.
+_executor: ThreadPoolExecutor | None = None
+_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    ex = _executor
+    if ex is None:
+        with _lock:
+            if _executor is None:
+                workers = int(getattr(settings, 'FANOUT', {}).get('MAX_WORKERS', 16))
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='cabinet-fanout')
+            ex = _executor
+    return ex
+
+
+def _after_fork_in_child() -> None:
+    # потоки родителя в дочерний процесс не переезжают
+    global _executor, _lock
+    _executor = None
+    _lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+async def afan_out(afn, items, limit: int) -> dict:
+    """
+    Вызывает await afn(item) для каждого item, не более limit одновременно.
+    Возвращает {item: результат} в порядке items; исключение превращается в {"ok": False, "error": ...}.
+    """
+    items = list(items)
+    sem = asyncio.Semaphore(max(1, limit))
+
+    async def _one(item):
+        async with sem:
+            try:
+                return await afn(item)
+            except Exception as e:
+                logger.exception("afan_out: %s(%r) failed", getattr(afn, '__name__', afn), item)
+                return {"ok": False, "error": f"internal_error: {e}"}
+
+    results = await asyncio.gather(*(_one(item) for item in items))
+    return dict(zip(items, results))
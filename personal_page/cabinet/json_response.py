@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+from . import records
+
+try:
+    import orjson
+except ImportError:  # orjson опционален: без него — stdlib через records.dumps
+    orjson = None
+
+
+# Общий JSON-ответ для api_*: сериализатор выбирается в API_RESPONSES['SERIALIZER']
+# ('auto' — orjson, если установлен, иначе stdlib). Время сериализации уходит
+# в Server-Timing и в статистику по эндпоинтам (internal/backend-status);
+# сжатие — в cabinet.middleware.CompressionMiddleware.
+
+def _cfg() -> dict:
+    return getattr(settings, 'API_RESPONSES', {})
+
+
+def _orjson_default(o):
+    # вызывается на каждую запись: без isinstance по ABC Mapping
+    as_dict = getattr(o, 'as_dict', None)
+    if as_dict is not None:
+        return as_dict()
+    return DjangoJSONEncoder().default(o)
+
+
+def _orjson_dumps(data) -> bytes:
+    return orjson.dumps(data, default=_orjson_default)
+
+
+def _stdlib_dumps(data) -> bytes:
+    return records.dumps(data).encode('ascii')
+
+
+def serializer_name() -> str:
+    name = _cfg().get('SERIALIZER', 'auto')
+    if name == 'auto':
+        return 'orjson' if orjson is not None else 'stdlib'
+    if name == 'orjson' and orjson is None:
+        return 'stdlib'
+    return name
+
+
+def dumps(data) -> bytes:
+    return _orjson_dumps(data) if serializer_name() == 'orjson' else _stdlib_dumps(data)
+
+
+class ApiJsonResponse(HttpResponse):
+    """Замена JsonResponse: быстрый сериализатор + замер его времени."""
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        started = time.perf_counter()
+        content = dumps(data)
+        self.serialize_ms = (time.perf_counter() - started) * 1000
+        super().__init__(content=content, **kwargs)
+        self.headers['Server-Timing'] = f'serialize;dur={self.serialize_ms:.2f}'
+
+
+# --- статистика по эндпоинтам: байты до/после сжатия, время сериализации ---
+_lock = threading.Lock()
+_stats: dict = defaultdict(lambda: {"responses": 0, "compressed": 0, "raw_bytes": 0, "sent_bytes": 0, "serialize_ms": 0.0})
+
+
+def count_response(endpoint: str, raw_bytes: int, sent_bytes: int, encoding: str | None, serialize_ms: float | None) -> None:
+    with _lock:
+        s = _stats[endpoint]
+        s["responses"] += 1
+        s["compressed"] += encoding is not None
+        s["raw_bytes"] += raw_bytes
+        s["sent_bytes"] += sent_bytes
+        if serialize_ms is not None:
+            s["serialize_ms"] += serialize_ms
+
+
+def stats() -> dict:
+    with _lock:
+        snapshot = {name: dict(s) for name, s in _stats.items()}
+    for s in snapshot.values():
+        s["serialize_ms"] = round(s["serialize_ms"], 2)
+        s["ratio"] = round(s["sent_bytes"] / s["raw_bytes"], 3) if s["raw_bytes"] else 1.0
+    return {"serializer": serializer_name(), "endpoints": snapshot}
+
+
+def reset_stats() -> None:
+    with _lock:
+        _stats.clear()
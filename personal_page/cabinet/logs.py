@@ -0,0 +1,199 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+
+
+# Логи cabinet.auth пишутся не в потоке запроса: logger получает один QueueHandler,
+# а FileHandler/StreamHandler из LOGGING уносятся в QueueListener с фоновым потоком.
+# Запрос только кладёт запись в очередь; строка сообщения собирается (%-форматирование)
+# и пишется на диск уже в фоне. Очередь ограничена: при переполнении запись отбрасывается
+# (счётчик dropped), а не блокирует запрос.
+#
+# Слушатель забирает из очереди накопившееся пачками до LISTENER_BATCH записей и пишет в файл
+# и консоль одним write и одним flush на пачку, а между пачками отдаёт GIL (sleep(0)).
+# Форматирование в фоне всё равно занимает GIL: если слушатель разбирает длинную очередь
+# без перерыва, поток запроса ждёт его до switch interval (5 мс) — это и есть хвост p99.
+#
+# Тела ответов бэкенда (600–800 байт) в лог — через body(): не больше BODIES_PER_MINUTE
+# на операцию, дальше только счётчик, иначе во время сбоя бэкенда лог растёт на каждый запрос.
+
+_lock = threading.Lock()
+_listeners: list = []      # (handler, listener)
+_counters = {"dropped": 0, "bodies_logged": 0, "bodies_suppressed": 0}
+_body_windows: dict = {}   # key -> [начало минуты, записано тел]
+
+
+def _cfg() -> dict:
+    return getattr(settings, 'LOG_PIPELINE', {})
+
+
+def _count(name: str, n: int = 1) -> None:
+    with _lock:
+        _counters[name] += n
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """Не блокирует при полной очереди и не форматирует сообщение в потоке запроса."""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _count("dropped")
+
+    def prepare(self, record):
+        # сообщение форматирует слушатель; dict/list в args (результат сервиса и т.п.)
+        # копируем сейчас — к моменту записи вызывающий код может их дополнить
+        args = record.args
+        if isinstance(args, dict):
+            # единственный dict-аргумент LogRecord хранит сам по себе, без кортежа
+            record.args = args.copy()
+        elif isinstance(args, tuple) and any(isinstance(a, _MUTABLE) for a in args):
+            record.args = tuple(a.copy() if isinstance(a, _MUTABLE) else a for a in args)
+        return record
+
+
+_MUTABLE = (dict, list, set)
+
+
+class QueueListener(logging.handlers.QueueListener):
+    """Обрабатывает очередь пачками; StreamHandler/FileHandler пишут пачку за один write+flush."""
+
+    def __init__(self, queue_, *handlers, batch: int = 32):
+        super().__init__(queue_, *handlers, respect_handler_level=True)
+        self.batch = max(1, batch)
+
+    def _monitor(self):
+        q = self.queue
+        while True:
+            items = [q.get()]
+            while len(items) < self.batch:
+                try:
+                    items.append(q.get_nowait())
+                except queue.Empty:
+                    break
+            records = [r for r in items if r is not self._sentinel]
+            if records:
+                self._handle_batch(records)
+            for _ in items:
+                q.task_done()
+            if len(records) != len(items):
+                break
+            time.sleep(0)   # пачка записана — GIL потокам запросов
+
+    def _handle_batch(self, records: list) -> None:
+        for handler in self.handlers:
+            accepted = [r for r in records if r.levelno >= handler.level and handler.filter(r)]
+            if not accepted:
+                continue
+            if type(handler) not in _BATCHED:
+                # ротация и прочие обработчики — как у стандартного слушателя, по записи
+                for record in accepted:
+                    handler.handle(record)
+                continue
+            handler.acquire()
+            try:
+                if handler.stream is None:     # FileHandler(delay=True) или после close()
+                    handler.stream = handler._open()
+                handler.stream.write(''.join(handler.format(r) + handler.terminator for r in accepted))
+                handler.flush()
+            except Exception:
+                handler.handleError(accepted[0])
+            finally:
+                handler.release()
+
+    def enqueue_sentinel(self):
+        # очередь может быть полна (QUEUE_SIZE) — ждём место, слушатель её разбирает
+        self.queue.put(self._sentinel)
+
+
+_BATCHED = (logging.StreamHandler, logging.FileHandler)
+
+
+def install() -> None:
+    """Переносит обработчики LOG_PIPELINE['LOGGERS'] в фоновый QueueListener (из AppConfig.ready)."""
+    cfg = _cfg()
+    if not cfg.get('QUEUE', True):
+        return
+    for name in cfg.get('LOGGERS', ('cabinet.auth',)):
+        logger = logging.getLogger(name)
+        targets = [h for h in logger.handlers if not isinstance(h, QueueHandler)]
+        if not targets:
+            continue
+        q = queue.Queue(int(cfg.get('QUEUE_SIZE', 10000)))
+        handler = QueueHandler(q)
+        listener = QueueListener(q, *targets, batch=int(cfg.get('LISTENER_BATCH', 32)))
+        for h in targets:
+            logger.removeHandler(h)
+        logger.addHandler(handler)
+        listener.start()
+        _listeners.append((handler, listener))
+
+
+def flush() -> None:
+    """Дописывает очередь и останавливает фоновые потоки (при выходе процесса)."""
+    while _listeners:
+        _, listener = _listeners.pop()
+        listener.stop()
+
+
+atexit.register(flush)
+
+
+class _Body:
+    """Начало тела для %s в логе: байты берём сразу, декодируем только при форматировании (в фоне)."""
+    __slots__ = ('head',)
+
+    def __init__(self, head: bytes):
+        self.head = head
+
+    def __str__(self) -> str:
+        return self.head.decode('utf-8', errors='replace')
+
+    def __repr__(self) -> str:
+        return repr(str(self))
+
+
+def body(r, limit: int, key: str):
+    """Начало тела r для лога или пометка, если для key исчерпан BODIES_PER_MINUTE."""
+    per_minute = int(_cfg().get('BODIES_PER_MINUTE', 10))
+    minute = int(time.monotonic() // 60)
+    with _lock:
+        window = _body_windows.get(key)
+        if window is None or window[0] != minute:
+            window = _body_windows[key] = [minute, 0]
+        if window[1] >= per_minute:
+            _counters["bodies_suppressed"] += 1
+            return f"<{len(r.content)} bytes, not logged: over {per_minute}/min for {key}>"
+        window[1] += 1
+        _counters["bodies_logged"] += 1
+    return _Body(r.content[:limit])
+
+
+def stats() -> dict:
+    with _lock:
+        out = dict(_counters)
+    out["queued"] = sum(h.queue.qsize() for h, _ in _listeners)
+    out["queue"] = bool(_listeners)
+    return out
+
+
+def _after_fork_in_child() -> None:
+    # поток слушателя в дочерний процесс не переходит: новая очередь и новый поток
+    global _lock
+    _lock = threading.Lock()
+    for handler, listener in _listeners:
+        q = queue.Queue(handler.queue.maxsize)
+        handler.queue = listener.queue = q
+        listener._thread = None
+        listener.start()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
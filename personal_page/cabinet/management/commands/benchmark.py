@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cabinet.benchmarks import registry
+
+
+class Command(BaseCommand):
+    help = "Микробенчмарки кабинета (время и пик памяти)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help="какие бенчмарки запускать (по умолчанию все)")
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--save-baseline', action='store_true',
+                            help="замерить suite и записать его эталон (benchmarks/baseline.json)")
+
+    def handle(self, *args, **opts):
+        if opts['save_baseline']:
+            from cabinet.benchmarks import suite
+            suite.save_baseline(suite.measure(opts['repeat']))
+            self.stdout.write(self.style.SUCCESS(f"baseline saved: {suite.BASELINE}"))
+            return
+
+        available = registry()
+        names = opts['names'] or list(available)
+        unknown = [n for n in names if n not in available]
+        if unknown:
+            raise CommandError(f"unknown benchmark(s): {', '.join(unknown)}; available: {', '.join(available)}")
+
+        for name in names:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            rows = available[name](opts['repeat'])
+            self._table(rows)
+            failed = [r['case'] for r in rows if r.get('status') == 'REGRESSION']
+            if failed:
+                raise CommandError(f"{name}: slower than baseline: {', '.join(failed)}")
+
+    def _table(self, rows: list) -> None:
+        if not rows:
+            return
+        cols = list(rows[0])
+        widths = {c: max(len(c), *(len(str(r.get(c, ''))) for r in rows)) for c in cols}
+        self.stdout.write('  '.join(c.ljust(widths[c]) for c in cols))
+        for r in rows:
+            self.stdout.write('  '.join(str(r.get(c, '')).ljust(widths[c]) for c in cols))
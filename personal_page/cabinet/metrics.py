@@ -0,0 +1,178 @@
+import functools
+import inspect
+import os
+import re
+import threading
+from bisect import bisect_left
+
+
+# Метрики процесса в текстовом формате Prometheus (internal/metrics, см. views._is_internal).
+# Без prometheus_client: гистограммы с фиксированными границами, на горячем пути —
+# bisect и два сложения под общей блокировкой. Значения свои у каждого воркера,
+# поэтому у всех рядов есть метка pid (в запросах — sum by (...) по pid).
+#
+#   cabinet_backend_request_seconds{operation,status}   HTTP-попытка к .asmx (status — код или error)
+#   cabinet_backend_response_bytes{operation}           размер тела ответа
+#   cabinet_backend_parse_seconds{operation}            разбор ответа (у потоковых списков — вместе с чтением тела)
+#   cabinet_backend_errors_total{operation,error}       итог вызова с ok=False по категориям
+#   cabinet_login_dialect_total{operation,dialect,source} каким SOAP-диалектом прошли Login/OTP
+#   cabinet_view_seconds{view,method,status}            запрос целиком (MetricsMiddleware)
+#   cabinet_login_throttled_total{scope}                отказы LOGIN_THROTTLE
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+_lock = threading.Lock()
+_metrics: list = []
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name: str, help_: str, labels: tuple):
+        self.name = name
+        self.help = help_
+        self.labels = labels
+        self._values: dict = {}
+        _metrics.append(self)
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        with _lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self):
+        for labels, value in self._values.items():
+            yield self.name, labels, (), value
+
+    def _reset(self) -> None:
+        self._values = {}
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_: str, labels: tuple, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_
+        self.labels = labels
+        self.buckets = tuple(float(b) for b in buckets)
+        self._values: dict = {}   # labels -> [счётчики по корзинам (не накопленные)..., +Inf, sum]
+        _metrics.append(self)
+
+    def observe(self, value: float, *labels) -> None:
+        i = bisect_left(self.buckets, value)
+        with _lock:
+            row = self._values.get(labels)
+            if row is None:
+                row = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[i] += 1
+            row[-1] += value
+
+    def _samples(self):
+        for labels, row in self._values.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), row):
+                cumulative += n
+                yield self.name + '_bucket', labels, (('le', _number(bound)),), cumulative
+            yield self.name + '_sum', labels, (), row[-1]
+            yield self.name + '_count', labels, (), cumulative
+
+    def _reset(self) -> None:
+        self._values = {}
+
+
+BACKEND_SECONDS = Histogram(
+    'cabinet_backend_request_seconds', 'HTTP request to the SOAP backend', ('operation', 'status'))
+BACKEND_BYTES = Histogram(
+    'cabinet_backend_response_bytes', 'SOAP response body size', ('operation',), BYTES_BUCKETS)
+PARSE_SECONDS = Histogram(
+    'cabinet_backend_parse_seconds', 'Parsing of a SOAP response', ('operation',))
+BACKEND_ERRORS = Counter(
+    'cabinet_backend_errors_total', 'Backend calls that ended with ok=False', ('operation', 'error'))
+LOGIN_DIALECT = Counter(
+    'cabinet_login_dialect_total', 'SOAP dialect that succeeded', ('operation', 'dialect', 'source'))
+VIEW_SECONDS = Histogram(
+    'cabinet_view_seconds', 'Request handling time per view', ('view', 'method', 'status'))
+LOGIN_THROTTLED = Counter(
+    'cabinet_login_throttled_total', 'Login attempts rejected by LOGIN_THROTTLE', ('scope',))
+
+
+# error из ответа сервисов → метка с ограниченным числом значений:
+# "http_error: <текст исключения>" → http_error, http_status_NNN и коды вида snake_case как есть,
+# произвольный текст ERROR/MESSAGE от бэкенда → backend_message
+_CODE_RE = re.compile(r'[a-z][a-z0-9_]{0,39}')
+
+
+def error_category(error) -> str:
+    error = str(error or 'unknown_error')
+    code = error.split(':', 1)[0].strip()
+    return code if _CODE_RE.fullmatch(code) else 'backend_message'
+
+
+def count_result(operation: str, result) -> None:
+    if isinstance(result, dict) and not result.get('ok'):
+        BACKEND_ERRORS.inc(operation, error_category(result.get('error')))
+
+
+def counts_result(operation: str):
+    """Декоратор сервиса (sync или async), возвращающего {"ok": ..., "error": ...}: считает ошибки."""
+    def decorate(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def awrapper(*args, **kwargs):
+                result = await fn(*args, **kwargs)
+                count_result(operation, result)
+                return result
+            return awrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            result = fn(*args, **kwargs)
+            count_result(operation, result)
+            return result
+        return wrapper
+    return decorate
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render() -> str:
+    """Все метрики в text exposition format 0.0.4."""
+    pid = str(os.getpid())
+    lines = []
+    with _lock:
+        for m in _metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            for name, values, extra, value in m._samples():
+                pairs = list(zip(m.labels, values)) + list(extra) + [('pid', pid)]
+                labels = ','.join(f'{k}="{_escape(v)}"' for k, v in pairs)
+                lines.append(f"{name}{{{labels}}} {_number(value) if isinstance(value, float) else value}")
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def reset() -> None:
+    with _lock:
+        for m in _metrics:
+            m._reset()
+
+
+def _after_fork_in_child() -> None:
+    # счёт у каждого воркера свой (метка pid) — унаследованное от родителя обнуляем
+    global _lock
+    _lock = threading.Lock()
+    for m in _metrics:
+        m._reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
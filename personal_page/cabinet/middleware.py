@@ -0,0 +1,110 @@
+import gzip
+import time
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+from . import json_response, metrics
+
+try:
+    import brotli
+except ImportError:  # brotli опционален: без него — только gzip
+    brotli = None
+
+
+# Сжатие ответов api_*: br (если установлен brotli и клиент его принимает) или gzip,
+# только для типов из API_RESPONSES['COMPRESS_TYPES'] и не меньше COMPRESS_MIN_BYTES.
+# HTML не сжимаем: в страницах CSRF-токен (BREACH), да и весят они немного.
+
+def _cfg() -> dict:
+    return getattr(settings, 'API_RESPONSES', {})
+
+
+def _accepted(header: str) -> dict:
+    """Accept-Encoding → {coding: q}."""
+    out = {}
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        out[coding] = q
+    return out
+
+
+def choose_encoding(header: str) -> str | None:
+    accepted = _accepted(header or '')
+    wildcard = accepted.get('*', 0.0)
+    candidates = ('br', 'gzip') if brotli is not None else ('gzip',)
+    best, best_q = None, 0.0
+    for coding in candidates:
+        q = accepted.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(content: bytes, encoding: str) -> bytes:
+    cfg = _cfg()
+    if encoding == 'br':
+        return brotli.compress(content, quality=int(cfg.get('BROTLI_QUALITY', 4)))
+    return gzip.compress(content, compresslevel=int(cfg.get('GZIP_LEVEL', 6)), mtime=0)
+
+
+class CompressionMiddleware(MiddlewareMixin):
+
+    def process_response(self, request, response):
+        content_type = response.get('Content-Type', '').split(';')[0].strip()
+        cfg = _cfg()
+        if response.streaming or content_type not in cfg.get('COMPRESS_TYPES', ('application/json',)):
+            return response
+
+        raw = len(response.content)
+        encoding = None
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if raw >= int(cfg.get('COMPRESS_MIN_BYTES', 1024)) and not response.has_header('Content-Encoding'):
+            encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is not None:
+            compressed = compress(response.content, encoding)
+            if len(compressed) < raw:
+                response.content = compressed
+                response['Content-Length'] = str(len(compressed))
+                response['Content-Encoding'] = encoding
+                etag = response.get('ETag')
+                if etag and etag.startswith('"'):
+                    # как у GZipMiddleware: тело другое — ETag только слабый
+                    response['ETag'] = 'W/' + etag
+            else:
+                encoding = None
+
+        match = getattr(request, 'resolver_match', None)
+        json_response.count_response(
+            match.url_name if match and match.url_name else 'other',
+            raw, len(response.content), encoding, getattr(response, 'serialize_ms', None),
+        )
+        return response
+
+
+class MetricsMiddleware(MiddlewareMixin):
+    """Время обработки запроса по вьюхам (url_name) — cabinet_view_seconds; стоит первым в MIDDLEWARE."""
+
+    def process_request(self, request):
+        request._metrics_started = time.perf_counter()
+
+    def process_response(self, request, response):
+        started = getattr(request, '_metrics_started', None)
+        if started is not None:
+            match = getattr(request, 'resolver_match', None)
+            metrics.VIEW_SECONDS.observe(
+                time.perf_counter() - started,
+                match.url_name if match and match.url_name else 'other', request.method, response.status_code,
+            )
+        return response
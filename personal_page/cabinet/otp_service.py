@@ -1,54 +1,12 @@
 import logging
-import re
+import time
 import xml.etree.ElementTree as ET
-from html import unescape as html_unescape
-from xml.sax.saxutils import escape as xml_escape
 import requests
 from django.conf import settings
 
-logger = logging.getLogger('cabinet.auth')
+from . import breaker, logs, metrics, soap_dialect, soap_ops, transport
 
-SOAP12_OTP = '''<?xml version="1.0" encoding="utf-8"?>
-<soap12:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
-                 xmlns:xsd="http://www.w3.org/2001/XMLSchema"
-                 xmlns:soap12="http://www.w3.org/2003/05/soap-envelope">
-  <soap12:Body>
-    <CreateOTPAndSendSMS xmlns="http://tempuri.org/">
-      <userName>{user}</userName>
-      <password>{password}</password>
-      <phoneNumber>{phone}</phoneNumber>
-    </CreateOTPAndSendSMS>
-  </soap12:Body>
-</soap12:Envelope>
-'''
-
-SOAP11_OTP = '''<?xml version="1.0" encoding="utf-8"?>
-<soap:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
-               xmlns:xsd="http://www.w3.org/2001/XMLSchema"
-               xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
-  <soap:Body>
-    <CreateOTPAndSendSMS xmlns="http://tempuri.org/">
-      <userName>{user}</userName>
-      <password>{password}</password>
-      <phoneNumber>{phone}</phoneNumber>
-    </CreateOTPAndSendSMS>
-  </soap:Body>
-</soap:Envelope>
-'''
-
-def _extract_inner(resp_text: str) -> str | None:
-    m = re.search(r'<CreateOTPAndSendSMSResult>(.*?)</CreateOTPAndSendSMSResult>', resp_text, flags=re.S|re.I)
-    if m:
-        return html_unescape(m.group(1).strip()) or None
-    m2 = re.search(r'<string\b[^>]*>(.*?)</string>', resp_text, flags=re.S|re.I)
-    if m2:
-        return html_unescape(m2.group(1).strip()) or None
-    try:
-        root = ET.fromstring(resp_text)
-        t = (root.text or '').strip()
-        return html_unescape(t).strip() or None
-    except ET.ParseError:
-        return None
+logger = logging.getLogger('cabinet.auth')
 
 def _parse_otp_inner(inner_xml: str) -> dict:
 
@@ -77,56 +35,72 @@ def _parse_otp_inner(inner_xml: str) -> dict:
     result["error"] = "unrecognized_response"
     return result
 
-def _post(url: str, payload: str, headers: dict, verify: bool, timeout: int) -> requests.Response:
-    return requests.post(url, data=payload.encode('utf-8'), headers=headers, verify=verify, timeout=timeout)
-
-def create_otp_and_send_sms(phone: str) -> dict:
-    cfg = settings.EXTERNAL_AUTH
-    url = cfg['URL']
-    timeout = cfg.get('TIMEOUT', 15)
-    verify_ssl = cfg.get('VERIFY_SSL', True)
+def _post(url: str, payload: str | bytes, headers: dict, probe: bool = False) -> requests.Response:
+    return transport.post(url, payload, headers, operation='CreateOTPAndSendSMS', probe=probe)
 
-    user = xml_escape(cfg['USERNAME'])
-    password = xml_escape(cfg['PASSWORD'])
-    phone_e = xml_escape(phone)
+OTP_DIALECTS = ('SOAP12', 'SOAP11')
 
-    logger.info(f"OTP request to {phone}")
+def _parse_otp_response(dialect: str, r) -> dict:
+    inner = soap_ops.get('CreateOTPAndSendSMS').inner(r.content)
+    if not inner:
+        logger.error("OTP %s: cannot extract inner; head: %s", dialect, logs.body(r, 600, 'CreateOTPAndSendSMS'))
+        return {"ok": False, "error": "empty_or_invalid_inner", "code": None}
+    parsed = _parse_otp_inner(inner)
+    logger.info("OTP %s parsed: %s", dialect, parsed)
+    return parsed
 
+@metrics.counts_result('CreateOTPAndSendSMS')
+def create_otp_and_send_sms(phone: str) -> dict:
+    """
+    {"ok": True, "code": ..., "attempts": [...]} либо {"ok": False, "error": ..., "attempts": [...]}.
+    attempts — по одной записи на HTTP-попытку: {"dialect", "status", "ms"};
+    в установившемся режиме там ровно одна запись.
+    """
+    url = settings.EXTERNAL_AUTH['URL']
+    op = soap_ops.get('CreateOTPAndSendSMS')
+
+    logger.info("OTP request to %s", phone)
+
+    known = soap_dialect.preferred(url, 'CreateOTPAndSendSMS')
+    attempts = []
+    result = None
+    dialects = soap_dialect.ordered(OTP_DIALECTS, known)
+    for dialect in dialects:
+        payload, headers = op.request(dialect, phone)
+        started = time.perf_counter()
+        try:
+            r = _post(url, payload, headers, probe=soap_dialect.is_probe(dialect, known, dialects))
+        except breaker.BackendUnavailable:
+            logger.warning("OTP skipped: backend_unavailable")
+            result = {"ok": False, "error": "backend_unavailable", "code": None}
+            break
+        except requests.RequestException as e:
+            attempts.append({"dialect": dialect, "status": None, "ms": _ms_since(started)})
+            logger.exception("OTP %s http_error: %s", dialect, e)
+            result = {"ok": False, "error": f"http_error: {e}", "code": None}
+            if transport.not_sent(e):
+                continue
+            # SMS могло уже уйти (таймаут чтения) — другим диалектом не повторяем
+            break
+        attempts.append({"dialect": dialect, "status": r.status_code, "ms": _ms_since(started)})
+
+        if r.status_code != 200:
+            logger.error("OTP %s Non-200: %s; head: %s", dialect, r.status_code, logs.body(r, 600, 'CreateOTPAndSendSMS'))
+            result = {"ok": False, "error": f"http_status_{r.status_code}", "code": None}
+            if dialect == known:
+                soap_dialect.forget(url, 'CreateOTPAndSendSMS')
+                known = None
+            continue
+
+        if dialect != known:
+            soap_dialect.remember(url, 'CreateOTPAndSendSMS', dialect)
+        metrics.LOGIN_DIALECT.inc('CreateOTPAndSendSMS', dialect, "cached" if dialect == known else "probed")
+        result = transport.timed_parse('CreateOTPAndSendSMS', _parse_otp_response, dialect, r)
+        break
+
+    logger.info("OTP attempts: %s", attempts)
+    result["attempts"] = attempts
+    return result
 
-    payload12 = SOAP12_OTP.format(user=user, password=password, phone=phone_e)
-    headers12 = { "Content-Type": "application/soap+xml; charset=utf-8" }
-    try:
-        r = _post(url, payload12, headers12, verify_ssl, timeout)
-        if r.status_code == 200:
-            inner = _extract_inner(r.text)
-            if not inner:
-                logger.error("OTP SOAP12: cannot extract inner; head: %s", r.text[:600])
-                return {"ok": False, "error": "empty_or_invalid_inner", "code": None}
-            parsed = _parse_otp_inner(inner)
-            logger.info(f"OTP SOAP12 parsed: {parsed}")
-            return parsed
-        logger.error("OTP SOAP12 Non-200: %s; head: %s", r.status_code, r.text[:600])
-    except requests.RequestException as e:
-        logger.exception("OTP SOAP12 http_error: %s", e)
-
-
-    payload11 = SOAP11_OTP.format(user=user, password=password, phone=phone_e)
-    headers11 = {
-        "Content-Type": "text/xml; charset=utf-8",
-        "SOAPAction": '"http://tempuri.org/CreateOTPAndSendSMS"',
-    }
-    try:
-        r2 = _post(url, payload11, headers11, verify_ssl, timeout)
-        if r2.status_code != 200:
-            logger.error("OTP SOAP11 Non-200: %s; head: %s", r2.status_code, r2.text[:600])
-            return {"ok": False, "error": f"http_status_{r2.status_code}", "code": None}
-        inner = _extract_inner(r2.text)
-        if not inner:
-            logger.error("OTP SOAP11: cannot extract inner; head: %s", r2.text[:600])
-            return {"ok": False, "error": "empty_or_invalid_inner", "code": None}
-        parsed = _parse_otp_inner(inner)
-        logger.info(f"OTP SOAP11 parsed: {parsed}")
-        return parsed
-    except requests.RequestException as e:
-        logger.exception("OTP SOAP11 http_error: %s", e)
-        return {"ok": False, "error": f"http_error: {e}", "code": None}
+def _ms_since(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
@@ -0,0 +1,197 @@
+import base64
+import binascii
+import json
+import sys
+from collections.abc import Mapping
+from json.encoder import encode_basestring_ascii
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .doctor_photos import photo_hash
+
+
+# Компактные записи для списков из .asmx (полисы, врачи, карьера, жалобы).
+# Вместо dict на строку: объект с двумя слотами — общая на все строки схема (кортеж
+# имён полей + индекс) и кортеж значений. Имена полей интернированы, повторяющиеся
+# значения (коды, статусы, клиники) — тоже. Снаружи запись ведёт себя как dict только
+# на чтение (Mapping: .get, [], in, items(), dict(r)), поэтому вьюхи и шаблоны не меняются.
+# В JSON записи пишутся напрямую (dumps): ключи схемы закодированы
+# заранее, значения — C-функцией json, без промежуточного dict на строку.
+
+_MAX_SCHEMAS = 4096
+
+
+class Schema:
+    __slots__ = ('keys', 'index', 'json_keys')
+
+    def __init__(self, keys: tuple):
+        self.keys = keys
+        self.index = {k: i for i, k in enumerate(keys)}
+        self.json_keys = tuple(encode_basestring_ascii(k) + ': ' for k in keys)
+
+
+# DataSet опускает пустые колонки, поэтому наборов полей несколько — но немного
+_schemas: dict = {}
+
+
+def _schema(keys: tuple) -> Schema:
+    schema = _schemas.get(keys)
+    if schema is None:
+        schema = Schema(tuple(sys.intern(k) for k in keys))
+        if len(_schemas) < _MAX_SCHEMAS:
+            schema = _schemas.setdefault(schema.keys, schema)
+    return schema
+
+
+class Record(Mapping):
+    __slots__ = ('_schema', '_values')
+
+    TAG = ''
+    CATEGORICAL = frozenset()   # поля с малым числом различных значений — интернируем
+
+    def __init__(self, schema: Schema, values: tuple):
+        self._schema = schema
+        self._values = values
+
+    @classmethod
+    def from_row(cls, row: dict) -> "Record":
+        categorical = cls.CATEGORICAL
+        values = tuple(sys.intern(v) if k in categorical else v for k, v in row.items())
+        return cls(_schema(tuple(row)), values)
+
+    def __getitem__(self, key):
+        i = self._schema.index.get(key)
+        if i is None:
+            raise KeyError(key)
+        return self._values[i]
+
+    def get(self, key, default=None):
+        i = self._schema.index.get(key)
+        return default if i is None else self._values[i]
+
+    def __contains__(self, key) -> bool:
+        return key in self._schema.index
+
+    def __iter__(self):
+        return iter(self._schema.keys)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def as_dict(self) -> dict:
+        return dict(zip(self._schema.keys, self._values))
+
+    def json(self) -> str:
+        try:
+            # значения из XML — всегда строки
+            return '{' + ', '.join([k + encode_basestring_ascii(v)
+                                    for k, v in zip(self._schema.json_keys, self._values)]) + '}'
+        except TypeError:
+            return json.dumps(self.as_dict(), cls=DjangoJSONEncoder)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.as_dict()!r})"
+
+    def __reduce__(self):
+        # кэш Django (user_cache) пиклит значения; схему при загрузке берём общую
+        return _restore, (type(self), self._schema.keys, self._values)
+
+
+def _restore(cls, keys: tuple, values: tuple) -> Record:
+    return cls(_schema(keys), values)
+
+
+class Policy(Record):
+    __slots__ = ()
+    TAG = 'POLICIES'
+    CATEGORICAL = frozenset({'INSURANCE_CODE', 'STATUS', 'PROGRAM_NAME', 'CURRENCY_CODE',
+                             'INSURANCE_START_DATE', 'INSURANCE_END_DATE'})
+
+
+class Doctor(Record):
+    """
+    FILE_CONTENT в поля не попадает: фото храним раскодированными байтами (на треть меньше
+    base64) в слоте photo, PHOTO_HASH — в слоте photo_hash (см. doctor_photos).
+    """
+    __slots__ = ('photo', 'photo_hash')
+    TAG = 'DOCTORS'
+    CATEGORICAL = frozenset({'SPECIALITY_ID', 'SPECIALITY_NAME', 'WORKPLACE_NAME'})
+    PHOTO_FIELD = 'FILE_CONTENT'
+
+    def __init__(self, schema: Schema, values: tuple, photo: bytes | None = None, photo_hash: str | None = None):
+        super().__init__(schema, values)
+        self.photo = photo
+        self.photo_hash = photo_hash
+
+    @classmethod
+    def from_row(cls, row: dict) -> "Doctor":
+        content = (row.pop(cls.PHOTO_FIELD, None) or '').strip()
+        doctor = super().from_row(row)
+        if content:
+            try:
+                doctor.photo = base64.b64decode(content)
+                doctor.photo_hash = photo_hash(content)
+            except (binascii.Error, ValueError):
+                pass
+        return doctor
+
+    def __reduce__(self):
+        return _restore_doctor, (self._schema.keys, self._values, self.photo, self.photo_hash)
+
+
+def _restore_doctor(keys: tuple, values: tuple, photo, photo_hash) -> Doctor:
+    return Doctor(_schema(keys), values, photo, photo_hash)
+
+
+class CareerItem(Record):
+    __slots__ = ()
+    TAG = 'DOCTOR_CAREER'
+    CATEGORICAL = frozenset({'SPECIALITY', 'SPECIALITY_AZ', 'PLACE', 'PLACE_AZ', 'ENTERPRISE', 'ENTERPRISE_AZ'})
+
+
+class MedicalClaim(Record):
+    __slots__ = ()
+    TAG = 'CLM_NOTICE_DISPETCHER'
+    CATEGORICAL = frozenset({'PIN_CODE', 'CLINIC_NAME'})
+
+
+class Claim(Record):
+    __slots__ = ()
+    TAG = 'CLM_NOTICES'
+    CATEGORICAL = frozenset({'PIN_CODE', 'INSURANCE_CODE', 'STATUS_NAME'})
+
+
+BY_TAG = {cls.TAG: cls for cls in (Policy, Doctor, CareerItem, MedicalClaim, Claim)}
+
+
+def factory(row_tag: str | None):
+    """Чем собирать строки row_tag: from_row записи или просто dict (для остальных тегов)."""
+    cls = BY_TAG.get(row_tag)
+    return cls.from_row if cls is not None else None
+
+
+_RECORD_TYPES = frozenset(BY_TAG.values()) | {Record}
+
+
+class RecordJSONEncoder(DjangoJSONEncoder):
+    """Для записей, попавших глубже верхнего уровня ответа."""
+
+    def default(self, o):
+        if isinstance(o, Record):
+            return o.as_dict()
+        return super().default(o)
+
+
+def dumps(obj) -> str:
+    """json.dumps (как у JsonResponse: DjangoJSONEncoder, ensure_ascii) с записями внутри dict/list."""
+    cls = obj.__class__
+    if cls in _RECORD_TYPES:
+        return obj.json()
+    if cls is dict:
+        return '{' + ', '.join([encode_basestring_ascii(str(k)) + ': ' + dumps(v) for k, v in obj.items()]) + '}'
+    if (cls is list or cls is tuple) and obj and obj[0].__class__ in _RECORD_TYPES:
+        # типичный ответ — список однотипных записей
+        return '[' + ', '.join([v.json() if v.__class__ in _RECORD_TYPES else dumps(v) for v in obj]) + ']'
+    # остальное — целиком C-энкодером
+    return json.dumps(obj, cls=RecordJSONEncoder)
+
@@ -0,0 +1,172 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+logger = logging.getLogger('cabinet.auth')
+
+
+# Кэш справочных данных, общих для всех пользователей (специальности, врачи, карьера).
+# Семантика как у Cache-Control:
+#   TTL[op]                  — запись свежая, отдаём без похода в бэкенд;
+#   STALE_WHILE_REVALIDATE   — после TTL ещё столько секунд отдаём старое сразу,
+#                              а обновляем в фоне (пользователь не ждёт);
+#   STALE_IF_ERROR           — если бэкенд ответил ошибкой, отдаём старое до этого срока.
+# Размер ограничен MAX_ENTRIES, вытесняется давно не читанное (LRU); on_evict(fn) —
+# fn(key) после вытеснения или invalidate (производные индексы чистят свои записи).
+# Кэшируются только ответы с ok=True. Возвращаемые dict общие — не мутировать.
+
+DEFAULTS = {
+    'MAX_ENTRIES': 128,
+    'TTL': {},
+    'DEFAULT_TTL': 600,
+    'STALE_WHILE_REVALIDATE': 600,
+    'STALE_IF_ERROR': 86400,
+}
+
+
+class _Entry:
+    __slots__ = ('value', 'stored_at')
+
+    def __init__(self, value, stored_at):
+        self.value = value
+        self.stored_at = stored_at
+
+
+class ReferenceCache:
+    def __init__(self):
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing: set = set()
+        self._evict_listeners: list = []
+        self._counters = dict.fromkeys(
+            ('hits', 'misses', 'stale_hits', 'stale_on_error', 'refreshes', 'refresh_errors', 'evictions'), 0
+        )
+
+    # --- настройки ---
+    def _cfg(self) -> dict:
+        return {**DEFAULTS, **getattr(settings, 'REFERENCE_CACHE', {})}
+
+    def _ttl(self, cfg: dict, operation: str) -> float:
+        return cfg['TTL'].get(operation, cfg['DEFAULT_TTL'])
+
+    # --- основной вход ---
+    def get_or_load(self, key: tuple, loader, *args) -> dict:
+        """
+        key[0] — имя SOAP-операции (по нему берётся TTL); loader(*args) -> {"ok": ..., ...}.
+        """
+        cfg, ttl, state, entry = self._lookup(key, loader, args)
+        if state in ('fresh', 'stale'):
+            return entry.value
+        return self._loaded(key, entry, loader(*args), cfg, ttl)
+
+    async def aget_or_load(self, key: tuple, aloader, loader, *args) -> dict:
+        """
+        Async-вариант: промах ждёт aloader(*args); фоновое обновление — sync loader в потоке.
+        """
+        cfg, ttl, state, entry = self._lookup(key, loader, args)
+        if state in ('fresh', 'stale'):
+            return entry.value
+        return self._loaded(key, entry, await aloader(*args), cfg, ttl)
+
+    def _lookup(self, key: tuple, loader, args: tuple):
+        cfg = self._cfg()
+        ttl = self._ttl(cfg, key[0])
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                state = 'miss'
+            else:
+                self._data.move_to_end(key)
+                age = now - entry.stored_at
+                if age < ttl:
+                    state = 'fresh'
+                elif age < ttl + cfg['STALE_WHILE_REVALIDATE']:
+                    state = 'stale'
+                else:
+                    state = 'expired'
+            self._counters[{'fresh': 'hits', 'stale': 'stale_hits'}.get(state, 'misses')] += 1
+            spawn = state == 'stale' and key not in self._refreshing
+            if spawn:
+                self._refreshing.add(key)
+
+        if spawn:
+            threading.Thread(
+                target=self._refresh, args=(key, loader, args), daemon=True,
+                name=f"ref-cache-refresh:{key[0]}",
+            ).start()
+        return cfg, ttl, state, entry
+
+    def _loaded(self, key: tuple, entry, value: dict, cfg: dict, ttl: float) -> dict:
+        if value.get('ok'):
+            self._store(key, value, cfg)
+            return value
+
+        # бэкенд ответил ошибкой — лучше старые данные, чем никаких
+        if entry is not None and time.monotonic() - entry.stored_at < ttl + cfg['STALE_IF_ERROR']:
+            with self._lock:
+                self._counters['stale_on_error'] += 1
+            logger.warning("Reference cache: %s failed (%s), serving stale", key[0], value.get('error'))
+            return entry.value
+        return value
+
+    def _refresh(self, key: tuple, loader, args: tuple) -> None:
+        try:
+            value = loader(*args)
+        except Exception:
+            logger.exception("Reference cache: background refresh of %s failed", key[0])
+            value = {"ok": False, "error": "refresh_exception"}
+
+        if value.get('ok'):
+            self._store(key, value, self._cfg())
+        with self._lock:
+            self._refreshing.discard(key)
+            self._counters['refreshes'] += 1
+            if not value.get('ok'):
+                self._counters['refresh_errors'] += 1
+
+    def _store(self, key: tuple, value: dict, cfg: dict) -> None:
+        evicted = []
+        with self._lock:
+            self._data[key] = _Entry(value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > cfg['MAX_ENTRIES']:
+                evicted.append(self._data.popitem(last=False)[0])
+                self._counters['evictions'] += 1
+        self._evicted(evicted)
+
+    def _evicted(self, keys: list) -> None:
+        for key in keys:
+            for fn in self._evict_listeners:
+                try:
+                    fn(key)
+                except Exception:
+                    logger.exception("Reference cache: eviction listener failed for %s", key[0])
+
+    # --- обслуживание ---
+    def on_evict(self, fn) -> None:
+        self._evict_listeners.append(fn)
+
+    def invalidate(self, key: tuple | None = None) -> None:
+        with self._lock:
+            if key is None:
+                keys = list(self._data)
+                self._data.clear()
+            else:
+                keys = [key] if self._data.pop(key, None) is not None else []
+        self._evicted(keys)
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._counters)
+            out['size'] = len(self._data)
+        lookups = out['hits'] + out['stale_hits'] + out['misses']
+        out['hit_ratio'] = round((out['hits'] + out['stale_hits']) / lookups, 3) if lookups else 0.0
+        return out
+
+
+reference_cache = ReferenceCache()
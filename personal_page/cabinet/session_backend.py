@@ -0,0 +1,113 @@
+import copy
+import logging
+import os
+import threading
+import time
+
+from django.contrib.sessions.backends.cache import SessionStore as CacheSessionStore
+from django.core.cache.backends.filebased import FileBasedCache
+
+logger = logging.getLogger('cabinet.auth')
+
+
+# Сессии в кэше Django (алиас SESSION_CACHE_ALIAS, см. CACHES['sessions'] в settings)
+# вместо SQLite: логин и капча пишут в сессию почти на каждый запрос, а SQLite
+# сериализует запись между всеми воркерами. Срок жизни записи в кэше — get_expiry_age().
+#
+# SessionMiddleware сохраняет сессию, если в неё что-то присвоили (modified), даже то же
+# самое значение (login_attempts = 0 и т.п.). Здесь сохранение пропускается, если данные
+# равны загруженным: в кэш пишем не больше одного раза за запрос и только при изменении.
+
+_lock = threading.Lock()
+_counters = {"writes": 0, "skipped": 0}
+
+
+def _count(name: str) -> None:
+    with _lock:
+        _counters[name] += 1
+
+
+def stats() -> dict:
+    with _lock:
+        return dict(_counters)
+
+
+class SessionStore(CacheSessionStore):
+    cache_key_prefix = 'cabinet.session'
+
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        self._stored = None   # данные в том виде, в каком они лежат в кэше
+
+    def load(self):
+        data = super().load()
+        self._stored = copy.deepcopy(data) if self._session_key else None
+        return data
+
+    async def aload(self):
+        data = await super().aload()
+        self._stored = copy.deepcopy(data) if self._session_key else None
+        return data
+
+    def _unchanged(self, must_create: bool) -> bool:
+        return (not must_create and self._stored is not None and self.session_key is not None
+                and self._session == self._stored)
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()    # create() вызовет save(must_create=True)
+        if self._unchanged(must_create):
+            _count("skipped")
+            return
+        super().save(must_create)
+        self._stored = copy.deepcopy(self._session)
+        _count("writes")
+
+    async def asave(self, must_create=False):
+        if self.session_key is None:
+            return await self.acreate()
+        if self._unchanged(must_create):
+            _count("skipped")
+            return
+        await super().asave(must_create)
+        self._stored = copy.deepcopy(await self._aget_session())
+        _count("writes")
+
+
+class SessionFileCache(FileBasedCache):
+    """
+    FileBasedCache для CACHES['sessions']. Штатный при MAX_ENTRIES удаляет случайную треть
+    файлов — это разлогинило бы живых пользователей. Здесь удаляются только истёкшие
+    сессии; если живых больше MAX_ENTRIES, ничего не удаляем (предупреждение в лог),
+    а полный проход по файлам — не чаще раза в CULL_INTERVAL секунд.
+    """
+
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        self._cull_interval = float(params.get('OPTIONS', {}).get('CULL_INTERVAL', 60))
+        self._next_cull = 0.0
+
+    def _cull(self):
+        filelist = self._list_cache_files()
+        if len(filelist) < self._max_entries or time.monotonic() < self._next_cull:
+            return
+        self._next_cull = time.monotonic() + self._cull_interval
+        live = 0
+        for fname in filelist:
+            try:
+                with open(fname, 'rb') as f:
+                    live += not self._is_expired(f)
+            except FileNotFoundError:
+                pass
+        if live >= self._max_entries:
+            logger.warning("session cache: %s live sessions >= MAX_ENTRIES %s, nothing culled",
+                           live, self._max_entries)
+
+
+def _after_fork_in_child() -> None:
+    global _lock
+    _lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
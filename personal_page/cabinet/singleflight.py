@@ -0,0 +1,120 @@
+import asyncio
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures import CancelledError, Future
+
+from django.conf import settings
+
+
+# Single-flight: одинаковые одновременные вызовы (операция + аргументы) выполняются один раз,
+# остальные ждут результат первого. Общий примитив — concurrent.futures.Future, поэтому
+# вместе ждут и потоки WSGI, и корутины (в том числе из разных event loop'ов/потоков).
+# Ждущие получают поверхностную копию dict результата; списки внутри общие — не мутировать.
+# Только для чтения: Login, OTP и запись к врачу сюда не попадают (см. soap_ops).
+
+_inflight: dict = {}
+_lock = threading.Lock()
+_counters: dict = defaultdict(lambda: {"calls": 0, "coalesced": 0})
+
+
+def _enabled() -> bool:
+    return getattr(settings, 'SINGLE_FLIGHT', {}).get('ENABLED', True)
+
+
+def _join(key: tuple) -> tuple[Future, bool]:
+    with _lock:
+        fut = _inflight.get(key)
+        if fut is not None:
+            _counters[key[0]]["coalesced"] += 1
+            return fut, False
+        fut = _inflight[key] = Future()
+        _counters[key[0]]["calls"] += 1
+        return fut, True
+
+
+def _finish(key: tuple, fut: Future, result=None, exc: BaseException | None = None) -> None:
+    with _lock:
+        if _inflight.get(key) is fut:
+            del _inflight[key]
+    if fut.done():
+        return
+    if isinstance(exc, (asyncio.CancelledError, CancelledError)):
+        # ведущий отменён (клиент ушёл) — ждущие повторят вызов сами
+        fut.cancel()
+    elif exc is not None:
+        fut.set_exception(exc)
+    else:
+        fut.set_result(result)
+
+
+def _shared(result):
+    return dict(result) if isinstance(result, dict) else result
+
+
+def do(key: tuple, fn):
+    """fn() один раз на key среди одновременных вызовов; key[0] — имя операции (для статистики)."""
+    if not _enabled():
+        return fn()
+    fut, leader = _join(key)
+    if not leader:
+        try:
+            return _shared(fut.result())
+        except CancelledError:
+            return fn()
+    try:
+        result = fn()
+    except BaseException as e:
+        _finish(key, fut, exc=e)
+        raise
+    _finish(key, fut, result)
+    return result
+
+
+async def ado(key: tuple, afn):
+    """Async-вариант do: afn — функция без аргументов, возвращающая корутину."""
+    if not _enabled():
+        return await afn()
+    fut, leader = _join(key)
+    if not leader:
+        # shield: отмена этого ожидающего не должна отменять общий Future
+        waiter = asyncio.wrap_future(fut)
+        try:
+            return _shared(await asyncio.shield(waiter))
+        except asyncio.CancelledError:
+            if fut.cancelled():
+                return await afn()
+            raise
+    try:
+        result = await afn()
+    except BaseException as e:
+        _finish(key, fut, exc=e)
+        raise
+    _finish(key, fut, result)
+    return result
+
+
+def stats() -> dict:
+    with _lock:
+        out = {name: dict(c) for name, c in _counters.items()}
+        in_flight = len(_inflight)
+    calls = sum(c["calls"] for c in out.values())
+    coalesced = sum(c["coalesced"] for c in out.values())
+    return {
+        "in_flight": in_flight,
+        "calls": calls,
+        "coalesced": coalesced,
+        "coalesced_ratio": round(coalesced / (calls + coalesced), 3) if calls + coalesced else 0.0,
+        "operations": out,
+    }
+
+
+def _after_fork_in_child() -> None:
+    # вызовы в полёте принадлежат потокам родителя
+    global _inflight, _lock
+    _inflight = {}
+    _lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
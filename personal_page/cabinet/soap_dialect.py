@@ -0,0 +1,49 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+# Какой вариант SOAP (1.2 / 1.2 с action / 1.1) последним сработал для пары
+# (эндпоинт, операция). Храним в CACHES[EXTERNAL_AUTH['DIALECT_CACHE']] — файловый кэш,
+# общий для воркеров: знание переживает их перезапуск, и новый воркер не перебирает
+# диалекты заново (неподошедший вариант этот бэкенд отвечает 500).
+
+def _ttl() -> int:
+    return int(settings.EXTERNAL_AUTH.get('DIALECT_TTL', 3600))
+
+
+def _cache():
+    return caches[settings.EXTERNAL_AUTH.get('DIALECT_CACHE', 'default')]
+
+
+def _key(url: str, operation: str) -> str:
+    digest = hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]
+    return f"cabinet:soap_dialect:{operation}:{digest}"
+
+
+def preferred(url: str, operation: str) -> str | None:
+    return _cache().get(_key(url, operation))
+
+
+def remember(url: str, operation: str, dialect: str) -> None:
+    _cache().set(_key(url, operation), dialect, _ttl())
+
+
+def forget(url: str, operation: str) -> None:
+    _cache().delete(_key(url, operation))
+
+
+def ordered(dialects: tuple, known: str | None) -> list:
+    """Сначала известный рабочий вариант, затем остальные в исходном порядке."""
+    if known not in dialects:
+        return list(dialects)
+    return [known] + [d for d in dialects if d != known]
+
+
+def is_probe(dialect: str, known: str | None, dialects: list) -> bool:
+    """
+    Попытка — проба: вариант не запомнен как рабочий, и после него есть ещё.
+    Её отказ говорит о диалекте, а не о здоровье бэкенда (не засчитывается breaker'ом).
+    """
+    return dialect != known and dialect != dialects[-1]
@@ -0,0 +1,246 @@
+import logging
+import re
+import xml.etree.ElementTree as ET
+from html import unescape as html_unescape
+from xml.sax.saxutils import escape as xml_escape, unescape as xml_unescape
+
+from django.conf import settings
+from django.test.signals import setting_changed
+
+from . import async_transport, records, singleflight, soap_parser, transport
+
+logger = logging.getLogger('cabinet.auth')
+
+
+# Все операции .asmx объявлены здесь один раз: имя, параметры (после userName/password),
+# тег записи и ключ списка в ответе сервиса. Всё, что не зависит от аргументов вызова, —
+# начало и конец конверта с уже экранированными логином/паролем, открывающие/закрывающие
+# теги параметров, заголовки, regex тега результата — считается один раз на процесс
+# (и заново при смене EXTERNAL_AUTH в тестах).
+
+OPERATIONS = (
+    # name, params, row_tag, list_key
+    ("Login", ("pinCode", "policyNumber", "phoneNumber"), None, None),
+    ("CreateOTPAndSendSMS", ("phoneNumber",), None, None),
+    ("GetCustomerPolicies", ("pinCode",), "POLICIES", "policies"),
+    ("GetPolicyInformations", ("policyNumber",), None, None),
+    ("GetSpecialities", (), "SPECIALITIES", "specialities"),
+    ("GetDoctorsBySpecialtiy", ("specialityId",), "DOCTORS", "doctors"),
+    ("GetDoctorCareer", ("doctorId",), "DOCTOR_CAREER", "career"),
+    ("RegistrationForDoctor", ("pinCode", "cardNumber", "customerId"), None, None),
+    ("GetMedicalClaimInformations", ("pinCode",), "CLM_NOTICE_DISPETCHER", "complaints"),
+    ("GetNonMedicalClaimInformations", ("pinCode",), "CLM_NOTICES", "complaints"),
+)
+
+# с побочными эффектами (SMS, запись к врачу) или на каждый вход свои — не объединяем (singleflight)
+SIDE_EFFECTS = frozenset({"Login", "CreateOTPAndSendSMS", "RegistrationForDoctor"})
+
+_ENVELOPES = {
+    'SOAP11': (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<soap:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+        'xmlns:xsd="http://www.w3.org/2001/XMLSchema" '
+        'xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"><soap:Body>',
+        '</soap:Body></soap:Envelope>',
+    ),
+    'SOAP12': (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<soap12:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+        'xmlns:xsd="http://www.w3.org/2001/XMLSchema" '
+        'xmlns:soap12="http://www.w3.org/2003/05/soap-envelope"><soap12:Body>',
+        '</soap12:Body></soap12:Envelope>',
+    ),
+}
+
+class _Tag:
+    """Поиск <tag ...>...</tag> в байтах ответа без ленивого (.*?): regex только на открывающий тег."""
+    __slots__ = ('_open_re', '_close', '_close_re')
+
+    def __init__(self, tag: str):
+        self._open_re = re.compile(fr'<{tag}\b[^>]*>'.encode('ascii'), re.I)
+        self._close = f'</{tag}>'.encode('ascii')
+        self._close_re = re.compile(re.escape(self._close), re.I)
+
+    def slice(self, body: bytes) -> bytes | None:
+        m = self._open_re.search(body)
+        if not m:
+            return None
+        start = m.end()
+        end = body.find(self._close, start)
+        if end < 0:
+            m2 = self._close_re.search(body, start)
+            if not m2:
+                return None
+            end = m2.start()
+        return body[start:end]
+
+
+_STRING = _Tag('string')
+
+# .asmx экранирует только &lt; &gt; &amp; &quot; &apos; — их снимаем цепочкой str.replace,
+# а html.unescape (regex с callback на каждую сущность) — лишь если встретилось что-то ещё
+_OTHER_ENTITY_RE = re.compile(r'&(?!(?:lt|gt|amp|quot|apos);)')
+_XML_ENTITIES = {'&quot;': '"', '&apos;': "'"}
+
+
+def _unescape(text: str) -> str:
+    if '&' not in text:
+        return text
+    if _OTHER_ENTITY_RE.search(text):
+        return html_unescape(text)
+    return xml_unescape(text, _XML_ENTITIES)
+
+
+class Operation:
+    __slots__ = ('name', 'params', 'row_tag', 'list_key', 'record', 'coalesce', 'result_tag',
+                 '_result', '_bodies', '_tags', 'headers')
+
+    def __init__(self, name: str, params: tuple, row_tag: str | None, list_key: str | None, cfg: dict):
+        self.name = name
+        self.params = params
+        self.row_tag = row_tag
+        self.list_key = list_key
+        self.record = records.factory(row_tag)
+        self.coalesce = name not in SIDE_EFFECTS
+        self.result_tag = f"{name}Result"
+        self._result = _Tag(self.result_tag)
+
+        credentials = (
+            f'<{name} xmlns="http://tempuri.org/">'
+            f'<userName>{xml_escape(cfg["USERNAME"])}</userName>'
+            f'<password>{xml_escape(cfg["PASSWORD"])}</password>'
+        )
+        self._bodies = {
+            version: ((head + credentials).encode('utf-8'), (f'</{name}>' + tail).encode('utf-8'))
+            for version, (head, tail) in _ENVELOPES.items()
+        }
+        self._tags = tuple((f'<{p}>'.encode('ascii'), f'</{p}>'.encode('ascii')) for p in params)
+
+        action = f"http://tempuri.org/{name}"
+        self.headers = {
+            'SOAP11': {"Content-Type": "text/xml; charset=utf-8", "SOAPAction": f'"{action}"'},
+            'SOAP12': {"Content-Type": "application/soap+xml; charset=utf-8"},
+            # некоторые серверы требуют action в Content-Type
+            'SOAP12(action)': {"Content-Type": f'application/soap+xml; charset=utf-8; action="{action}"'},
+        }
+
+    def payload(self, *values, dialect: str = 'SOAP11') -> bytes:
+        """Тело запроса; values — в порядке params, экранируются здесь."""
+        head, tail = self._bodies['SOAP11' if dialect == 'SOAP11' else 'SOAP12']
+        parts = [head]
+        for (open_tag, close_tag), value in zip(self._tags, values):
+            parts += (open_tag, xml_escape(value).encode('utf-8'), close_tag)
+        parts.append(tail)
+        return b''.join(parts)
+
+    def request(self, dialect: str, *values) -> tuple[bytes, dict]:
+        return self.payload(*values, dialect=dialect), self.headers[dialect]
+
+    def inner(self, body: bytes) -> str | None:
+        """
+        Внутренний XML из <OpResult> (или <string>, или текста корня), уже без экранирования.
+        body — r.content: декодируем только найденный кусок, по кодировке из XML-декларации.
+        """
+        encoding = soap_parser.declared_encoding(body)
+        if encoding.startswith(('utf-16', 'utf-32')):
+            body, encoding = body.decode(encoding, errors='replace').encode('utf-8'), 'utf-8'
+        for tag in (self._result, _STRING):
+            found = tag.slice(body)
+            if found is not None:
+                return _unescape(found.strip().decode(encoding, errors='replace')).strip() or None
+        try:
+            root = ET.fromstring(body)
+        except ET.ParseError:
+            return None
+        return _unescape((root.text or '').strip()).strip() or None
+
+    def rows(self, r) -> list:
+        """
+        Записи row_tag из ответа (records.* для известных тегов);
+        SoapParseError — как раньше empty_or_invalid_inner/invalid_inner_xml.
+        """
+        return soap_parser.parse_rows(_body(r), self.result_tag, self.row_tag, self.record)
+
+    def parse_list(self, r) -> dict:
+        """Типовой разбор списочной операции: {"ok": True, list_key: [...]}."""
+        if r.status_code != 200:
+            logger.error("%s non-200: %s", self.name, r.status_code)
+            return {"ok": False, "error": f"http_status_{r.status_code}"}
+        try:
+            items = self.rows(r)
+        except soap_parser.SoapParseError as e:
+            return {"ok": False, "error": e.code}
+        return {"ok": True, self.list_key: items}
+
+
+def _body(r):
+    """
+    Тело для потокового разбора: у requests — куски iter_content (при stream=True ответ
+    целиком в памяти не собирается), у httpx-ответа — уже прочитанные байты.
+    """
+    iter_content = getattr(r, 'iter_content', None)
+    if iter_content is None:
+        return r.content
+    return iter_content(soap_parser.CHUNK_SIZE)
+
+
+_registry: dict | None = None
+
+
+def _build() -> dict:
+    cfg = settings.EXTERNAL_AUTH
+    return {name: Operation(name, params, row_tag, list_key, cfg)
+            for name, params, row_tag, list_key in OPERATIONS}
+
+
+def registry() -> dict:
+    global _registry
+    ops = _registry
+    if ops is None:
+        ops = _registry = _build()
+    return ops
+
+
+def get(name: str) -> Operation:
+    return registry()[name]
+
+
+def reset(**kwargs) -> None:
+    global _registry
+    if kwargs.get('setting') in (None, 'EXTERNAL_AUTH'):
+        _registry = None
+
+
+setting_changed.connect(reset)
+
+
+def call(name: str, *values, parse=None) -> dict:
+    """
+    SOAP 1.1 вызов операции; parse(r) по умолчанию — parse_list.
+    Списки (могут быть по несколько МБ, врачи с фото) читаются stream=True и разбираются по мере чтения.
+    Одинаковые одновременные вызовы читающих операций идут в бэкенд один раз (singleflight).
+    """
+    op = get(name)
+    parse = parse or op.parse_list
+
+    def run():
+        return transport.soap11_call(
+            name, op.payload(*values), parse,
+            headers=op.headers['SOAP11'], stream=op.row_tag is not None,
+        )
+
+    if not op.coalesce:
+        return run()
+    return singleflight.do((name, values, parse), run)
+
+
+async def acall(name: str, *values, parse=None) -> dict:
+    op = get(name)
+    parse = parse or op.parse_list
+
+    def run():
+        return async_transport.soap11_call(name, op.payload(*values), parse, headers=op.headers['SOAP11'])
+
+    if not op.coalesce:
+        return await run()
+    return await singleflight.ado((name, values, parse), run)
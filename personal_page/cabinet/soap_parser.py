@@ -0,0 +1,198 @@
+import codecs
+import re
+import xml.etree.ElementTree as ET
+
+
+# Потоковый разбор ответов .asmx за один проход.
+#
+# Внешний конверт разбирается инкрементально (XMLParser с собственным target), текст
+# элемента <...Result> приходит кусками уже раскодированным из &lt;...&gt; — эти куски
+# сразу скармливаются второму инкрементальному парсеру внутреннего документа. Записи
+# <ROW_TAG><FIELD>..</FIELD>...</ROW_TAG> собираются в dict по мере разбора; ни полного
+# текста ответа, ни строки внутреннего XML, ни дерева элементов в памяти не бывает.
+#
+# Результат тот же, что у прежнего regex + html_unescape + ET.fromstring + findall:
+# {дочерний тег: text.strip()} для каждого ROW_TAG на любой глубине.
+
+CHUNK_SIZE = 64 * 1024
+
+_DECLARATION_RE = re.compile(rb'^\s*<\?xml[^>]*?encoding\s*=\s*["\']([A-Za-z0-9._-]+)["\']')
+
+
+def declared_encoding(body: bytes) -> str:
+    """
+    Кодировка ответа по BOM / XML-декларации (по умолчанию utf-8, как в спецификации XML).
+    Заголовки HTTP не смотрим: .asmx часто не отдаёт charset, а угадывание по телу дорогое.
+    """
+    if body.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    m = _DECLARATION_RE.match(body[:256])
+    if m:
+        try:
+            return codecs.lookup(m.group(1).decode('ascii')).name
+        except LookupError:
+            pass
+    return 'utf-8'
+
+
+class SoapParseError(Exception):
+    def __init__(self, code: str):
+        super().__init__(code)
+        self.code = code
+
+
+class _RowCollector:
+    """target для внутреннего документа: копит плоские записи row_tag."""
+
+    def __init__(self, row_tag: str, factory=None):
+        self.row_tag = row_tag
+        self._factory = factory
+        self.rows: list = []
+        self._row = None
+        self._depth = 0
+        self._field = None
+        self._buf: list = []
+        self._text_done = False
+
+    def start(self, tag, attrib=None):
+        if self._row is None:
+            if tag == self.row_tag:
+                self._row = {}
+                self._depth = 0
+            return
+        self._depth += 1
+        if self._depth == 1:
+            self._field = tag
+            self._buf = []
+            self._text_done = False
+        elif self._depth == 2:
+            # как у ElementTree: text — только до первого вложенного элемента
+            self._text_done = True
+
+    def data(self, text):
+        if self._depth == 1 and self._field is not None and not self._text_done:
+            self._buf.append(text)
+
+    def end(self, tag):
+        if self._row is None:
+            return
+        if self._depth == 0:
+            self.rows.append(self._row if self._factory is None else self._factory(self._row))
+            self._row = None
+            return
+        if self._depth == 1:
+            self._row[self._field] = ''.join(self._buf).strip()
+            self._field = None
+            self._buf = []
+        self._depth -= 1
+
+    def close(self):
+        return None
+
+
+class _EnvelopeTarget:
+    """target для внешнего SOAP-конверта: передаёт содержимое <...Result> во внутренний парсер."""
+
+    def __init__(self, result_tags: tuple, collector: _RowCollector):
+        self._result_tags = tuple(t.lower() for t in result_tags)
+        self._collector = collector
+        self._inner = None
+        self._level = 0          # глубина текущего элемента конверта (корень — 1)
+        self._result_level = 0   # глубина элемента-результата, пока мы внутри него
+        self._lead = True        # срезаем пробелы до начала внутреннего документа
+        self.found = False
+        self.has_content = False
+        self.done = False
+
+    @staticmethod
+    def _local(tag: str) -> str:
+        return tag.rsplit('}', 1)[-1]
+
+    def start(self, tag, attrib):
+        self._level += 1
+        if self._result_level:
+            # внутренний документ пришёл не строкой, а настоящими элементами
+            self.has_content = True
+            self._collector.start(self._local(tag))
+            return
+        if not self.found and self._local(tag).lower() in self._result_tags:
+            self.found = True
+            self._result_level = self._level
+
+    def data(self, text):
+        if self._result_level and self._level > self._result_level:
+            self._collector.data(text)
+            return
+        if not self._result_level:
+            # как прежний fallback: весь ответ — один элемент с экранированным XML в тексте
+            if self.found or self._level != 1 or not text.strip():
+                return
+            self.found = True
+            self._result_level = 1
+        if self._lead:
+            text = text.lstrip()
+            if not text:
+                return
+            self._lead = False
+        if self._inner is None:
+            self._inner = ET.XMLParser(target=self._collector)
+        self.has_content = True
+        try:
+            self._inner.feed(text)
+        except ET.ParseError:
+            raise SoapParseError("invalid_inner_xml")
+
+    def end(self, tag):
+        if self._result_level and self._level > self._result_level:
+            self._collector.end(self._local(tag))
+        elif self._result_level == self._level:
+            self._result_level = 0
+            self.done = True
+            if self._inner is not None:
+                try:
+                    self._inner.close()
+                except ET.ParseError:
+                    raise SoapParseError("invalid_inner_xml")
+                self._inner = None
+        self._level -= 1
+
+    def close(self):
+        return None
+
+
+def _chunks(body):
+    if isinstance(body, (bytes, bytearray, memoryview)):
+        view = memoryview(body)
+        for i in range(0, len(view), CHUNK_SIZE):
+            yield view[i:i + CHUNK_SIZE]
+    else:
+        yield from body
+
+
+def iter_rows(body, result_tag: str, row_tag: str, factory=None):
+    """
+    body — bytes ответа или итерируемое кусков bytes (например, r.iter_content()).
+    Отдаёт dict по каждой записи row_tag по мере разбора (или factory(dict), если задана).
+    SoapParseError("empty_or_invalid_inner" | "invalid_inner_xml") — как прежние ошибки сервисов.
+    """
+    collector = _RowCollector(row_tag, factory)
+    target = _EnvelopeTarget((result_tag, 'string'), collector)
+    parser = ET.XMLParser(target=target)
+    try:
+        for chunk in _chunks(body):
+            parser.feed(chunk)
+            if collector.rows:
+                yield from collector.rows
+                collector.rows.clear()
+        parser.close()
+    except ET.ParseError:
+        # битый конверт: если внутренний документ уже разобран — хвост неважен
+        if not (target.done and target.has_content):
+            raise SoapParseError("empty_or_invalid_inner")
+    yield from collector.rows
+    if not (target.found and target.has_content):
+        raise SoapParseError("empty_or_invalid_inner")
+
+
+def parse_rows(body, result_tag: str, row_tag: str, factory=None) -> list:
+    return list(iter_rows(body, result_tag, row_tag, factory))
@@ -1,3 +1,1164 @@
-from django.test import TestCase
+import asyncio
+import base64
+import gzip
+import json
+import logging
+import os
+import queue
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from cabinet import (async_transport, breaker, doctor_photos, doctor_service, logs, metrics, middleware, otp_service, services, session_backend, singleflight, soap_dialect,
+                     soap_ops, soap_parser, throttle, transport, user_cache, views)
+from cabinet.records import Doctor
+from cabinet.benchmarks import samples, suite
+from cabinet.doctor_index import doctor_index
+from cabinet.ref_cache import ReferenceCache, reference_cache
+
+
+class CabinetTestCase(SimpleTestCase):
+    """Без записи cabinet.auth в logs/login.log и консоль на время теста."""
+
+    def setUp(self):
+        quiet = mock.patch.object(logging.getLogger('cabinet.auth'), 'disabled', True)
+        quiet.start()
+        self.addCleanup(quiet.stop)
+
+
+class BenchmarkSuiteTests(CabinetTestCase):
+    """Случаи cabinet.benchmarks.suite: результат верный и не медленнее эталона больше THRESHOLD раз."""
+
+    def test_cases_build(self):
+        # сборка каждого случая проверяет его результат на записанном ответе
+        with ExitStack() as patches:
+            cases = suite.cases(patches)
+            for name, fn in cases.items():
+                with self.subTest(case=name):
+                    fn(1)
+
+    # замер по часам на общей CI-машине шумит — только по явному запросу
+    @unittest.skipUnless(os.environ.get('CABINET_RUN_BENCHMARKS'), "set CABINET_RUN_BENCHMARKS=1")
+    def test_no_regression(self):
+        baseline = suite.load_baseline()
+        if baseline is None:
+            self.skipTest("нет эталона: python manage.py benchmark --save-baseline")
+        result = suite.measure(repeat=3)
+        missing = set(result["cases"]) - set(baseline["cases"])
+        self.assertFalse(missing, f"случаев нет в эталоне, обновите его: {sorted(missing)}")
+        slow = suite.regressions(result, baseline)
+        self.assertFalse(slow, "медленнее эталона: " + "; ".join(
+            f"{row['case']} {row['ms']} мс (эталон {row['baseline_ms']}, x{row['ratio']})" for row in slow))
+
+
+@override_settings(REFERENCE_CACHE={'MAX_ENTRIES': 2, 'TTL': {'Op': 10}, 'STALE_WHILE_REVALIDATE': 20,
+                                    'STALE_IF_ERROR': 100})
+class ReferenceCacheTests(CabinetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = ReferenceCache()
+        clock = mock.patch('cabinet.ref_cache.time.monotonic', return_value=1000.0)
+        self.clock = clock.start()
+        self.addCleanup(clock.stop)
+        self.loader = mock.Mock(side_effect=lambda n: {"ok": True, "n": n})
+
+    def _get(self, key='a', n=1):
+        return self.cache.get_or_load(('Op', key), self.loader, n)
+
+    def _refreshes_done(self, count):
+        deadline = time.perf_counter() + 5                       # monotonic подменён
+        while self.cache.stats()["refreshes"] < count:
+            self.assertLess(time.perf_counter(), deadline, "timeout")
+            time.sleep(0.001)
+
+    def test_fresh_within_ttl(self):
+        self._get()
+        self.clock.return_value += 9
+        self.assertEqual(self._get(n=2), {"ok": True, "n": 1})
+        self.assertEqual(self.loader.call_count, 1)
+
+    def test_stale_while_revalidate(self):
+        self._get()
+        self.clock.return_value += 15
+        self.assertEqual(self._get(n=2), {"ok": True, "n": 1})   # старое сразу
+        self._refreshes_done(1)
+        self.assertEqual(self.loader.call_count, 2)
+        self.assertEqual(self._get(n=3), {"ok": True, "n": 2})   # обновлено в фоне
+        self.assertEqual(self.cache.stats()["stale_hits"], 1)
+
+    def test_expired_after_stale_window(self):
+        self._get()
+        self.clock.return_value += 31                            # TTL + STALE_WHILE_REVALIDATE
+        self.assertEqual(self._get(n=2), {"ok": True, "n": 2})
+        self.assertEqual(self.loader.call_count, 2)
+
+    def test_stale_if_error(self):
+        self._get()
+        self.loader.side_effect = lambda n: {"ok": False, "error": "http_status_500"}
+        self.clock.return_value += 50
+        self.assertEqual(self._get(), {"ok": True, "n": 1})
+        self.assertEqual(self.cache.stats()["stale_on_error"], 1)
+        self.clock.return_value += 61                            # дальше TTL + STALE_IF_ERROR
+        self.assertEqual(self._get(), {"ok": False, "error": "http_status_500"})
+
+    def test_errors_are_not_cached(self):
+        self.loader.side_effect = lambda n: {"ok": False, "error": "http_status_500"}
+        self._get()
+        self._get()
+        self.assertEqual(self.loader.call_count, 2)
+
+    def test_lru_eviction_calls_on_evict(self):
+        evicted = []
+        self.cache.on_evict(evicted.append)
+        self._get('a')
+        self._get('b')
+        self._get('a')                                           # a читали последней
+        self._get('c')
+        self.assertEqual(evicted, [('Op', 'b')])
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+        self.cache.invalidate(('Op', 'a'))
+        self.assertEqual(evicted, [('Op', 'b'), ('Op', 'a')])
+
+class DoctorIndexTests(CabinetTestCase):
+    def setUp(self):
+        super().setUp()
+        reference_cache.invalidate()
+        self.addCleanup(reference_cache.invalidate)
+
+    def _doctors(self, op, spec):
+        return {"ok": True, "doctors": [{"CUSTOMER_ID": f"{spec}-{i}", "NAME": "Ad"} for i in range(3)]}
+
+    @override_settings(REFERENCE_CACHE={'MAX_ENTRIES': 1})
+    def test_evicted_speciality_leaves_index(self):
+        with mock.patch.object(doctor_service.soap_ops, 'call', side_effect=self._doctors):
+            doctor_service.get_doctors_by_speciality('1')
+            self.assertEqual(doctor_index.get('1-0')[0], '1')
+            doctor_service.get_doctors_by_speciality('2')   # вытесняет список специальности 1
+        self.assertIsNone(doctor_index.get('1-0'))
+        self.assertEqual(doctor_index.get('2-2')[1]["CUSTOMER_ID"], '2-2')
+
+    def test_invalidate_clears_index(self):
+        with mock.patch.object(doctor_service.soap_ops, 'call', side_effect=self._doctors):
+            doctor_service.get_doctors_by_speciality('3')
+        reference_cache.invalidate(("GetDoctorsBySpecialtiy", '3'))
+        self.assertIsNone(doctor_index.get('3-1'))
+
+    @override_settings(REFERENCE_CACHE={'MAX_ENTRIES': 2})
+    def test_doctor_in_two_specialities_survives_eviction_of_one(self):
+        def doctors(op, spec):
+            shared = [{"CUSTOMER_ID": "shared"}] if spec in ('1', '2') else []
+            return {"ok": True, "doctors": [{"CUSTOMER_ID": f"{spec}-0"}] + shared}
+
+        with mock.patch.object(doctor_service.soap_ops, 'call', side_effect=doctors) as call:
+            doctor_service.get_doctors_by_speciality('1')
+            doctor_service.get_doctors_by_speciality('2')       # в индексе shared → 2
+            doctor_service.get_doctors_by_speciality('1')       # 1 читали последней, вытесняется 2
+            doctor_service.get_doctors_by_speciality('3')
+            self.assertEqual(call.call_count, 3)
+            self.assertIsNone(doctor_index.get('shared'))
+            result = asyncio.run(doctor_service.aget_doctor('shared', '1'))
+        self.assertEqual(call.call_count, 3)                    # список 1 — из кэша
+        self.assertEqual((result["ok"], result["speciality_id"]), (True, '1'))
+        self.assertEqual(doctor_index.get('shared')[0], '1')
+        self.assertEqual(asyncio.run(doctor_service.aget_doctor('nobody', '1'))["error"], "doctor_not_found")
+
+
+class OperationInnerTests(CabinetTestCase):
+    """Operation.inner принимает r.content (bytes), как его передают сервисы."""
+
+    INNER = '<DocumentElement><POLICY_INFORMATION><POLICY_NUMBER>P-1</POLICY_NUMBER></POLICY_INFORMATION></DocumentElement>'
+
+    def test_bytes_envelope(self):
+        body = samples.envelope("GetPolicyInformations", self.INNER)
+        self.assertIsInstance(body, bytes)
+        self.assertEqual(soap_ops.get("GetPolicyInformations").inner(body), self.INNER)
+
+    def test_declared_encoding(self):
+        body = samples.envelope("GetPolicyInformations", self.INNER.replace('P-1', 'Şəki'))
+        body = body.decode('utf-8').replace('encoding="utf-8"', 'encoding="utf-16"').encode('utf-16')
+        self.assertIn('Şəki', soap_ops.get("GetPolicyInformations").inner(body))
+
+
+class _Backend:
+    """requests.Session для transport.get_session: SOAP 1.2 — 500 (как у этого бэкенда), 1.1 — ответ Login."""
+
+    def __init__(self, soap11_status: int = 200):
+        self.soap11_status = soap11_status
+        self.calls = []
+
+    def post(self, url, data=None, headers=None, **kwargs):
+        soap12 = headers["Content-Type"].startswith('application/soap+xml')
+        self.calls.append('SOAP12' if soap12 else 'SOAP11')
+        r = requests.Response()
+        r.status_code = 500 if soap12 else self.soap11_status
+        r._content = b'<soap:Fault/>' if r.status_code != 200 else samples.login(True)
+        return r
+
+
+BACKEND_URL = 'http://backend.test/Svc.asmx'
+
+
+@override_settings(
+    EXTERNAL_AUTH={**settings.EXTERNAL_AUTH, 'URL': BACKEND_URL, 'DIALECT_CACHE': 'default'},
+    CIRCUIT_BREAKER={'ENABLED': True, 'WINDOW': 30, 'MIN_CALLS': 4, 'ERROR_RATE': 0.5,
+                     'SLOW_CALL_SECONDS': 5, 'SLOW_RATE': 0.8, 'OPEN_SECONDS': 20, 'HALF_OPEN_CALLS': 1},
+)
+class CircuitBreakerTests(CabinetTestCase):
+    def setUp(self):
+        super().setUp()
+        breaker.reset()
+        self.addCleanup(breaker.reset)
+        soap_dialect.forget(BACKEND_URL, 'Login')
+        self.addCleanup(soap_dialect.forget, BACKEND_URL, 'Login')
+
+    def _login(self, backend):
+        with mock.patch.object(transport, 'get_session', return_value=backend):
+            return services.external_login('ABC1234', 'P-1', '994501234567')
+
+    def test_dialect_probes_do_not_open_breaker(self):
+        # одновременные входы при холодном кэше диалекта, как у нового воркера
+        backend = _Backend()
+        with mock.patch.object(transport, 'get_session', return_value=backend), \
+                ThreadPoolExecutor(5) as pool:
+            results = list(pool.map(lambda _: services.external_login('ABC1234', 'P-1', '994501234567'), range(5)))
+        self.assertTrue(all(r["ok"] for r in results), results)
+        for _ in range(3):
+            soap_dialect.forget(BACKEND_URL, 'Login')
+            self.assertTrue(self._login(backend)["ok"])
+        self.assertGreaterEqual(backend.calls.count('SOAP12'), 6)
+        stats = breaker.get('Login', BACKEND_URL).stats()
+        self.assertEqual((stats["state"], stats["failures"]), (breaker.CLOSED, 0))
+
+    def test_last_dialect_failure_is_counted(self):
+        # все варианты отвечают 500 — бэкенд действительно болен
+        backend = _Backend(soap11_status=500)
+        for _ in range(4):
+            self.assertEqual(self._login(backend)["error"], "http_status_500")
+        self.assertEqual(breaker.get('Login', BACKEND_URL).state, breaker.OPEN)
+        calls = len(backend.calls)
+        self.assertEqual(self._login(backend)["error"], "backend_unavailable")
+        self.assertEqual(len(backend.calls), calls)
+
+    def test_opens_at_error_rate_after_min_calls(self):
+        b = breaker.CircuitBreaker('Op', BACKEND_URL)
+        for ok in (True, False, True):
+            b.acquire()
+            b.record(ok, 0.1)
+        self.assertEqual(b.state, breaker.CLOSED)   # меньше MIN_CALLS
+        b.acquire()
+        b.record(False, 0.1)                        # 2 из 4 — ERROR_RATE
+        self.assertEqual(b.state, breaker.OPEN)
+        with self.assertRaises(breaker.BackendUnavailable):
+            b.acquire()
+
+    def _opened(self, clock):
+        b = breaker.CircuitBreaker('Op', BACKEND_URL)
+        for _ in range(4):
+            b.acquire()
+            b.record(False, 0.1)
+        self.assertEqual(b.state, breaker.OPEN)
+        clock.return_value += 21                    # прошло OPEN_SECONDS
+        return b
+
+    @mock.patch.object(breaker.time, 'monotonic', return_value=1000.0)
+    def test_half_open_recovers(self, clock):
+        b = self._opened(clock)
+        b.acquire()
+        self.assertEqual(b.state, breaker.HALF_OPEN)
+        with self.assertRaises(breaker.BackendUnavailable):
+            b.acquire()                             # пробный вызов уже один в полёте
+        b.record(True, 0.1)
+        self.assertEqual(b.state, breaker.CLOSED)
+        b.acquire()
+
+    @mock.patch.object(breaker.time, 'monotonic', return_value=1000.0)
+    def test_half_open_failure_reopens(self, clock):
+        b = self._opened(clock)
+        b.acquire()
+        b.record(False, 0.1)
+        self.assertEqual(b.state, breaker.OPEN)
+        with self.assertRaises(breaker.BackendUnavailable):
+            b.acquire()
+
+    @mock.patch.object(breaker.time, 'monotonic', return_value=1000.0)
+    def test_released_probe_frees_half_open_slot(self, clock):
+        b = self._opened(clock)
+        b.acquire()
+        b.release()
+        b.acquire()
+        self.assertEqual(b.state, breaker.HALF_OPEN)
+
+
+
+@override_settings(EXTERNAL_AUTH={**settings.EXTERNAL_AUTH, 'URL': BACKEND_URL, 'DIALECT_CACHE': 'default'})
+class OtpDialectTests(CabinetTestCase):
+    def setUp(self):
+        super().setUp()
+        breaker.reset()
+        self.addCleanup(breaker.reset)
+        soap_dialect.forget(BACKEND_URL, 'CreateOTPAndSendSMS')
+        self.addCleanup(soap_dialect.forget, BACKEND_URL, 'CreateOTPAndSendSMS')
+
+    def _send(self, error):
+        session = mock.Mock()
+        session.post.side_effect = error
+        with mock.patch.object(transport, 'get_session', return_value=session):
+            result = otp_service.create_otp_and_send_sms('994501234567')
+        return result, session.post.call_count
+
+    def test_read_timeout_is_not_resent(self):
+        # бэкенд мог отправить SMS и не успеть ответить — второй диалект дал бы второе SMS
+        result, calls = self._send(requests.ReadTimeout("read timed out"))
+        self.assertEqual(calls, 1)
+        self.assertFalse(result["ok"])
+        self.assertTrue(result["error"].startswith("http_error"))
+        self.assertEqual(len(result["attempts"]), 1)
+
+    def test_connect_error_tries_next_dialect(self):
+        refused = requests.ConnectionError(MaxRetryError(None, BACKEND_URL, NewConnectionError(None, "refused")))
+        result, calls = self._send(refused)
+        self.assertEqual(calls, len(otp_service.OTP_DIALECTS))
+        self.assertEqual([a["dialect"] for a in result["attempts"]], list(otp_service.OTP_DIALECTS))
+
+
+
+class _DialectBackend(_Backend):
+    """Статус ответа по варианту SOAP: {'SOAP12': ..., 'SOAP12(action)': ..., 'SOAP11': ...}."""
+
+    def __init__(self, **statuses):
+        super().__init__()
+        self.statuses = statuses
+
+    def post(self, url, data=None, headers=None, **kwargs):
+        content_type = headers["Content-Type"]
+        if not content_type.startswith('application/soap+xml'):
+            dialect = 'SOAP11'
+        else:
+            dialect = 'SOAP12(action)' if 'action=' in content_type else 'SOAP12'
+        self.calls.append(dialect)
+        r = requests.Response()
+        r.status_code = self.statuses.get(dialect, 500)
+        r._content = samples.login(True) if r.status_code == 200 else b'<soap:Fault/>'
+        return r
+
+
+@override_settings(EXTERNAL_AUTH={**settings.EXTERNAL_AUTH, 'URL': BACKEND_URL, 'DIALECT_CACHE': 'default'})
+class SoapDialectTests(CabinetTestCase):
+    def setUp(self):
+        super().setUp()
+        breaker.reset()
+        self.addCleanup(breaker.reset)
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+
+    def _login(self, backend):
+        with mock.patch.object(transport, 'get_session', return_value=backend):
+            return services.external_login('ABC1234', 'P-1', '994501234567')
+
+    def test_remember_forget(self):
+        self.assertIsNone(soap_dialect.preferred(BACKEND_URL, 'Login'))
+        soap_dialect.remember(BACKEND_URL, 'Login', 'SOAP11')
+        self.assertEqual(soap_dialect.preferred(BACKEND_URL, 'Login'), 'SOAP11')
+        # ключ — пара (эндпоинт, операция), значение — в общем кэше, а не в памяти модуля
+        self.assertIsNone(soap_dialect.preferred(BACKEND_URL, 'CreateOTPAndSendSMS'))
+        self.assertIsNone(soap_dialect.preferred('http://other.test/Svc.asmx', 'Login'))
+        self.assertEqual(caches['default'].get(soap_dialect._key(BACKEND_URL, 'Login')), 'SOAP11')
+        soap_dialect.forget(BACKEND_URL, 'Login')
+        self.assertIsNone(soap_dialect.preferred(BACKEND_URL, 'Login'))
+
+    def test_ordered(self):
+        dialects = ('SOAP12', 'SOAP12(action)', 'SOAP11')
+        self.assertEqual(soap_dialect.ordered(dialects, None), list(dialects))
+        self.assertEqual(soap_dialect.ordered(dialects, 'SOAP11'), ['SOAP11', 'SOAP12', 'SOAP12(action)'])
+        self.assertEqual(soap_dialect.ordered(dialects, 'gone'), list(dialects))
+
+    def test_login_learns_dialect(self):
+        backend = _DialectBackend(SOAP11=200)
+        self.assertTrue(self._login(backend)["ok"])
+        self.assertEqual(backend.calls, ['SOAP12', 'SOAP12(action)', 'SOAP11'])
+        self.assertEqual(soap_dialect.preferred(BACKEND_URL, 'Login'), 'SOAP11')
+        backend.calls.clear()
+        self.assertTrue(self._login(backend)["ok"])
+        self.assertEqual(backend.calls, ['SOAP11'])
+
+    def test_remembered_dialect_failure_relearns(self):
+        soap_dialect.remember(BACKEND_URL, 'Login', 'SOAP11')
+        backend = _DialectBackend(SOAP11=500, **{'SOAP12(action)': 200})
+        self.assertTrue(self._login(backend)["ok"])
+        self.assertEqual(backend.calls, ['SOAP11', 'SOAP12', 'SOAP12(action)'])
+        self.assertEqual(soap_dialect.preferred(BACKEND_URL, 'Login'), 'SOAP12(action)')
+
+    def test_all_dialects_failing_forgets(self):
+        soap_dialect.remember(BACKEND_URL, 'Login', 'SOAP11')
+        self.assertEqual(self._login(_DialectBackend())["error"], "http_status_500")
+        self.assertIsNone(soap_dialect.preferred(BACKEND_URL, 'Login'))
+
+THROTTLE = {'ENABLED': True, 'CACHE': 'default', 'TRUSTED_PROXY_HEADER': None, 'TRUSTED_PROXIES': ('127.0.0.1',),
+            'LIMITS': {'ip': (4, 60), 'pin': (2, 300), 'phone': (3, 300)}}
+
+
+@override_settings(LOGIN_THROTTLE=THROTTLE)
+class LoginThrottleTests(CabinetTestCase):
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+
+    def _request(self, ip='10.0.0.1', **meta):
+        return RequestFactory().post('/login', REMOTE_ADDR=ip, **meta)
+
+    def test_client_ip_without_proxy_header(self):
+        request = self._request('10.0.0.1', HTTP_X_FORWARDED_FOR='1.2.3.4')
+        self.assertEqual(throttle.client_ip(request), '10.0.0.1')
+
+    @override_settings(LOGIN_THROTTLE={**THROTTLE, 'TRUSTED_PROXY_HEADER': 'HTTP_X_FORWARDED_FOR'})
+    def test_client_ip_from_trusted_proxy_header(self):
+        # левее — то, что прислал клиент; последний адрес дописал прокси
+        request = self._request('127.0.0.1', HTTP_X_FORWARDED_FOR='6.6.6.6, 203.0.113.7')
+        self.assertEqual(throttle.client_ip(request), '203.0.113.7')
+        self.assertEqual(throttle.client_ip(self._request('127.0.0.1')), '127.0.0.1')
+
+    @override_settings(LOGIN_THROTTLE={**THROTTLE, 'TRUSTED_PROXY_HEADER': 'HTTP_X_FORWARDED_FOR'})
+    def test_spoofed_header_from_untrusted_peer_is_ignored(self):
+        # напрямую, мимо прокси: клиент сам выбрал бы себе IP и обходил лимит
+        request = self._request('10.0.0.1', HTTP_X_FORWARDED_FOR='203.0.113.7')
+        self.assertEqual(throttle.client_ip(request), '10.0.0.1')
+        for i in range(4):
+            self.assertEqual(throttle.check(self._request('10.0.0.1', HTTP_X_FORWARDED_FOR=f'203.0.113.{i}')), 0)
+        self.assertGreater(throttle.check(self._request('10.0.0.1', HTTP_X_FORWARDED_FOR='203.0.113.9')), 0)
+
+    @override_settings(LOGIN_THROTTLE={**THROTTLE, 'TRUSTED_PROXY_HEADER': 'HTTP_X_FORWARDED_FOR'})
+    def test_clients_behind_proxy_have_separate_ip_limits(self):
+        for _ in range(4):
+            self.assertEqual(throttle.check(self._request('127.0.0.1', HTTP_X_FORWARDED_FOR='203.0.113.7')), 0)
+        self.assertGreater(throttle.check(self._request('127.0.0.1', HTTP_X_FORWARDED_FOR='203.0.113.7')), 0)
+        self.assertEqual(throttle.check(self._request('127.0.0.1', HTTP_X_FORWARDED_FOR='203.0.113.8')), 0)
+
+    def _check(self, ip='10.0.0.1', pin='', phone=''):
+        return throttle.check(self._request(ip), pin, phone)
+
+    @mock.patch.object(throttle.time, 'time', return_value=6000.0)
+    def test_ip_limit(self, clock):
+        for _ in range(4):
+            self.assertEqual(self._check(), 0)
+        self.assertGreater(self._check(), 0)
+        self.assertEqual(self._check('10.0.0.2'), 0)
+
+    @mock.patch.object(throttle.time, 'time', return_value=6000.0)
+    def test_pin_and_phone_limits_across_ips(self, clock):
+        for i in range(2):
+            self.assertEqual(self._check(f'10.0.1.{i}', pin='ABC1234'), 0)
+        self.assertGreater(self._check('10.0.1.9', pin='ABC1234'), 0)
+        for i in range(3):
+            self.assertEqual(self._check(f'10.0.2.{i}', phone='994501234567'), 0)
+        self.assertGreater(self._check('10.0.2.9', phone='994501234567'), 0)
+        self.assertGreater(throttle.stats()["rejected_by"].get("pin", 0), 0)
+
+    @mock.patch.object(throttle.time, 'time', return_value=6000.0)
+    def test_sliding_window_rollover(self, clock):
+        for _ in range(4):
+            self._check()
+        retry_after = self._check()
+        # 4 попытки в начале окна: через retry_after их вес 0.75 → 3 < 4 (отказ не засчитан)
+        self.assertEqual(retry_after, 75)
+        clock.return_value = 6060.0     # новый интервал: прошлый ещё весит целиком
+        self.assertGreater(self._check(), 0)
+        clock.return_value = 6000.0 + retry_after
+        self.assertEqual(self._check(), 0)
+        self.assertGreater(self._check(), 0)   # 3 + 1 — снова лимит
+        clock.return_value = 6180.0     # прошло два окна — счёт с нуля
+        for _ in range(4):
+            self.assertEqual(self._check(), 0)
+
+    @override_settings(LOGIN_THROTTLE={**THROTTLE, 'ENABLED': False})
+    def test_disabled(self):
+        for _ in range(10):
+            self.assertEqual(self._check(pin='ABC1234'), 0)
+
+
+class SoapParserTests(CabinetTestCase):
+    ROWS = ('<DocumentElement><POLICIES><POLICY_NUMBER>P-1</POLICY_NUMBER><STATUS>D</STATUS></POLICIES>'
+            '<POLICIES><POLICY_NUMBER>P-2</POLICY_NUMBER><STATUS> B </STATUS></POLICIES></DocumentElement>')
+    EXPECTED = [{"POLICY_NUMBER": "P-1", "STATUS": "D"}, {"POLICY_NUMBER": "P-2", "STATUS": "B"}]
+
+    def _rows(self, body):
+        return soap_parser.parse_rows(body, "GetCustomerPoliciesResult", "POLICIES")
+
+    def _code(self, body):
+        with self.assertRaises(soap_parser.SoapParseError) as cm:
+            self._rows(body)
+        return cm.exception.code
+
+    def test_rows(self):
+        self.assertEqual(self._rows(samples.envelope("GetCustomerPolicies", self.ROWS)), self.EXPECTED)
+
+    def test_chunks_split_anywhere(self):
+        body = samples.envelope("GetCustomerPolicies", self.ROWS.replace('P-1', 'Şəki'))
+        chunks = (body[i:i + 7] for i in range(0, len(body), 7))
+        self.assertEqual(self._rows(chunks)[0]["POLICY_NUMBER"], 'Şəki')
+
+    def test_string_fallback(self):
+        # ответ вида <string>экранированный XML</string> вместо <OpResult>
+        escaped = self.ROWS.replace('<', '&lt;').replace('>', '&gt;')
+        body = f'<?xml version="1.0" encoding="utf-8"?><string xmlns="http://tempuri.org/">{escaped}</string>'
+        self.assertEqual(self._rows(body.encode('utf-8')), self.EXPECTED)
+        self.assertEqual(soap_ops.get("GetCustomerPolicies").inner(body.encode('utf-8')), self.ROWS)
+
+    def test_latin1_declared_encoding(self):
+        body = samples.envelope("GetCustomerPolicies", self.ROWS.replace('P-1', 'Café'))
+        body = body.decode('utf-8').replace('encoding="utf-8"', 'encoding="ISO-8859-1"').encode('latin-1')
+        self.assertEqual(soap_parser.declared_encoding(body), 'iso8859-1')
+        self.assertEqual(self._rows(body)[0]["POLICY_NUMBER"], 'Café')
+        self.assertIn('Café', soap_ops.get("GetCustomerPolicies").inner(body))
+
+    def test_unknown_declared_encoding_falls_back_to_utf8(self):
+        self.assertEqual(soap_parser.declared_encoding(b'<?xml version="1.0" encoding="x-nope"?><a/>'), 'utf-8')
+
+    def test_error_codes(self):
+        self.assertEqual(self._code(samples.envelope("Login", self.ROWS)), "empty_or_invalid_inner")
+        self.assertEqual(self._code(samples.envelope("GetCustomerPolicies", "")), "empty_or_invalid_inner")
+        self.assertEqual(self._code(b'<soap:Envelope><soap:Bo'), "empty_or_invalid_inner")
+        broken = samples.envelope("GetCustomerPolicies", "<DocumentElement><POLICIES>")
+        self.assertEqual(self._code(broken), "invalid_inner_xml")
+
+    def test_truncated_envelope_after_complete_result(self):
+        body = samples.envelope("GetCustomerPolicies", self.ROWS)
+        body = body[:body.index(b'</GetCustomerPoliciesResponse>')]
+        self.assertEqual(self._rows(body), self.EXPECTED)
+
+    def test_parse_list_maps_errors(self):
+        op = soap_ops.get("GetCustomerPolicies")
+        self.assertEqual(op.parse_list(suite.Recorded(b'', 500)), {"ok": False, "error": "http_status_500"})
+        broken = samples.envelope("GetCustomerPolicies", "<DocumentElement><POLICIES>")
+        self.assertEqual(op.parse_list(suite.Recorded(broken)), {"ok": False, "error": "invalid_inner_xml"})
+
+
+class AsyncParseTests(CabinetTestCase):
+    """Большой ответ async_transport.soap11_call разбирает не в потоке event loop."""
+
+    def _parse_thread(self, size):
+        threads = []
+
+        def parse(r):
+            threads.append(threading.get_ident())
+            return {"ok": True}
+
+        async def main():
+            with mock.patch.object(async_transport, 'post', return_value=suite.Recorded(b'x' * size)):
+                result = await async_transport.soap11_call("GetDoctorsBySpecialtiy", b'', parse)
+            return result, threading.get_ident()
+
+        result, loop_thread = asyncio.run(main())
+        self.assertEqual(result, {"ok": True})
+        return threads[0] != loop_thread
+
+    @override_settings(EXTERNAL_AUTH={**settings.EXTERNAL_AUTH, 'ASYNC_INLINE_PARSE_BYTES': 1024})
+    def test_large_body_parsed_off_loop(self):
+        self.assertTrue(self._parse_thread(1025))
+
+    @override_settings(EXTERNAL_AUTH={**settings.EXTERNAL_AUTH, 'ASYNC_INLINE_PARSE_BYTES': 1024})
+    def test_small_body_parsed_inline(self):
+        self.assertFalse(self._parse_thread(1024))
+
+class SingleFlightTests(CabinetTestCase):
+    def _wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            self.assertLess(time.monotonic(), deadline, "timeout")
+            time.sleep(0.001)
+
+    def _coalesced(self, name):
+        return singleflight.stats()["operations"].get(name, {}).get("coalesced", 0)
+
+    def test_followers_share_one_call(self):
+        release = threading.Event()
+        calls = []
+
+        def fn():
+            calls.append(1)
+            release.wait(5)
+            return {"ok": True, "items": [1, 2]}
+
+        key = ("test_followers", "x")
+        with ThreadPoolExecutor(4) as pool:
+            futures = [pool.submit(singleflight.do, key, fn) for _ in range(4)]
+            self._wait_for(lambda: self._coalesced("test_followers") == 3)
+            release.set()
+            results = [f.result() for f in futures]
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(r == {"ok": True, "items": [1, 2]} for r in results))
+        self.assertEqual(len({id(r) for r in results}), 4)   # ждущим — копии dict
+
+    def test_followers_get_leader_exception(self):
+        release = threading.Event()
+
+        def fn():
+            release.wait(5)
+            raise RuntimeError("backend")
+
+        key = ("test_exception",)
+        with ThreadPoolExecutor(2) as pool:
+            futures = [pool.submit(singleflight.do, key, fn) for _ in range(2)]
+            self._wait_for(lambda: self._coalesced("test_exception") == 1)
+            release.set()
+            for f in futures:
+                with self.assertRaises(RuntimeError):
+                    f.result()
+
+    def test_async_followers_share_one_call(self):
+        calls = []
+
+        async def afn():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"ok": True}
+
+        async def main():
+            return await asyncio.gather(*(singleflight.ado(("test_async",), afn) for _ in range(5)))
+
+        self.assertEqual(asyncio.run(main()), [{"ok": True}] * 5)
+        self.assertEqual(len(calls), 1)
+
+    def test_side_effect_operations_are_not_coalesced(self):
+        self.assertEqual({name for name, op in soap_ops.registry().items() if not op.coalesce},
+                         {"Login", "CreateOTPAndSendSMS", "RegistrationForDoctor"})
+        release = threading.Event()
+        started = []
+
+        def soap11_call(action, *args, **kwargs):
+            started.append(action)
+            release.wait(5)
+            return {"ok": True}
+
+        with mock.patch.object(transport, 'soap11_call', side_effect=soap11_call), ThreadPoolExecutor(4) as pool:
+            futures = [pool.submit(soap_ops.call, "RegistrationForDoctor", "ABC1234", "123456/01", "10000")
+                       for _ in range(2)]
+            futures += [pool.submit(soap_ops.call, "GetSpecialities") for _ in range(2)]
+            # обе записи к врачу ушли в бэкенд, GetSpecialities — один раз
+            self._wait_for(lambda: started.count("RegistrationForDoctor") == 2 and "GetSpecialities" in started
+                           and self._coalesced("GetSpecialities") >= 1)
+            release.set()
+            for f in futures:
+                f.result()
+        self.assertEqual(started.count("GetSpecialities"), 1)
+
+
+@override_settings(SESSION_CACHE_ALIAS='default')
+class SessionStoreTests(CabinetTestCase):
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+        session = session_backend.SessionStore()
+        session.update({"loggedin": True, "login_attempts": 0, "tags": ["a"]})
+        session.save()
+        self.key = session.session_key
+
+    def _writes(self, fn):
+        before = session_backend.stats()
+        with mock.patch.object(caches['default'], 'set', wraps=caches['default'].set) as cache_set:
+            fn()
+        after = session_backend.stats()
+        return after["writes"] - before["writes"], after["skipped"] - before["skipped"], cache_set.call_count
+
+    def test_unchanged_session_is_not_written(self):
+        session = session_backend.SessionStore(self.key)
+        session["login_attempts"] = 0            # присвоили то же значение — modified, но данные те же
+        self.assertTrue(session.modified)
+        self.assertEqual(self._writes(session.save), (0, 1, 0))
+
+    def test_changed_session_is_written(self):
+        session = session_backend.SessionStore(self.key)
+        session["login_attempts"] = 1
+        self.assertEqual(self._writes(session.save), (1, 0, 1))
+        self.assertEqual(session_backend.SessionStore(self.key)["login_attempts"], 1)
+
+    def test_nested_change_is_written(self):
+        session = session_backend.SessionStore(self.key)
+        session["tags"].append("b")              # изменение внутри значения, без присваивания
+        self.assertEqual(self._writes(session.save), (1, 0, 1))
+        self.assertEqual(session_backend.SessionStore(self.key)["tags"], ["a", "b"])
+
+    def test_async_save(self):
+        async def unchanged():
+            session = session_backend.SessionStore(self.key)
+            await session.aset("loggedin", True)
+            await session.asave()
+
+        async def changed():
+            session = session_backend.SessionStore(self.key)
+            await session.aset("loggedin", False)
+            await session.asave()
+
+        self.assertEqual(self._writes(lambda: asyncio.run(unchanged())), (0, 1, 0))
+        self.assertEqual(self._writes(lambda: asyncio.run(changed())), (1, 0, 1))
+
+
+class SessionFileCacheTests(CabinetTestCase):
+    def _cache(self, max_entries=3):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        return session_backend.SessionFileCache(tmp.name, {
+            'TIMEOUT': None, 'OPTIONS': {'MAX_ENTRIES': max_entries, 'CULL_INTERVAL': 0},
+        })
+
+    def test_live_sessions_are_not_culled(self):
+        cache = self._cache()
+        for i in range(6):
+            cache.set(f's{i}', {"loggedin": True}, 3600)
+        self.assertEqual([cache.get(f's{i}') for i in range(6)], [{"loggedin": True}] * 6)
+
+    def test_expired_sessions_are_culled(self):
+        cache = self._cache()
+        with mock.patch('time.time', return_value=1000.0):
+            for i in range(3):
+                cache.set(f'old{i}', {"loggedin": True}, 10)
+        cache.set('live', {"loggedin": True}, 3600)           # над лимитом: проход по файлам
+        self.assertEqual(len(cache._list_cache_files()), 1)
+        self.assertEqual(cache.get('live'), {"loggedin": True})
+
+@override_settings(SESSION_CACHE_ALIAS='default', USER_CACHE={'TTL': 60, 'PREFETCH': False})
+class UserCacheTests(CabinetTestCase):
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+        self.fetch = mock.Mock(side_effect=lambda pin: {"ok": True, "policies": [pin]})
+
+    def _request(self, pin='ABC1234'):
+        request = RequestFactory().get('/api/policies')
+        request.session = session_backend.SessionStore()
+        request.session.update({"loggedin": True, "pinCode": pin})
+        request.session.save()
+        return request
+
+    def _get(self, request, pin='ABC1234'):
+        return user_cache.get_or_fetch(request, 'policies', self.fetch, pin)
+
+    def test_cached_per_session(self):
+        request = self._request()
+        self.assertEqual(self._get(request), {"ok": True, "policies": ['ABC1234']})
+        self._get(request)
+        self.assertEqual(self.fetch.call_count, 1)
+        self._get(self._request())                  # та же PIN, другая сессия — свой ключ
+        self.assertEqual(self.fetch.call_count, 2)
+
+    def test_scoped_to_pin(self):
+        request = self._request()
+        self._get(request, 'ABC1234')
+        self.assertEqual(self._get(request, 'XYZ9876'), {"ok": True, "policies": ['XYZ9876']})
+        self.assertEqual(self.fetch.call_count, 2)
+
+    def test_pin_not_in_key(self):
+        request = self._request()
+        key = user_cache._key(request, 'policies', 'ABC1234')
+        self.assertNotIn('ABC1234', key)
+        self.assertNotIn(request.session.session_key, key)
+
+    def test_errors_are_not_cached(self):
+        request = self._request()
+        self.fetch.side_effect = lambda pin: {"ok": False, "error": "http_error"}
+        self._get(request)
+        self._get(request)
+        self.assertEqual(self.fetch.call_count, 2)
+
+    def test_invalidate(self):
+        request = self._request()
+        self._get(request)
+        user_cache.invalidate(request)
+        self._get(request)
+        self.assertEqual(self.fetch.call_count, 2)
+
+    def test_without_session_key_not_cached(self):
+        request = RequestFactory().get('/api/policies')
+        request.session = session_backend.SessionStore()
+        self._get(request)
+        self._get(request)
+        self.assertEqual(self.fetch.call_count, 2)
+
+    def test_async_shares_entries(self):
+        request = self._request()
+        self._get(request)
+
+        async def afetch(pin):
+            raise AssertionError("должно прийти из кэша")
+
+        result = asyncio.run(user_cache.aget_or_fetch(request, 'policies', afetch, 'ABC1234'))
+        self.assertEqual(result["policies"], ['ABC1234'])
+
+
+@override_settings(SESSION_CACHE_ALIAS='default', USER_CACHE={'TTL': 60, 'PREFETCH': True, 'PREFETCH_MAX_CONCURRENT': 2})
+class UserCachePrefetchTests(CabinetTestCase):
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+
+    def test_prefetches_over_limit_are_queued(self):
+        release = threading.Event()
+        lock = threading.Lock()
+        running = []
+        peak = []
+
+        def fetch(pin):
+            with lock:
+                running.append(pin)
+                peak.append(len(running))
+            release.wait(5)
+            with lock:
+                running.remove(pin)
+            return {"ok": True, "pin": pin}
+
+        sessions = []
+        with mock.patch.object(user_cache, 'PREFETCH', (('policies', fetch),)):
+            for i in range(3):                      # PREFETCH_MAX_CONCURRENT + 1
+                request = RequestFactory().get('/')
+                request.session = session_backend.SessionStore()
+                request.session.save()
+                self.assertEqual(user_cache.prefetch(request, f'PIN{i}'), 1)
+                sessions.append(request)
+            deadline = time.monotonic() + 5
+            while user_cache.stats()["prefetch_running"] < 2:
+                self.assertLess(time.monotonic(), deadline, "timeout")
+                time.sleep(0.001)
+            release.set()
+            for i, request in enumerate(sessions):
+                key = user_cache._key(request, 'policies', f'PIN{i}')
+                while caches['default'].get(key) is None:
+                    self.assertLess(time.monotonic(), deadline + 5, "prefetch не завершился")
+                    time.sleep(0.001)
+        self.assertLessEqual(max(peak), 2)
+
+class QueueListenerTests(CabinetTestCase):
+    def _logger(self, handler_level=logging.INFO, size=0):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'login.log')
+        target = logging.FileHandler(self.path, delay=True)
+        target.setLevel(handler_level)
+        target.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+        self.addCleanup(target.close)
+        q = queue.Queue(size)
+        listener = logs.QueueListener(q, target, batch=4)
+        logger = logging.getLogger(f'cabinet.test.{self._testMethodName}')
+        logger.propagate = False
+        logger.setLevel(logging.DEBUG)
+        logger.handlers = [logs.QueueHandler(q)]
+        self.addCleanup(setattr, logger, 'handlers', [])
+        return logger, listener
+
+    def _lines(self):
+        with open(self.path, encoding='utf-8') as f:
+            return f.read().splitlines()
+
+    def test_batches_keep_order_and_levels(self):
+        logger, listener = self._logger(handler_level=logging.INFO)
+        listener.start()
+        for i in range(10):
+            logger.debug("skip %s", i)
+            logger.info("row %s: %s", i, {"ok": True})
+        listener.stop()
+        self.assertEqual(self._lines(), [f"INFO row {i}: {{'ok': True}}" for i in range(10)])
+
+    def test_args_are_snapshotted(self):
+        logger, listener = self._logger()
+        result = {"ok": True}
+        logger.info("parsed: %s", result)
+        result["attempts"] = []           # дополнили после вызова логгера
+        listener.start()
+        listener.stop()
+        self.assertEqual(self._lines(), ["INFO parsed: {'ok': True}"])
+
+    def test_stop_with_full_queue(self):
+        logger, listener = self._logger(size=3)
+        for i in range(5):
+            logger.info("row %s", i)      # две последние отброшены, запрос не ждёт
+        listener.start()
+        listener.stop()
+        self.assertEqual(self._lines(), ["INFO row 0", "INFO row 1", "INFO row 2"])
+
+
+@override_settings(SESSION_CACHE_ALIAS='default', USER_CACHE={'TTL': 60, 'PREFETCH': False})
+class PolicyDetailTests(CabinetTestCase):
+    def test_shared_backend_result_is_not_mutated(self):
+        shared = {"ok": True, "data": {"POLICY_NUMBER": "P-1", "INSURANCE_CODE": "TI"}}
+        policies = {"ok": True, "policies": [{"POLICY_NUMBER": "P-1", "STATUS": "D"}]}
+        request = RequestFactory().get('/policies/P-1')
+        request.session = session_backend.SessionStore()
+        request.session.update({"loggedin": True, "pinCode": "ABC1234"})
+        with mock.patch.object(views, 'get_policy_informations', return_value=shared), \
+                mock.patch.object(views, 'get_customer_policies', return_value=policies):
+            response = views.policy_detail(request, 'P-1')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("STATUS", shared["data"])    # статус из списка — только в ответе
+
+@override_settings(SESSION_CACHE_ALIAS='default')
+class DoctorPhotoTests(CabinetTestCase):
+    PHOTO = b'\xff\xd8\xff\xe0 jpeg'
+
+    def setUp(self):
+        super().setUp()
+        content = base64.b64encode(self.PHOTO).decode('ascii')
+        self.hash = doctor_photos.photo_hash(content)
+        doctors = {"ok": True, "doctors": [Doctor.from_row({"CUSTOMER_ID": "7", "FILE_CONTENT": content})]}
+        patcher = mock.patch.object(views, 'aget_doctors_by_speciality', return_value=doctors)
+        self.load = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _get(self, photo_hash=None, doctor_id='7', **headers):
+        request = RequestFactory().get('/api/doctor-photo', headers=headers)
+        request.session = session_backend.SessionStore()
+        request.session["loggedin"] = True
+        return asyncio.run(views.api_doctor_photo(request, '1', doctor_id, photo_hash or self.hash))
+
+    def test_photo(self):
+        response = self._get()
+        self.assertEqual((response.status_code, response.content), (200, self.PHOTO))
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['ETag'], f'"{self.hash}"')
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_if_none_match(self):
+        response = self._get(If_None_Match=f'"other", "{self.hash}"')
+        self.assertEqual((response.status_code, response.content), (304, b''))
+        self.assertEqual(response['ETag'], f'"{self.hash}"')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.load.assert_not_called()                           # 304 без похода за списком
+        self.assertEqual(self._get(If_None_Match='"other"').status_code, 200)
+
+    def test_unknown_hash_or_doctor(self):
+        self.assertEqual(self._get(photo_hash='0' * 16).status_code, 404)
+        self.assertEqual(self._get(doctor_id='8').status_code, 404)
+
+@override_settings(API_RESPONSES={**settings.API_RESPONSES, 'COMPRESS_MIN_BYTES': 100})
+class CompressionMiddlewareTests(CabinetTestCase):
+    BODY = b'{"ok": true, "items": [' + b', '.join(b'"item"' for _ in range(100)) + b']}'
+
+    def _respond(self, response, accept='gzip'):
+        request = RequestFactory().get('/api/x', HTTP_ACCEPT_ENCODING=accept)
+        return middleware.CompressionMiddleware(lambda r: response)(request)
+
+    def _json(self, body=None, **headers):
+        response = HttpResponse(self.BODY if body is None else body, content_type='application/json')
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    @unittest.skipIf(middleware.brotli is None, "brotli не установлен")
+    def test_choose_encoding_prefers_br(self):
+        self.assertEqual(middleware.choose_encoding('gzip, deflate, br'), 'br')
+        self.assertEqual(middleware.choose_encoding('*'), 'br')
+        self.assertEqual(middleware.choose_encoding('br;q=0, gzip'), 'gzip')
+        self.assertEqual(middleware.choose_encoding('gzip;q=0.5, br;q=0.4'), 'gzip')
+
+    def test_choose_encoding(self):
+        self.assertEqual(middleware.choose_encoding('gzip, deflate'), 'gzip')
+        self.assertIsNone(middleware.choose_encoding(''))
+        self.assertIsNone(middleware.choose_encoding('identity'))
+        self.assertIsNone(middleware.choose_encoding('gzip;q=0'))
+        self.assertIsNone(middleware.choose_encoding('*;q=0'))
+        self.assertIsNone(middleware.choose_encoding('gzip;q=0, identity'))
+        with mock.patch.object(middleware, 'brotli', None):
+            self.assertEqual(middleware.choose_encoding('br, gzip;q=0.1'), 'gzip')
+            self.assertIsNone(middleware.choose_encoding('br'))
+
+    def test_gzip(self):
+        response = self._respond(self._json(ETag='"abc"'), 'gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), self.BODY)
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+        self.assertEqual(response['ETag'], 'W/"abc"')
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    @unittest.skipIf(middleware.brotli is None, "brotli не установлен")
+    def test_br(self):
+        response = self._respond(self._json(), 'gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(middleware.brotli.decompress(response.content), self.BODY)
+
+    def test_identity_and_small_bodies_are_not_compressed(self):
+        for accept, body in (('identity', None), ('gzip;q=0', None), ('gzip', b'{"ok": true}')):
+            with self.subTest(accept=accept):
+                response = self._respond(self._json(body), accept)
+                self.assertFalse(response.has_header('Content-Encoding'))
+                self.assertIn(response.content, (self.BODY, b'{"ok": true}'))
+                self.assertIn('Accept-Encoding', response['Vary'])   # ответ зависит от заголовка
+
+    def test_skips_encoded_streaming_and_other_types(self):
+        encoded = self._respond(self._json(**{'Content-Encoding': 'br'}))
+        self.assertEqual((encoded['Content-Encoding'], encoded.content), ('br', self.BODY))
+        streaming = self._respond(StreamingHttpResponse(iter([self.BODY]), content_type='application/json'))
+        self.assertFalse(streaming.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(streaming.streaming_content), self.BODY)
+        html = self._respond(HttpResponse(self.BODY, content_type='text/html'))
+        self.assertFalse(html.has_header('Content-Encoding'))
+
+@override_settings(SESSION_CACHE_ALIAS='default', USER_CACHE={'TTL': 60, 'PREFETCH': False},
+                   POLICY_INFO_BATCH={'MAX_ITEMS': 3, 'CONCURRENCY': 2})
+class PolicyInfoBatchTests(CabinetTestCase):
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+
+    def _post(self, numbers):
+        request = RequestFactory().post('/api/policy-info/batch', {"policyNumbers": numbers})
+        request.session = session_backend.SessionStore()
+        request.session["loggedin"] = True
+        response = asyncio.run(views.api_policy_info_batch(request))
+        return response.status_code, json.loads(response.content)
+
+    async def _info(self, number):
+        if number == 'P-2':
+            return {"ok": False, "error": "http_status_500"}
+        if number == 'P-3':
+            raise RuntimeError("parse")
+        return {"ok": True, "data": {"POLICY_NUMBER": number}}
+
+    def test_item_errors_do_not_fail_batch(self):
+        with mock.patch.object(views, 'aget_policy_informations', side_effect=self._info) as info:
+            status, body = self._post(['P-1', ' P-1 ', 'P-2', 'P-3', ''])
+        self.assertEqual(status, 200)
+        self.assertEqual(info.await_count, 3)          # дубли и пустые — один раз
+        self.assertEqual(list(body["results"]), ['P-1', 'P-2', 'P-3'])
+        self.assertEqual(body["results"]["P-1"], {"ok": True, "data": {"POLICY_NUMBER": "P-1"}})
+        self.assertEqual(body["results"]["P-2"], {"ok": False, "error": "http_status_500"})
+        self.assertFalse(body["results"]["P-3"]["ok"])
+        self.assertTrue(body["results"]["P-3"]["error"].startswith("internal_error"))
+
+    def test_max_items(self):
+        with mock.patch.object(views, 'aget_policy_informations', side_effect=self._info) as info:
+            self.assertEqual(self._post(['P-1', 'P-4', 'P-5', 'P-6']), (400, {"error": "too_many_policy_numbers"}))
+            self.assertEqual(self._post(['P-1', 'P-4', 'P-5', 'P-5'])[0], 200)     # 3 после удаления дублей
+            self.assertEqual(self._post([' ', '']), (400, {"error": "policy_numbers_required"}))
+        self.assertEqual(info.await_count, 3)
+
+
+@override_settings(SESSION_CACHE_ALIAS='default', USER_CACHE={'TTL': 60, 'PREFETCH': False})
+class DashboardTests(CabinetTestCase):
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+
+    def _get(self, sections):
+        request = RequestFactory().get('/api/dashboard')
+        request.session = session_backend.SessionStore()
+        request.session.update({"loggedin": True, "pinCode": "ABC1234"})
+        request.session.save()
+        with mock.patch.dict(views.DASHBOARD_SECTIONS, sections):
+            response = asyncio.run(views.api_dashboard(request))
+        return response.status_code, json.loads(response.content)
+
+    def test_failed_sections_keep_others(self):
+        async def policies(pin):
+            await asyncio.sleep(0.01)
+            return {"ok": True, "policies": [{"POLICY_NUMBER": "P-1"}]}
+
+        async def medical(pin):
+            return {"ok": False, "error": "http_error: ReadTimeout"}
+
+        async def non_medical(pin):
+            raise RuntimeError("boom")
+
+        status, body = self._get({'policies': policies, 'medical_complaints': medical,
+                                  'non_medical_complaints': non_medical})
+        self.assertEqual(status, 200)
+        self.assertFalse(body["ok"])
+        sections = body["sections"]
+        self.assertEqual(sections["policies"]["policies"], [{"POLICY_NUMBER": "P-1"}])
+        self.assertEqual(sections["medical_complaints"]["error"], "http_error: ReadTimeout")
+        self.assertIn("ms", sections["medical_complaints"])
+        self.assertTrue(sections["non_medical_complaints"]["error"].startswith("internal_error"))
+
+    def test_all_sections_failed(self):
+        async def down(pin):
+            return {"ok": False, "error": "backend_unavailable"}
+
+        status, body = self._get(dict.fromkeys(views.DASHBOARD_SECTIONS, down))
+        self.assertEqual(status, 502)
+        self.assertEqual({s["error"] for s in body["sections"].values()}, {"backend_unavailable"})
+
+class MetricsRenderTests(CabinetTestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        self.pid = os.getpid()
+
+    def _lines(self, prefix):
+        return [line for line in metrics.render().splitlines() if line.startswith(prefix)]
+
+    def test_histogram(self):
+        for seconds in (0.005, 0.02, 0.02, 45):
+            metrics.PARSE_SECONDS.observe(seconds, 'GetSpecialities')
+        lines = self._lines('cabinet_backend_parse_seconds')
+        op, pid = 'operation="GetSpecialities"', f'pid="{self.pid}"'
+        buckets = [line for line in lines if '_bucket' in line]
+        self.assertEqual(len(buckets), len(metrics.LATENCY_BUCKETS) + 1)
+        self.assertEqual(buckets[0], f'cabinet_backend_parse_seconds_bucket{{{op},le="0.005",{pid}}} 1')  # le включительно
+        self.assertEqual(buckets[2], f'cabinet_backend_parse_seconds_bucket{{{op},le="0.025",{pid}}} 3')
+        self.assertEqual(buckets[-2], f'cabinet_backend_parse_seconds_bucket{{{op},le="30",{pid}}} 3')
+        self.assertEqual(buckets[-1], f'cabinet_backend_parse_seconds_bucket{{{op},le="+Inf",{pid}}} 4')
+        counts = [int(line.rsplit(' ', 1)[1]) for line in buckets]
+        self.assertEqual(counts, sorted(counts))                  # накопленные
+        self.assertEqual(lines[-2], f'cabinet_backend_parse_seconds_sum{{{op},{pid}}} 45.045')
+        self.assertEqual(lines[-1], f'cabinet_backend_parse_seconds_count{{{op},{pid}}} 4')
+
+    def test_help_type_and_counter(self):
+        metrics.BACKEND_ERRORS.inc('Login', 'http_error')
+        metrics.BACKEND_ERRORS.inc('Login', 'http_error')
+        text = metrics.render()
+        self.assertIn('# HELP cabinet_backend_errors_total Backend calls that ended with ok=False\n'
+                      '# TYPE cabinet_backend_errors_total counter\n'
+                      f'cabinet_backend_errors_total{{operation="Login",error="http_error",pid="{self.pid}"}} 2\n',
+                      text)
+        self.assertIn('# TYPE cabinet_view_seconds histogram\n', text)
+        self.assertTrue(text.endswith('\n'))
+
+    def test_label_escaping(self):
+        metrics.LOGIN_THROTTLED.inc('a"b\\c\nd')
+        self.assertEqual(self._lines('cabinet_login_throttled_total{'),
+                         [f'cabinet_login_throttled_total{{scope="a\\"b\\\\c\\nd",pid="{self.pid}"}} 1'])
+
+    def test_error_category(self):
+        self.assertEqual(metrics.error_category("http_error: ReadTimeout(...)"), "http_error")
+        self.assertEqual(metrics.error_category("http_status_500"), "http_status_500")
+        self.assertEqual(metrics.error_category("Polis tapılmadı"), "backend_message")
+        self.assertEqual(metrics.error_category(None), "unknown_error")
+
+class InternalEndpointsTests(CabinetTestCase):
+    def _get(self, view, **meta):
+        return view(RequestFactory().get('/internal/', REMOTE_ADDR='127.0.0.1', **meta))
+
+    def test_direct_local_request(self):
+        self.assertEqual(self._get(views.backend_status).status_code, 200)
+        self.assertEqual(self._get(views.prometheus_metrics).status_code, 200)
+
+    def test_proxied_request_is_forbidden(self):
+        # за прокси REMOTE_ADDR — 127.0.0.1 у всех; клиент из интернета виден по заголовку прокси
+        for view in (views.backend_status, views.prometheus_metrics):
+            with self.subTest(view=view.__name__):
+                self.assertEqual(self._get(view, HTTP_X_FORWARDED_FOR='203.0.113.7').status_code, 403)
+                self.assertEqual(self._get(view, HTTP_X_REAL_IP='203.0.113.7').status_code, 403)
+
+    def test_other_address_is_forbidden(self):
+        request = RequestFactory().get('/internal/', REMOTE_ADDR='203.0.113.7')
+        self.assertEqual(views.prometheus_metrics(request).status_code, 403)
+
+    @override_settings(INTERNAL_ENDPOINTS={**settings.INTERNAL_ENDPOINTS, 'TOKEN': 's3cret'})
+    def test_token(self):
+        self.assertEqual(self._get(views.prometheus_metrics).status_code, 403)
+        self.assertEqual(self._get(views.prometheus_metrics, HTTP_AUTHORIZATION='Bearer nope').status_code, 403)
+        self.assertEqual(self._get(views.prometheus_metrics, HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
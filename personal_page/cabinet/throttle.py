@@ -0,0 +1,129 @@
+import logging
+import math
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.crypto import salted_hmac
+
+from . import metrics
+
+logger = logging.getLogger('cabinet.auth')
+
+
+# Допуск попыток входа до похода в SOAP (Login стоит до трёх запросов к бэкенду и воркер).
+# Счётчик login_attempts в сессии бот обходит, выбрасывая cookie, поэтому лимиты — по IP,
+# PIN и телефону в общем для всех воркеров кэше (CACHES[LOGIN_THROTTLE['CACHE']]).
+#
+# Скользящее окно из двух счётчиков: текущий фиксированный интервал плюс предыдущий
+# с весом оставшейся доли окна. Два ключа на (scope, значение), incr/add — атомарны
+# в Redis и LocMem, на файловом кэше счёт приблизительный (хватает для отсечения ботов).
+# PIN и телефон в ключах не хранятся — только HMAC.
+
+_lock = threading.Lock()
+_counters = {"allowed": 0, "rejected": 0}
+_rejected_by_scope: dict = {}
+
+
+def _cfg() -> dict:
+    return getattr(settings, 'LOGIN_THROTTLE', {})
+
+
+def _cache():
+    return caches[_cfg().get('CACHE', 'default')]
+
+
+def _key(scope: str, value: str, window: int, index: int) -> str:
+    digest = salted_hmac('cabinet.throttle', f"{scope}:{value}").hexdigest()
+    return f"cabinet:throttle:{scope}:{window}:{digest}:{index}"
+
+
+def client_ip(request) -> str:
+    """
+    IP для лимита 'ip'. Если запрос пришёл от TRUSTED_PROXIES и задан TRUSTED_PROXY_HEADER —
+    последний адрес в заголовке: его дописал наш прокси, а то, что левее, клиент может
+    прислать сам. Иначе — REMOTE_ADDR (напрямую клиент заголовком выбрал бы себе любой IP).
+    """
+    cfg = _cfg()
+    remote = request.META.get('REMOTE_ADDR') or ''
+    header = cfg.get('TRUSTED_PROXY_HEADER')
+    if header and remote in cfg.get('TRUSTED_PROXIES', ()):
+        ip = request.META.get(header, '').rsplit(',', 1)[-1].strip()
+        if ip:
+            return ip
+    return remote
+
+
+def _window_counts(cache, scope: str, value: str, window: int, now: float) -> tuple[int, int, str]:
+    index = int(now // window)
+    current_key = _key(scope, value, window, index)
+    previous_key = _key(scope, value, window, index - 1)
+    got = cache.get_many([current_key, previous_key])
+    return got.get(current_key, 0), got.get(previous_key, 0), current_key
+
+
+def _retry_after(current: int, previous: int, limit: int, window: int, now: float) -> int:
+    # когда вес предыдущего интервала упадёт настолько, что пустим ещё одну попытку
+    elapsed = now % window
+    if current >= limit:
+        # ждать следующего интервала, где текущий станет «предыдущим» и начнёт убывать
+        return max(1, math.ceil(window - elapsed + (1 - (limit - 1) / current) * window))
+    weight = (limit - 1 - current) / previous
+    return max(1, math.ceil((1 - weight) * window - elapsed))
+
+
+def check(request, pin: str = '', phone: str = '') -> int:
+    """0 — попытку пускаем (и засчитываем); иначе — через сколько секунд повторить."""
+    cfg = _cfg()
+    if not cfg.get('ENABLED', True):
+        return 0
+    keys = {'ip': client_ip(request), 'pin': pin, 'phone': phone}
+    cache = _cache()
+    now = time.time()
+
+    hits = []
+    for scope, (limit, window) in cfg.get('LIMITS', {}).items():
+        value = keys.get(scope)
+        if not value:
+            continue
+        limit, window = int(limit), int(window)
+        current, previous, current_key = _window_counts(cache, scope, value, window, now)
+        if previous * (1 - (now % window) / window) + current >= limit:
+            retry_after = _retry_after(current, previous, limit, window, now)
+            with _lock:
+                _counters["rejected"] += 1
+                _rejected_by_scope[scope] = _rejected_by_scope.get(scope, 0) + 1
+            metrics.LOGIN_THROTTLED.inc(scope)
+            logger.warning("login throttled by %s (ip=%s), retry in %ss", scope, keys['ip'], retry_after)
+            return retry_after
+        hits.append((current_key, window))
+
+    # засчитываем только пропущенные попытки: отказ ничего не стоит и окно не продлевает
+    for current_key, window in hits:
+        # ключ живёт два окна: текущее и следующее (там он — «предыдущий»)
+        if not cache.add(current_key, 1, window * 2):
+            try:
+                cache.incr(current_key)
+            except ValueError:      # истёк между add и incr
+                cache.add(current_key, 1, window * 2)
+    with _lock:
+        _counters["allowed"] += 1
+    return 0
+
+
+def stats() -> dict:
+    with _lock:
+        out = dict(_counters)
+        out["rejected_by"] = dict(_rejected_by_scope)
+    return out
+
+
+def _after_fork_in_child() -> None:
+    global _lock
+    _lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
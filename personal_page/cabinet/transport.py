@@ -0,0 +1,203 @@
+import logging
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError
+from urllib3.util.retry import Retry
+from django.conf import settings
+
+from . import breaker, metrics
+
+logger = logging.getLogger('cabinet.auth')
+
+# Один пул keep-alive соединений на процесс-воркер: все сервисы ходят в один и тот же
+# .asmx, поэтому TCP/TLS рукопожатие делаем один раз, а не на каждый вызов.
+_session: requests.Session | None = None
+_lock = threading.Lock()
+
+
+def _cfg() -> dict:
+    return settings.EXTERNAL_AUTH
+
+
+def _build_session() -> requests.Session:
+    cfg = _cfg()
+    pool_size = int(cfg.get('POOL_SIZE', 10))
+    retries = int(cfg.get('RETRIES', 2))
+
+    # Повторяем только ошибки соединения (запрос ещё не ушёл на сервер).
+    # POST не идемпотентен (CreateOTPAndSendSMS шлёт SMS), поэтому read/status — без повторов.
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=0,
+        status=0,
+        other=0,
+        backoff_factor=float(cfg.get('RETRY_BACKOFF', 0.2)),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=int(cfg.get('POOL_CONNECTIONS', 2)),
+        pool_maxsize=pool_size,
+        max_retries=retry,
+        pool_block=bool(cfg.get('POOL_BLOCK', False)),
+    )
+    s = requests.Session()
+    s.mount('https://', adapter)
+    s.mount('http://', adapter)
+    s.verify = cfg.get('VERIFY_SSL', True)
+    return s
+
+
+def get_session() -> requests.Session:
+    global _session
+    s = _session
+    if s is None:
+        with _lock:
+            if _session is None:
+                _session = _build_session()
+            s = _session
+    return s
+
+
+def _after_fork_in_child() -> None:
+    # сокеты родителя (gunicorn --preload) дочерним воркерам не нужны
+    global _session, _lock
+    _session = None
+    _lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def timeouts() -> tuple[float, float]:
+    cfg = _cfg()
+    read = cfg.get('TIMEOUT', 15)
+    return cfg.get('CONNECT_TIMEOUT', min(5, read)), read
+
+
+def soap11_headers(action: str) -> dict:
+    return {
+        "Content-Type": "text/xml; charset=utf-8",
+        "SOAPAction": f"\"http://tempuri.org/{action}\"",
+    }
+
+
+def post(url: str, payload: str | bytes, headers: dict, timeout=None, verify_ssl: bool | None = None,
+         stream: bool = False, operation: str = '-', probe: bool = False) -> requests.Response:
+    """
+    POST через общий пул. timeout по умолчанию — (CONNECT_TIMEOUT, TIMEOUT) из EXTERNAL_AUTH.
+    stream=True — тело не читается сразу; ответ нужно дочитать или закрыть (with r: ...).
+    operation — имя операции для circuit breaker: если он открыт, breaker.BackendUnavailable
+    (подкласс RequestException) без похода в сеть.
+    probe=True — проба SOAP-диалекта, после которой есть другие варианты: ответ с ошибочным
+    статусом breaker не засчитывает (сетевые ошибки и таймауты — засчитывает).
+    """
+    kwargs = {
+        "data": payload if isinstance(payload, bytes) else payload.encode('utf-8'),
+        "headers": headers,
+        "timeout": timeouts() if timeout is None else timeout,
+        "stream": stream,
+    }
+    if verify_ssl is not None:
+        kwargs["verify"] = verify_ssl
+    b = breaker.acquire(operation, url)
+    started = time.monotonic()
+    ok = False
+    status = 'error'
+    try:
+        r = get_session().post(url, **kwargs)
+        ok = not breaker.is_failure_status(r.status_code)
+        status = r.status_code
+        if not stream:
+            metrics.BACKEND_BYTES.observe(len(r.content), operation)
+        return r
+    finally:
+        seconds = time.monotonic() - started
+        if probe and status != 'error' and not ok:
+            breaker.release(b)
+        else:
+            breaker.record(b, ok, seconds)
+        metrics.BACKEND_SECONDS.observe(seconds, operation, status)
+
+
+def not_sent(e: requests.RequestException) -> bool:
+    """
+    Запрос точно не дошёл до сервера: соединение не установлено (после повторов urllib3).
+    Таймаут чтения или обрыв ответа — не то: сервер мог уже выполнить операцию.
+    """
+    if isinstance(e, requests.ConnectTimeout):
+        return True
+    reason = getattr(e.args[0], 'reason', None) if e.args else None
+    return isinstance(e, requests.ConnectionError) and isinstance(reason, ConnectTimeoutError)
+
+
+def soap11_call(action: str, payload: str | bytes, parse, headers: dict | None = None,
+                stream: bool = False) -> dict:
+    """
+    Типовой SOAP 1.1 вызов: POST на EXTERNAL_AUTH['URL'], сетевая ошибка → http_error,
+    открытый breaker → backend_unavailable, иначе parse(response) -> dict.
+    При stream=True parse читает тело сам (ошибка чтения — тоже http_error).
+    """
+    try:
+        with post(_cfg()['URL'], payload, headers or soap11_headers(action), stream=stream, operation=action) as r:
+            result = timed_parse(action, parse, r)
+            if stream:
+                metrics.BACKEND_BYTES.observe(r.raw.tell(), action)
+    except breaker.BackendUnavailable:
+        logger.warning("%s skipped: backend_unavailable", action)
+        result = {"ok": False, "error": "backend_unavailable"}
+    except requests.RequestException as e:
+        logger.exception("HTTP error during %s", action)
+        result = {"ok": False, "error": f"http_error: {e}"}
+    metrics.count_result(action, result)
+    return result
+
+
+def timed_parse(operation: str, parse, *args):
+    """parse(*args) с записью времени в cabinet_backend_parse_seconds."""
+    started = time.perf_counter()
+    try:
+        return parse(*args)
+    finally:
+        metrics.PARSE_SECONDS.observe(time.perf_counter() - started, operation)
+
+
+def pool_stats() -> dict:
+    """
+    Состояние пула для подбора POOL_SIZE:
+    connections_opened — сколько соединений открыто за жизнь пула,
+    requests — сколько запросов через него прошло, idle — сколько сейчас свободно.
+    """
+    s = _session
+    out = {"pool_size": int(_cfg().get('POOL_SIZE', 10)), "pools": []}
+    if s is None:
+        return out
+
+    seen = set()
+    for adapter in s.adapters.values():
+        if id(adapter) in seen:
+            continue
+        seen.add(id(adapter))
+        manager = adapter.poolmanager
+        for key in manager.pools.keys():
+            pool = manager.pools.get(key)
+            if pool is None:
+                continue
+            queue = getattr(pool.pool, 'queue', None) or ()
+            idle = sum(1 for conn in list(queue) if conn is not None)
+            opened = pool.num_connections
+            served = pool.num_requests
+            out["pools"].append({
+                "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+                "maxsize": pool.pool.maxsize if pool.pool is not None else 0,
+                "connections_opened": opened,
+                "requests": served,
+                "idle": idle,
+                "reuse_ratio": round(1 - opened / served, 3) if served else 0.0,
+            })
+    return out
@@ -22,14 +22,22 @@ urlpatterns = [
     # API
     path('api/policies', views.api_policies, name='api_policies'),
     path('api/policy-info', views.api_policy_info, name='api_policy_info'),
+    path('api/policy-info/batch', views.api_policy_info_batch, name='api_policy_info_batch'),
     path('api/specialities', views.api_specialities, name='api_specialities'),
     path('api/doctors/<speciality_id>', views.api_doctors_by_speciality, name='api_doctors_by_speciality'),
+    path('api/doctor-photo/<speciality_id>/<doctor_id>/<photo_hash>.jpg', views.api_doctor_photo, name='api_doctor_photo'),
+    path('api/doctor/<doctor_id>', views.api_doctor, name='api_doctor'),
     path('api/doctor-career/<doctor_id>', views.api_doctor_career, name='api_doctor_career'),
     path('api/medical-complaints', views.api_medical_complaints, name='api_medical_complaints'),
     path('api/non-medical-complaints', views.api_non_medical_complaints, name='api_non_medical_complaints'),
+    path('api/dashboard', views.api_dashboard, name='api_dashboard'),
     path('captcha.png', views.captcha_image, name='captcha_image'),
     path('api/active-med-policies', views.api_active_med_policies, name='api_active_med_policies'),
     path('api/register-doctor', views.api_register_doctor, name='api_register_doctor'),
 
+    # служебное
+    path('internal/backend-status', views.backend_status, name='backend_status'),
+    path('internal/metrics', views.prometheus_metrics, name='metrics'),
+
     
 ]
@@ -0,0 +1,177 @@
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.crypto import salted_hmac
+
+from .complaint_not_service import get_non_medical_complaints
+from .complaint_service import get_medical_claim_informations
+from .fanout import get_executor
+from .policy_service import get_customer_policies
+
+logger = logging.getLogger('cabinet.auth')
+
+
+# Короткоживущий кэш персональных данных (список полисов и т.п.) в кэше Django.
+# Ключ — HMAC от (ключ сессии, PIN): PIN в ключах кэша не светится, а запись
+# доступна только той сессии, в которой пользователь вошёл. После logout
+# (flush меняет ключ сессии) старые записи недостижимы, но мы их ещё и удаляем.
+#
+# Сразу после OTP prefetch() в фоне (общий пул fanout) загружает все разделы, чтобы
+# первый клик по разделу не ждал SOAP. Одновременно — не больше PREFETCH_MAX_CONCURRENT
+# загрузок на процесс, остальные ждут своей очереди (prefetch_queued), а не пропускаются.
+# В кэше лежит (значение, загружено_prefetch'ем); prefetch_used — сколько таких записей
+# потом действительно прочитали (один раз на запись).
+
+PREFETCH = (
+    ('policies', get_customer_policies),
+    ('medical_complaints', get_medical_claim_informations),
+    ('non_medical_complaints', get_non_medical_complaints),
+)
+SECTIONS = tuple(section for section, _ in PREFETCH)
+
+_lock = threading.Lock()
+_slot_free = threading.Condition(_lock)
+_running = 0
+_counters = dict.fromkeys(
+    ('hits', 'misses', 'prefetched', 'prefetch_used', 'prefetch_queued', 'prefetch_errors'), 0
+)
+
+
+def _cfg() -> dict:
+    return getattr(settings, 'USER_CACHE', {})
+
+
+def _ttl() -> int:
+    return int(_cfg().get('TTL', 60))
+
+
+def _count(name: str) -> None:
+    with _lock:
+        _counters[name] += 1
+
+
+def _key(request, section: str, pin: str) -> str | None:
+    session_key = request.session.session_key
+    if not (session_key and pin):
+        return None
+    digest = salted_hmac('cabinet.user_cache', f"{session_key}:{pin}").hexdigest()
+    return f"cabinet:user:{section}:{digest}"
+
+
+def _unpack(entry):
+    # записи старого формата (просто dict) — как обычные
+    if isinstance(entry, tuple):
+        return entry
+    return entry, False
+
+
+def get_or_fetch(request, section: str, fetch, pin: str) -> dict:
+    """fetch(pin) -> {"ok": ..., ...}; кэшируем только ok=True."""
+    key = _key(request, section, pin)
+    if key is None:
+        return fetch(pin)
+    entry = cache.get(key)
+    if entry is not None:
+        value, prefetched = _unpack(entry)
+        if prefetched and cache.add(f"{key}:used", 1, _ttl()):
+            _count('prefetch_used')
+        _count('hits')
+        return value
+    _count('misses')
+    value = fetch(pin)
+    if value.get('ok'):
+        cache.set(key, (value, False), _ttl())
+    return value
+
+
+def invalidate(request) -> None:
+    pin = request.session.get('pinCode') or ''
+    keys = [_key(request, section, pin) for section in SECTIONS]
+    keys = [k for k in keys if k]
+    if keys:
+        cache.delete_many(keys + [f"{k}:used" for k in keys])
+
+
+async def aget_or_fetch(request, section: str, afetch, pin: str) -> dict:
+    """Async-вариант get_or_fetch: afetch(pin) — корутина."""
+    key = _key(request, section, pin)
+    if key is None:
+        return await afetch(pin)
+    entry = await cache.aget(key)
+    if entry is not None:
+        value, prefetched = _unpack(entry)
+        if prefetched and await cache.aadd(f"{key}:used", 1, _ttl()):
+            _count('prefetch_used')
+        _count('hits')
+        return value
+    _count('misses')
+    value = await afetch(pin)
+    if value.get('ok'):
+        await cache.aset(key, (value, False), _ttl())
+    return value
+
+
+# --- prefetch после входа ---
+
+def prefetch(request, pin: str) -> int:
+    """Ставит фоновую загрузку всех разделов для pin; возвращает, сколько задач поставлено."""
+    if not _cfg().get('PREFETCH', True):
+        return 0
+    executor = get_executor()
+    submitted = 0
+    for section, fetch in PREFETCH:
+        key = _key(request, section, pin)
+        if key is not None:
+            executor.submit(_prefetch_one, key, section, fetch, pin)
+            submitted += 1
+    return submitted
+
+
+def _prefetch_one(key: str, section: str, fetch, pin: str) -> None:
+    global _running
+    with _slot_free:
+        if _running >= int(_cfg().get('PREFETCH_MAX_CONCURRENT', 6)):
+            _counters['prefetch_queued'] += 1
+            while _running >= int(_cfg().get('PREFETCH_MAX_CONCURRENT', 6)):
+                _slot_free.wait()
+        _running += 1
+    try:
+        value = fetch(pin)
+    except Exception:
+        logger.exception("prefetch %s failed", section)
+        value = {"ok": False}
+    finally:
+        with _slot_free:
+            _running -= 1
+            _slot_free.notify()
+
+    if not value.get('ok'):
+        _count('prefetch_errors')
+        return
+    # если раздел уже успели открыть и закэшировать — не перезаписываем
+    if cache.add(key, (value, True), _ttl()):
+        _count('prefetched')
+
+
+def stats() -> dict:
+    with _lock:
+        out = dict(_counters)
+        out['prefetch_running'] = _running
+    lookups = out['hits'] + out['misses']
+    out['hit_ratio'] = round(out['hits'] / lookups, 3) if lookups else 0.0
+    out['prefetch_used_ratio'] = round(out['prefetch_used'] / out['prefetched'], 3) if out['prefetched'] else 0.0
+    return out
+
+
+def _after_fork_in_child() -> None:
+    global _lock, _slot_free, _running
+    _lock = threading.Lock()
+    _slot_free = threading.Condition(_lock)
+    _running = 0
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -1,27 +1,43 @@
-import io, random, string, re
+import asyncio
+import hmac
+import re
+import time
 from django.shortcuts import render, redirect
 from django.utils import timezone
+from django.views.decorators.cache import never_cache
 from django.views.decorators.http import require_http_methods
 from django.contrib import messages
 from django.http import HttpRequest, HttpResponse
-from PIL import Image, ImageDraw, ImageFont, ImageFilter
 
 # твоё уже есть:
 from .services import external_login
 from .otp_service import create_otp_and_send_sms
-from .complaint_service import get_medical_claim_informations  # если используешь
-from .complaint_not_service import get_non_medical_complaints
+from .complaint_service import aget_medical_claim_informations
+from .complaint_not_service import aget_non_medical_complaints
 
-from django.http import JsonResponse
 from django.views.decorators.http import require_GET, require_POST
 
-from .policy_service import get_customer_policies, get_policy_informations
+from .policy_service import (
+    get_customer_policies,
+    get_policy_informations,
+    aget_customer_policies,
+    aget_policy_informations,
+)
 from .doctor_service import (
-    get_specialities,
-    get_doctors_by_speciality,
-    get_doctor_career,   # ← ЭТОГО не хватало
+    aget_specialities,
+    aget_doctors_by_speciality,
+    aget_doctor,
+    aget_doctor_career,
+    aregistration_for_doctor,
+)
+from . import (
+    async_transport, breaker, captcha, json_response, logs, metrics, session_backend, singleflight, throttle, transport, user_cache,
 )
-from .doctor_service import registration_for_doctor 
+from .fanout import afan_out
+from .doctor_photos import find_photo, public_doctor, public_doctors
+from .json_response import ApiJsonResponse
+from .ref_cache import reference_cache
+from django.conf import settings
 
 OTP_TTL_SECONDS = 60
 OTP_MAX_ATTEMPTS = 3
@@ -105,6 +121,8 @@ def login_view(request: HttpRequest):
                     request.session.pop(k, None)
                 # и счётчик логин-попыток
                 request.session['login_attempts'] = 0
+                # пока пользователь смотрит приветствие — грузим разделы в user_cache
+                user_cache.prefetch(request, request.session.get('pinCode') or '')
                 return redirect('cabinet_welcome')
 
             # неверный код
@@ -140,6 +158,14 @@ def login_view(request: HttpRequest):
                 messages.error(request, "CAPTCHA düzgün daxil edilməyib.")
                 return render(request, 'cabinet/login.html', {"need_captcha": True})
 
+        # лимит попыток по IP/PIN/телефону — до любого запроса к бэкенду
+        retry_after = throttle.check(request, pin=pin, phone=phone)
+        if retry_after:
+            messages.error(request, f"Çox sayda cəhd. {retry_after} saniyə sonra yenidən cəhd edin.")
+            response = render(request, 'cabinet/login.html', {"need_captcha": need_captcha}, status=429)
+            response['Retry-After'] = str(retry_after)
+            return response
+
         # Проверка логина на внешнем SOAP (без авторизации)
         result = external_login(pin=pin, policy=policy, phone=phone)
 
@@ -178,6 +204,7 @@ def login_view(request: HttpRequest):
             'invalid_inner_xml'     : 'Serverdən səhv cavab alındı.',
             'unrecognized_response' : 'Serverdən naməlum cavab alındı.',
             'login_failed'          : 'Daxil olmaq alınmadı.',
+            'backend_unavailable'   : 'Xidmət müvəqqəti əlçatan deyil. Bir az sonra yenidən cəhd edin.',
         }
         err = (result.get('error') or 'login_failed').strip()
         messages.error(request, normalize.get(err, err))
@@ -192,6 +219,7 @@ def login_view(request: HttpRequest):
 
 
 def logout_view(request: HttpRequest):
+    user_cache.invalidate(request)
     request.session.flush()
     return redirect('login')
 # --- helpers ---
@@ -206,6 +234,7 @@ def _render_otp(request: HttpRequest, remaining: int):
     })
 
 def _reset_session_to_login(request: HttpRequest):
+    user_cache.invalidate(request)
     for k in ['otp_code', 'otp_pending', 'otp_attempts', 'otp_expires_at',
               'pinCode', 'phoneNumber', 'name', 'surname', 'loggedin']:
         request.session.pop(k, None)
@@ -229,31 +258,53 @@ def welcome(request: HttpRequest):
 def policies(request: HttpRequest):
     if not request.session.get('loggedin'):
         return redirect('login')
+    batch = getattr(settings, 'POLICY_INFO_BATCH', {})
     return render(request, 'cabinet/policies.html', {
         "name": request.session.get('name', ''),
         "surname": request.session.get('surname', ''),
         "active": "policies",
+        "prefetch_batch": int(batch.get('MAX_ITEMS', 50)),
+        "prefetch_limit": int(batch.get('PREFETCH', 10)),
     })
 
+# api_* — async: под ASGI воркер не блокируется на время SOAP-вызова (до TIMEOUT секунд).
+# Сессию читаем через aget(): синхронный доступ к её хранилищу из async-кода запрещён.
+
 @require_GET
-def api_policies(request: HttpRequest):
-    if not request.session.get('loggedin'):
-        return JsonResponse({"error": "unauthorized"}, status=401)
-    pin = request.session.get('pinCode', '')
+async def api_policies(request: HttpRequest):
+    if not await request.session.aget('loggedin'):
+        return ApiJsonResponse({"error": "unauthorized"}, status=401)
+    pin = await request.session.aget('pinCode', '')
     if not pin:
-        return JsonResponse({"error": "no_pin_in_session"}, status=400)
-    result = get_customer_policies(pin)
-    return JsonResponse(result, status=200 if result.get("ok") else 502)
+        return ApiJsonResponse({"error": "no_pin_in_session"}, status=400)
+    result = await user_cache.aget_or_fetch(request, 'policies', aget_customer_policies, pin)
+    return ApiJsonResponse(result, status=200 if result.get("ok") else 502)
 
 @require_POST
-def api_policy_info(request: HttpRequest):
-    if not request.session.get('loggedin'):
-        return JsonResponse({"error": "unauthorized"}, status=401)
+async def api_policy_info(request: HttpRequest):
+    if not await request.session.aget('loggedin'):
+        return ApiJsonResponse({"error": "unauthorized"}, status=401)
     policy_number = (request.POST.get('policyNumber') or '').strip()
     if not policy_number:
-        return JsonResponse({"error": "policy_number_required"}, status=400)
-    result = get_policy_informations(policy_number)
-    return JsonResponse(result, status=200 if result.get("ok") else 502)
+        return ApiJsonResponse({"error": "policy_number_required"}, status=400)
+    result = await aget_policy_informations(policy_number)
+    return ApiJsonResponse(result, status=200 if result.get("ok") else 502)
+
+@require_POST
+async def api_policy_info_batch(request: HttpRequest):
+    # policyNumbers=...&policyNumbers=... → {"ok": True, "results": {номер: ответ get_policy_informations}}
+    if not await request.session.aget('loggedin'):
+        return ApiJsonResponse({"error": "unauthorized"}, status=401)
+    cfg = getattr(settings, 'POLICY_INFO_BATCH', {})
+    numbers = list(dict.fromkeys(
+        n.strip() for n in request.POST.getlist('policyNumbers') if n and n.strip()
+    ))
+    if not numbers:
+        return ApiJsonResponse({"error": "policy_numbers_required"}, status=400)
+    if len(numbers) > int(cfg.get('MAX_ITEMS', 50)):
+        return ApiJsonResponse({"error": "too_many_policy_numbers"}, status=400)
+    results = await afan_out(aget_policy_informations, numbers, limit=int(cfg.get('CONCURRENCY', 6)))
+    return ApiJsonResponse({"ok": True, "results": results})
 
 def policy_detail(request: HttpRequest, policy_number: str):
     if not request.session.get('loggedin'):
@@ -264,14 +315,15 @@ def policy_detail(request: HttpRequest, policy_number: str):
         messages.error(request, f"Polis yüklənmədi: {r.get('error')}")
         return redirect('cabinet_policies')
 
-    d = r.get("data") or {}
+    # копия: r["data"] общий с кэшем и ждущими singleflight, дополняем только свою
+    d = dict(r.get("data") or {})
     code = (d.get("INSURANCE_CODE") or "").strip()
 
     # ← ДОБАВЛЕНО: если код/статус не пришли из detail-метода — добираем из общего списка
     if not code or not d.get("STATUS"):
         pin = request.session.get('pinCode', '')
         if pin:
-            lst = get_customer_policies(pin)
+            lst = user_cache.get_or_fetch(request, 'policies', get_customer_policies, pin)
             if lst.get("ok"):
                 for p in lst.get("policies", []):
                     if (p.get("POLICY_NUMBER") or "").strip() == policy_number:
@@ -317,11 +369,11 @@ def doctors(request: HttpRequest):
     })
 
 @require_GET
-def api_specialities(request: HttpRequest):
-    if not request.session.get('loggedin'):
-        return JsonResponse({"error": "unauthorized"}, status=401)
-    result = get_specialities()
-    return JsonResponse(result, status=200 if result.get("ok") else 502)
+async def api_specialities(request: HttpRequest):
+    if not await request.session.aget('loggedin'):
+        return ApiJsonResponse({"error": "unauthorized"}, status=401)
+    result = await aget_specialities()
+    return ApiJsonResponse(result, status=200 if result.get("ok") else 502)
 
 def doctors_by_speciality(request: HttpRequest, speciality_id: str):
     if not request.session.get('loggedin'):
@@ -334,11 +386,32 @@ def doctors_by_speciality(request: HttpRequest, speciality_id: str):
     })
 
 @require_GET
-def api_doctors_by_speciality(request: HttpRequest, speciality_id: str):
-    if not request.session.get('loggedin'):
-        return JsonResponse({"error": "unauthorized"}, status=401)
-    result = get_doctors_by_speciality(speciality_id)
-    return JsonResponse(result, status=200 if result.get("ok") else 502)
+async def api_doctors_by_speciality(request: HttpRequest, speciality_id: str):
+    if not await request.session.aget('loggedin'):
+        return ApiJsonResponse({"error": "unauthorized"}, status=401)
+    result = await aget_doctors_by_speciality(speciality_id)
+    if result.get("ok"):
+        # без base64-фото: вместо FILE_CONTENT — PHOTO_URL на api_doctor_photo
+        result = {**result, "doctors": public_doctors(result.get("doctors") or [], speciality_id)}
+    return ApiJsonResponse(result, status=200 if result.get("ok") else 502)
+
+@require_GET
+async def api_doctor_photo(request: HttpRequest, speciality_id: str, doctor_id: str, photo_hash: str):
+    if not await request.session.aget('loggedin'):
+        return HttpResponse(status=401)
+    # URL содержит хэш содержимого: совпал If-None-Match — картинка у клиента та же
+    etag = f'"{photo_hash}"'
+    if etag in [t.strip() for t in request.headers.get('If-None-Match', '').split(',')]:
+        resp = HttpResponse(status=304)
+    else:
+        result = await aget_doctors_by_speciality(speciality_id)
+        photo = find_photo(result.get("doctors") or [], doctor_id, photo_hash) if result.get("ok") else None
+        if photo is None:
+            return HttpResponse(status=404)
+        resp = HttpResponse(photo, content_type="image/jpeg")
+    resp['ETag'] = etag
+    resp['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return resp
 
 def doctor_detail(request: HttpRequest, speciality_id: str, doctor_id: str):
     if not request.session.get('loggedin'):
@@ -353,15 +426,36 @@ def doctor_detail(request: HttpRequest, speciality_id: str, doctor_id: str):
 
 
 @require_GET
-def api_doctor_career(request: HttpRequest, doctor_id: str):
-    if not request.session.get('loggedin'):
-        return JsonResponse({"ok": False, "error": "unauthorized"}, status=401)
+async def api_doctor(request: HttpRequest, doctor_id: str):
+    # ?speciality=<id> — подсказка для холодного индекса; ?career=1 — сразу с карьерой
+    if not await request.session.aget('loggedin'):
+        return ApiJsonResponse({"ok": False, "error": "unauthorized"}, status=401)
+    hint = (request.GET.get('speciality') or '').strip()
+    if request.GET.get('career') == '1':
+        found, career = await asyncio.gather(aget_doctor(doctor_id, hint), aget_doctor_career(doctor_id))
+    else:
+        found, career = await aget_doctor(doctor_id, hint), None
+
+    if not found.get("ok"):
+        return ApiJsonResponse(found, status=404 if found.get("error") == "doctor_not_found" else 502)
+
+    out = {"ok": True, "doctor": public_doctor(found["doctor"], found["speciality_id"])}
+    if career is not None:
+        out["career"] = career.get("career") or []
+        if not career.get("ok"):
+            out["career_error"] = career.get("error")
+    return ApiJsonResponse(out)
+
+@require_GET
+async def api_doctor_career(request: HttpRequest, doctor_id: str):
+    if not await request.session.aget('loggedin'):
+        return ApiJsonResponse({"ok": False, "error": "unauthorized"}, status=401)
     try:
-        result = get_doctor_career(doctor_id)
+        result = await aget_doctor_career(doctor_id)
     except Exception as e:
         # не даём упасть до HTML-500
-        return JsonResponse({"ok": False, "error": f"internal_error: {e}"}, status=500)
-    return JsonResponse(result, status=200 if result.get("ok") else 502)
+        return ApiJsonResponse({"ok": False, "error": f"internal_error: {e}"}, status=500)
+    return ApiJsonResponse(result, status=200 if result.get("ok") else 502)
 
 def complaints(request: HttpRequest):
     if not request.session.get('loggedin'):
@@ -373,14 +467,14 @@ def complaints(request: HttpRequest):
     })
 
 @require_GET
-def api_medical_complaints(request: HttpRequest):
-    if not request.session.get('loggedin'):
-        return JsonResponse({"ok": False, "error": "unauthorized"}, status=401)
-    pin = request.session.get('pinCode', '')
+async def api_medical_complaints(request: HttpRequest):
+    if not await request.session.aget('loggedin'):
+        return ApiJsonResponse({"ok": False, "error": "unauthorized"}, status=401)
+    pin = await request.session.aget('pinCode', '')
     if not pin:
-        return JsonResponse({"ok": False, "error": "no_pin_in_session"}, status=400)
-    result = get_medical_claim_informations(pin)
-    return JsonResponse(result, status=200 if result.get("ok") else 502)
+        return ApiJsonResponse({"ok": False, "error": "no_pin_in_session"}, status=400)
+    result = await user_cache.aget_or_fetch(request, 'medical_complaints', aget_medical_claim_informations, pin)
+    return ApiJsonResponse(result, status=200 if result.get("ok") else 502)
 
 def complaints_not_medical(request: HttpRequest):
     # простая защита — пускаем только после логина
@@ -395,81 +489,71 @@ def complaints_not_medical(request: HttpRequest):
     return render(request, 'cabinet/complaints_not_medical.html', ctx)
 
 @require_GET
-def api_non_medical_complaints(request: HttpRequest):
-    if not request.session.get('loggedin'):
-        return JsonResponse({"error": "unauthorized"}, status=401)
-    pin = request.session.get('pinCode', '')
+async def api_non_medical_complaints(request: HttpRequest):
+    if not await request.session.aget('loggedin'):
+        return ApiJsonResponse({"error": "unauthorized"}, status=401)
+    pin = await request.session.aget('pinCode', '')
+    if not pin:
+        return ApiJsonResponse({"error": "no_pin_in_session"}, status=400)
+    r = await user_cache.aget_or_fetch(request, 'non_medical_complaints', aget_non_medical_complaints, pin)
+    return ApiJsonResponse(r, status=200 if r.get("ok") else 502)
+
+# api/dashboard: разделы кабинета одним ответом
+DASHBOARD_SECTIONS = {
+    'policies': aget_customer_policies,
+    'medical_complaints': aget_medical_claim_informations,
+    'non_medical_complaints': aget_non_medical_complaints,
+}
+
+def _ms_since(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
+@require_GET
+async def api_dashboard(request: HttpRequest):
+    # все разделы параллельно (через user_cache): время ответа ~ самый медленный раздел,
+    # а ошибка одного раздела не роняет остальные — у каждого свой ok/error и ms
+    if not await request.session.aget('loggedin'):
+        return ApiJsonResponse({"ok": False, "error": "unauthorized"}, status=401)
+    pin = await request.session.aget('pinCode', '')
     if not pin:
-        return JsonResponse({"error": "no_pin_in_session"}, status=400)
-    r = get_non_medical_complaints(pin)
-    return JsonResponse(r, status=200 if r.get("ok") else 502)
+        return ApiJsonResponse({"ok": False, "error": "no_pin_in_session"}, status=400)
+    started = time.perf_counter()
+
+    async def load(section):
+        t0 = time.perf_counter()
+        result = await user_cache.aget_or_fetch(request, section, DASHBOARD_SECTIONS[section], pin)
+        return {**result, "ms": _ms_since(t0)}
+
+    sections = await afan_out(load, DASHBOARD_SECTIONS, limit=len(DASHBOARD_SECTIONS))
+    ok = [s.get("ok") for s in sections.values()]
+    return ApiJsonResponse(
+        {"ok": all(ok), "sections": sections, "ms": _ms_since(started)},
+        status=200 if any(ok) else 502,
+    )
 
 def refund(request: HttpRequest):
     if not _guard(request): return redirect('login')
     return render(request, 'cabinet/refund.html', _ctx(request, 'refund'))
 
+@never_cache
 def captcha_image(request: HttpRequest):
-    import random, string, io
-    from PIL import Image, ImageDraw, ImageFont, ImageFilter
-    from django.http import HttpResponse
-
-    # создаём код и кладём в сессию
-    code = ''.join(random.choices(string.digits, k=5))
+    # готовая картинка из пула (cabinet/captcha.py), код — в сессию
+    code, png = captcha.take()
     request.session['captcha_code'] = code
-
-    # размеры
-    W, H = 130, 46
-    img = Image.new('RGB', (W, H), (255, 255, 255))
-    draw = ImageDraw.Draw(img)
-
-    # выбираем шрифт
-    try:
-        font = ImageFont.truetype("arial.ttf", 28)
-    except Exception:
-        font = ImageFont.load_default()
-
-    # --- шум: точки + линии ---
-    for _ in range(180):
-        x = random.randint(0, W)
-        y = random.randint(0, H)
-        draw.point((x, y), fill=(random.randint(100, 200), random.randint(100, 200), random.randint(100, 200)))
-
-    # тонкие линии фона
-    for _ in range(5):
-        x1, y1 = random.randint(0, W), random.randint(0, H)
-        x2, y2 = random.randint(0, W), random.randint(0, H)
-        color = (random.randint(100, 180), random.randint(100, 180), random.randint(100, 180))
-        draw.line(((x1, y1), (x2, y2)), fill=color, width=random.randint(1, 2))
-
-    # --- текст (слегка случайное положение каждой цифры) ---
-    start_x = 15
-    for ch in code:
-        offset_y = random.randint(-4, 4)
-        draw.text((start_x, 10 + offset_y), ch, font=font, fill=(random.randint(0, 60),)*3)
-        start_x += 22
-
-    # лёгкое размытие и искажения
-    img = img.filter(ImageFilter.SMOOTH_MORE)
-    img = img.filter(ImageFilter.GaussianBlur(radius=0.4))
-
-    # отдаём
-    buf = io.BytesIO()
-    img.save(buf, format='PNG')
-    buf.seek(0)
-    return HttpResponse(buf.getvalue(), content_type="image/png")
+    return HttpResponse(png, content_type="image/png")
 
 
 @require_GET
-def api_active_med_policies(request: HttpRequest):
-    if not request.session.get('loggedin'):
-        return JsonResponse({"ok": False, "error": "unauthorized"}, status=401)
-    pin = request.session.get('pinCode') or ''
+async def api_active_med_policies(request: HttpRequest):
+    if not await request.session.aget('loggedin'):
+        return ApiJsonResponse({"ok": False, "error": "unauthorized"}, status=401)
+    pin = await request.session.aget('pinCode') or ''
     if not pin:
-        return JsonResponse({"ok": False, "error": "no_pin_in_session"}, status=400)
+        return ApiJsonResponse({"ok": False, "error": "no_pin_in_session"}, status=400)
 
-    r = get_customer_policies(pin)
+    r = await user_cache.aget_or_fetch(request, 'policies', aget_customer_policies, pin)
     if not r.get("ok"):
-        return JsonResponse({"ok": False, "error": r.get("error") or "policies_failed"}, status=502)
+        return ApiJsonResponse({"ok": False, "error": r.get("error") or "policies_failed"}, status=502)
 
     items = r.get("policies") or []
     out = []
@@ -491,24 +575,59 @@ def api_active_med_policies(request: HttpRequest):
                 "program": it.get("PROGRAM_NAME") or "",
                 "start": (it.get("INSURANCE_START_DATE") or "")[:10],
             })
-    return JsonResponse({"ok": True, "policies": out}, status=200)
+    return ApiJsonResponse({"ok": True, "policies": out}, status=200)
 
 @require_POST
-def api_register_doctor(request: HttpRequest):
-    if not request.session.get('loggedin'):
-        return JsonResponse({"ok": False, "error": "unauthorized"}, status=401)
+async def api_register_doctor(request: HttpRequest):
+    if not await request.session.aget('loggedin'):
+        return ApiJsonResponse({"ok": False, "error": "unauthorized"}, status=401)
 
-    pin   = request.session.get('pinCode') or ''
+    pin   = await request.session.aget('pinCode') or ''
     card  = (request.POST.get('cardNumber') or '').strip()
     docid = (request.POST.get('doctorId') or '').strip()
 
     if not (pin and card and docid):
-        return JsonResponse({"ok": False, "error": "missing_params"}, status=400)
-
-    res = registration_for_doctor(pin, card, docid)
-    return JsonResponse(res, status=200 if res.get("ok") else 502)
+        return ApiJsonResponse({"ok": False, "error": "missing_params"}, status=400)
 
+    res = await aregistration_for_doctor(pin, card, docid)
+    return ApiJsonResponse(res, status=200 if res.get("ok") else 502)
 
 
+# --- служебное: только с INTERNAL_IPS, не через прокси, с INTERNAL_ENDPOINTS['TOKEN'] ---
+def _is_internal(request: HttpRequest) -> bool:
+    # за обратным прокси REMOTE_ADDR у любого запроса из интернета — адрес прокси (127.0.0.1),
+    # поэтому запрос, который прокси пометил своим заголовком, служебным не считаем
+    cfg = getattr(settings, 'INTERNAL_ENDPOINTS', {})
+    if any(request.META.get(h) for h in cfg.get('FORWARDED_HEADERS', ())):
+        return False
+    if request.META.get('REMOTE_ADDR') not in settings.INTERNAL_IPS:
+        return False
+    token = cfg.get('TOKEN')
+    if not token:
+        return True
+    sent = request.META.get('HTTP_AUTHORIZATION', '').removeprefix('Bearer ').strip()
+    return hmac.compare_digest(sent.encode('utf-8'), token.encode('utf-8'))
 
+@require_GET
+def backend_status(request: HttpRequest):
+    if not _is_internal(request):
+        return ApiJsonResponse({"error": "forbidden"}, status=403)
+    return ApiJsonResponse({
+        "pool": transport.pool_stats(),
+        "async_pool": async_transport.pool_stats(),
+        "reference_cache": reference_cache.stats(),
+        "api_responses": json_response.stats(),
+        "captcha_pool": captcha.pool.stats(),
+        "circuit_breakers": breaker.stats(),
+        "single_flight": singleflight.stats(),
+        "user_cache": user_cache.stats(),
+        "sessions": session_backend.stats(),
+        "login_throttle": throttle.stats(),
+        "logging": logs.stats(),
+    })
 
+@require_GET
+def prometheus_metrics(request: HttpRequest):
+    if not _is_internal(request):
+        return HttpResponse("forbidden", status=403, content_type='text/plain')
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'personal_cabinet.settings')
 
 application = get_asgi_application()
+
+# Под ASGI event loop живёт весь процесс — async-сервисы ходят в SOAP через пул httpx
+from cabinet import async_transport  # noqa: E402
+
+async_transport.enable()
@@ -31,7 +31,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'cabinet.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'cabinet.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -71,6 +73,47 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    # справочники, user_cache — свои в каждом воркере
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # сессии должны быть общими для всех воркеров: файлы на локальном диске
+    # (на нескольких серверах — django.core.cache.backends.redis.RedisCache без maxmemory-вытеснения).
+    # Штатный FileBasedCache на MAX_ENTRIES удаляет случайную треть файлов, т.е. разлогинивает
+    # живых; SessionFileCache удаляет только истёкшие. MAX_ENTRIES — с запасом над числом
+    # живых сессий за SESSION_COOKIE_AGE: до него файлы не перебираются вовсе
+    'sessions': {
+        'BACKEND': 'cabinet.session_backend.SessionFileCache',
+        'LOCATION': BASE_DIR / 'cache' / 'sessions',
+        'TIMEOUT': None,  # срок задаёт сама сессия (SESSION_COOKIE_AGE)
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'CULL_INTERVAL': 60,  # секунд между проходами по файлам, пока их больше MAX_ENTRIES
+        },
+    },
+    # счётчики LOGIN_THROTTLE — тоже общие для воркеров (на нескольких серверах — Redis)
+    'throttle': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'throttle',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    # рабочие диалекты SOAP (cabinet/soap_dialect.py): общие для воркеров и переживают
+    # их перезапуск, иначе каждый новый воркер заново перебирает варианты Login/OTP
+    'dialects': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'dialects',
+    },
+}
+
+# сессии в кэше вместо SQLite, запись только при изменении (cabinet/session_backend.py)
+SESSION_ENGINE = 'cabinet.session_backend'
+SESSION_CACHE_ALIAS = 'sessions'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -117,8 +160,122 @@ EXTERNAL_AUTH = {
     'URL': 'https://insure.a-group.az/InsureAzSvcTest/AQroupMobileIntegrationSvc.asmx',
     'USERNAME': 'AQWeb',  # системный логин
     'PASSWORD': 'uT&aXtx_ID_!9))',  # системный пароль (как у тебя в примере)
-    'TIMEOUT': 15,  # секунд
+    'TIMEOUT': 15,  # секунд, таймаут чтения
+    'CONNECT_TIMEOUT': 5,  # секунд, таймаут установки соединения
     'VERIFY_SSL': False,  # при проблемах с сертификатами временно False (на свой страх и риск)
+    'POOL_SIZE': 10,  # keep-alive соединений на воркер (см. internal/backend-status)
+    'RETRIES': 2,  # повторы только при ошибках соединения
+    'DIALECT_TTL': 3600,  # секунд, сколько помним рабочий вариант SOAP для операции
+    'DIALECT_CACHE': 'dialects',  # алиас CACHES, где он хранится
+    'ASYNC_INLINE_PARSE_BYTES': 65536,  # ответ больше — async-сервисы разбирают его в потоке
+}
+
+# circuit breaker на (операцию, URL) бэкенда (cabinet/breaker.py)
+CIRCUIT_BREAKER = {
+    'ENABLED': True,
+    'WINDOW': 30,  # секунд истории вызовов для расчёта долей
+    'MIN_CALLS': 10,  # меньше вызовов в окне — не открываем
+    'ERROR_RATE': 0.5,  # доля ошибок (сеть, таймаут, 5xx), при которой открываем
+    'SLOW_CALL_SECONDS': 5,  # вызов дольше — медленный
+    'SLOW_RATE': 0.8,  # доля медленных, при которой открываем
+    'OPEN_SECONDS': 20,  # сколько отвечаем backend_unavailable без похода в сеть
+    'HALF_OPEN_CALLS': 1,  # пробных вызовов после OPEN_SECONDS
+}
+
+# объединение одинаковых одновременных вызовов бэкенда (cabinet/singleflight.py)
+SINGLE_FLIGHT = {
+    'ENABLED': True,
+}
+
+# лимит попыток входа до запроса Login (cabinet/throttle.py): сверх лимита — 429
+LOGIN_THROTTLE = {
+    'ENABLED': True,
+    'CACHE': 'throttle',
+    # scope: (попыток, за сколько секунд) — скользящее окно
+    'LIMITS': {
+        'ip': (20, 60),
+        'pin': (5, 300),
+        'phone': (5, 300),
+    },
+    # за обратным прокси REMOTE_ADDR у всех — адрес прокси: IP клиента берём из заголовка,
+    # который прокси дописывает (последний адрес в списке), например 'HTTP_X_FORWARDED_FOR'.
+    # Заголовку верим только от адресов TRUSTED_PROXIES; без прокси — None
+    'TRUSTED_PROXY_HEADER': None,
+    'TRUSTED_PROXIES': ('127.0.0.1', '::1'),
+}
+
+# кэш справочников врачей (cabinet/ref_cache.py), секунды
+REFERENCE_CACHE = {
+    'MAX_ENTRIES': 128,
+    'TTL': {
+        'GetSpecialities': 3600,
+        'GetDoctorsBySpecialtiy': 900,
+        'GetDoctorCareer': 3600,
+    },
+    'STALE_WHILE_REVALIDATE': 600,  # после TTL отдаём старое и обновляем в фоне
+    'STALE_IF_ERROR': 86400,  # при ошибке бэкенда отдаём старое до этого срока
+}
+
+# кэш персональных данных в рамках сессии (cabinet/user_cache.py), секунды
+USER_CACHE = {
+    'TTL': 60,
+    'PREFETCH': True,  # после OTP грузить полисы и обращения в фоне
+    'PREFETCH_MAX_CONCURRENT': 6,  # одновременных фоновых загрузок на процесс
+}
+
+# общий пул потоков для параллельных вызовов бэкенда (cabinet/fanout.py)
+FANOUT = {
+    'MAX_WORKERS': 16,
+}
+
+# api/policy-info/batch
+POLICY_INFO_BATCH = {
+    'MAX_ITEMS': 50,  # номеров в одном запросе
+    'CONCURRENCY': 6,  # одновременных GetPolicyInformations на запрос
+    'PREFETCH': 10,  # сколько видимых строк policies.html подгружает заранее
+}
+
+# JSON-ответы api_* (cabinet/json_response.py, cabinet/middleware.py)
+API_RESPONSES = {
+    'SERIALIZER': 'auto',  # 'auto' (orjson, если установлен), 'orjson' или 'stdlib'
+    'COMPRESS_TYPES': ('application/json',),
+    'COMPRESS_MIN_BYTES': 1024,  # меньше — не сжимаем, выигрыш меньше заголовков
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 4,  # 4–5: почти как gzip -9 по размеру, но быстрее
+}
+
+# капча на логине (cabinet/captcha.py): пул заранее нарисованных картинок на воркер
+CAPTCHA = {
+    'POOL_SIZE': 64,  # 0 — без пула, рисуем на запрос
+    'REFILL_PER_SECOND': 20,  # скорость фонового дорисовывания
+    'FONT': 'arial.ttf',
+    'FONT_SIZE': 28,
+    'RENDERER': 'pil',  # 'numpy' — векторный рендер (нужен numpy), ~2x быстрее
+    # только для 'numpy': размер картинки и амплитуда искажения строк, px
+    'WIDTH': 130,
+    'HEIGHT': 46,
+    'WARP': 0,
+}
+
+# логи cabinet.auth через очередь и фоновый поток (cabinet/logs.py)
+LOG_PIPELINE = {
+    'QUEUE': True,  # False — обработчики LOGGING пишут прямо из потока запроса
+    'LOGGERS': ('cabinet.auth',),
+    'QUEUE_SIZE': 10000,  # записей; при переполнении новые отбрасываются (счётчик dropped)
+    'LISTENER_BATCH': 32,  # записей на один write/flush слушателя; между пачками он отдаёт GIL
+    'BODIES_PER_MINUTE': 10,  # тел ответов бэкенда в лог на операцию, остальные — только счётчик
+}
+
+# адреса, с которых доступны служебные эндпоинты (internal/...)
+INTERNAL_IPS = ['127.0.0.1', '::1']
+
+# служебные эндпоинты за обратным прокси (cabinet/views.py: _is_internal)
+INTERNAL_ENDPOINTS = {
+    # запрос с любым из этих заголовков пришёл через прокси, т.е. из интернета — 403;
+    # прокси должен выставлять хотя бы один из них
+    'FORWARDED_HEADERS': ('HTTP_X_FORWARDED_FOR', 'HTTP_X_REAL_IP', 'HTTP_FORWARDED'),
+    # если задан — ещё и "Authorization: Bearer <TOKEN>" (bearer_token в scrape_config Prometheus)
+    'TOKEN': None,
 }
 
 